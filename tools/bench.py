@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Hot-path benchmarks for the hardware tools, with committed budgets.
+
+Every benchmark runs against a software stand-in, so it needs neither
+the tablet nor root: the touch tools talk to hx_emulator's HxDevice
+through EmulatedSpiBus/EmulatedI2C, the recovery sequence gets a GPIO
+and sysfs stand-in wired to the same device, the touchpad activation a
+sysfs/dev tree of the keyboard cover, and the WiFi/Bluetooth parsers
+get synthetic board-2.bin and NVM images.
+
+  load_firmware   full load_firmware() of a synthetic image over I2C
+  load_plan       the same load through a precompiled hx_loadplan plan
+  write_sram      HX83121A_I2C.write_sram() of a 64 KiB block
+  snap            hx_wakeup_matrix.snap() (9 AHB reads + cmd 0x30)
+  poll30          cmd 0x30 polling with a prebuilt SpiBatch
+  recovery        hx83121a.recovery.recover_touch() incl. Boot ROM poll
+  touchpad        huawei-tp-activate's precheck of an active cover
+                  (gpio-keys lookup, device scan, descriptor parse,
+                  bounded Input Mode read)
+  board_index     patch_board.index_board() on a ~6 MiB board-2.bin
+  nvm_index       qca_nvm.index_tags() on a 4000-tag NVM
+
+Sequence delays (DELAYS in the loader and the recovery module) are set
+to zero, so wall time is the host-side cost of a run, not the chip's
+settle times. Each benchmark reports the best wall time of --repeat
+runs, the ioctls one run issues (stand-in buses count them), the
+tracemalloc peak of one extra run, and a rate where one makes sense.
+
+Wall time is budgeted as wall_cal: the best wall time divided by the
+best time of a fixed pure-Python calibration loop run between the
+timed runs, so the budgets hold on a faster or slower (or busier) host
+than the one that recorded them. wall_ms is printed for reference.
+
+bench_budgets.json holds the budgets; any metric above its budget makes
+the run fail. --write-budgets records the current measurements plus
+headroom after an intentional change.
+
+Usage:
+  bench.py                      # all benchmarks, check budgets
+  bench.py snap poll30 -r 20
+  bench.py --write-budgets
+"""
+
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for sub in ("touchscreen", "wifi", "bluetooth"):
+    sys.path.insert(0, os.path.join(HERE, sub))
+
+BUDGET_FILE = os.path.join(HERE, "bench_budgets.json")
+TOUCHPAD_SCRIPT = os.path.join(HERE, "touchpad", "huawei-tp-activate.py")
+
+# --write-budgets headroom per metric. Calibrated wall time still varies
+# between runs; ioctl counts are deterministic, so any increase fails.
+HEADROOM = {"wall_cal": 2.0, "ioctls": 1.0, "peak_kib": 1.25}
+
+
+# === Synthetic inputs ===
+
+# Code partitions as in the CSOT image (docs/TOUCHSCREEN.md), plus a few
+# config partitions placed after the partition table.
+FW_PARTITIONS = [
+    (0x00000400, 8192, 0x00000400),
+    (0x00002400, 109056, 0x00002400),
+    (0x0001CE00, 5376, 0x0001CE00),
+    (0x0001E300, 5376, 0x0001E300),
+    (0x0001F800, 1024, 0x0001F800),
+    (0x10007000, 256, 0x00020200),
+    (0x10007100, 256, 0x00020300),
+    (0x10007300, 128, 0x00020400),
+]
+
+
+def synthetic_firmware(seed=0):
+    import load_firmware_i2c
+
+    rng = random.Random(seed)
+    fw = bytearray(rng.randbytes(0x20480))
+    off = load_firmware_i2c.FW_PARTITION_TABLE_OFFSET
+    for sram, size, fw_off in FW_PARTITIONS:
+        struct.pack_into("<IIII", fw, off, sram, size, fw_off, 0)
+        off += 16
+    struct.pack_into("<IIII", fw, off, 0xFFFFFFFF, 0, 0, 0)
+    return bytes(fw)
+
+
+def synthetic_board(n_entries=600, seed=0):
+    from patch_board import MAGIC, PREFIX, SRC_KEY, align4, build_board_entry, make_ie
+
+    rng = random.Random(seed)
+    parts = [MAGIC + bytes(align4(len(MAGIC) + 1) - len(MAGIC))]
+    for i in range(n_entries):
+        key = PREFIX + f"qmi-chip-id={i % 32},qmi-board-id={i},variant=V{i}"
+        parts.append(build_board_entry(key, rng.randbytes(8192 + i % 61)))
+    parts.append(build_board_entry(SRC_KEY, rng.randbytes(65536 + 3)))
+    parts.append(make_ie(1, make_ie(0, b"regdb") + make_ie(1, rng.randbytes(4096))))
+    return b"".join(parts)
+
+
+def synthetic_nvm(n_tags=4000, seed=0):
+    from qca_nvm import TLV_TYPE_NVM
+
+    rng = random.Random(seed)
+    body = b"".join(
+        struct.pack("<HHII", i, n, 0, 0) + rng.randbytes(n)
+        for i, n in ((i, 1 + i % 32) for i in range(n_tags))
+    )
+    return struct.pack("<I", TLV_TYPE_NVM | len(body) << 8) + body
+
+
+# === Stand-ins ===
+
+class GpioStandIn:
+    """TLMM registers for recovery.mmio_rw(); releasing GPIO 99 boots the device.
+
+    Releasing the reset (IO 0x00 -> 0x02) resets the HxDevice and leaves
+    it in status 0x05, as the Boot ROM does after loading from flash.
+    """
+
+    def __init__(self, device, gpio99_io):
+        self.device = device
+        self.gpio99_io = gpio99_io
+        self.regs = {}
+
+    def mmio_rw(self, addr, val=None):
+        if val is not None:
+            if addr == self.gpio99_io and val & 0x02 and not self.regs.get(addr, 0) & 0x02:
+                self.device.reset()
+                self.device.status = 0x05
+            self.regs[addr] = val
+        return self.regs.get(addr, 0)
+
+
+class TouchpadStandIn:
+    """sysfs and /dev of the keyboard cover for huawei-tp-activate.
+
+    A gpio-keys and a second input device, a few USB devices ahead of
+    the cover, and the cover's HID interface with a report descriptor
+    holding the Input Mode feature. ioctl() answers EVIOCGSW with tablet
+    mode off and HIDIOCGFEATURE with Input Mode 3.
+    """
+
+    # Digitizer touchpad: five finger collections, then the Input Mode
+    # feature (report 3) in a Device Configuration collection.
+    FINGER = bytes([
+        0x09, 0x22, 0xA1, 0x02,                          # Finger, Collection (Logical)
+        0x09, 0x42, 0x15, 0x00, 0x25, 0x01, 0x75, 0x01,  # Tip Switch
+        0x95, 0x01, 0x81, 0x02, 0x95, 0x07, 0x81, 0x03,  # + 7 bits padding
+        0x09, 0x51, 0x25, 0x0F, 0x75, 0x08, 0x95, 0x01,  # Contact ID
+        0x81, 0x02, 0x05, 0x01, 0x26, 0x00, 0x05, 0x75,  # X, Y
+        0x10, 0x95, 0x02, 0x09, 0x30, 0x09, 0x31, 0x81,
+        0x02, 0x05, 0x0D, 0xC0,
+    ])
+    DESCRIPTOR = (
+        bytes([0x05, 0x0D, 0x09, 0x05, 0xA1, 0x01, 0x85, 0x01])  # Touch Pad, report 1
+        + FINGER * 5
+        + bytes([0xC0, 0x09, 0x0E, 0xA1, 0x01, 0x85, 0x03,  # Device Configuration, report 3
+                 0x09, 0x52, 0x15, 0x00, 0x25, 0x0A, 0x75, 0x08,  # Input Mode
+                 0x95, 0x01, 0xB1, 0x02, 0xC0])
+    )
+
+    def __init__(self, tp):
+        self.tp = tp
+        root = tempfile.mkdtemp(prefix="hx-bench-tp-")
+        atexit.register(shutil.rmtree, root, True)
+        tp.SYSFS, tp.DEVFS = os.path.join(root, "sys"), os.path.join(root, "dev")
+        for i, name in enumerate(("Power Button", "gpio-keys")):
+            self.write(f"{tp.SYSFS}/class/input/event{i}/device/name", name + "\n")
+            self.write(f"{tp.DEVFS}/input/event{i}", "")
+        for n, (vid, pid) in enumerate(((0x1d6b, 0x0002), (0x05c6, 0x9091), (tp.VENDOR, tp.PRODUCT)), 1):
+            dev = f"{tp.SYSFS}/bus/usb/devices/1-{n}"
+            for attr, v in (("idVendor", f"{vid:04x}"), ("idProduct", f"{pid:04x}"), ("busnum", "1"), ("devnum", n)):
+                self.write(f"{dev}/{attr}", f"{v}\n")
+            os.makedirs(f"{dev}:1.0", exist_ok=True)
+        hid = f"{tp.SYSFS}/bus/usb/devices/1-3:1.0/0003:12D1:10B8.0001"
+        self.write(f"{hid}/report_descriptor", self.DESCRIPTOR)
+        os.makedirs(f"{hid}/hidraw/hidraw0")
+        self.write(f"{tp.DEVFS}/hidraw0", "")
+        self.mode_offset = tp.find_input_mode(self.DESCRIPTOR)[1]
+
+    @staticmethod
+    def write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+
+    def ioctl(self, fd, request, buf, mutate=True):
+        if request & 0xFFFF == 0x4807:  # HIDIOCGFEATURE
+            buf[self.mode_offset] = self.tp.INPUT_MODE_TOUCHPAD
+            return len(buf)
+        buf[:] = bytes(len(buf))  # EVIOCGSW: no switch set
+        return 0
+
+
+# === Benchmarks ===
+# Each returns a run() callable; run() does one iteration and returns
+# its counters: ioctls, and bytes or ops for the rate column.
+
+def zero_delays(delays):
+    for k in delays:
+        delays[k] = 0.0
+
+
+def bench_load_firmware():
+    import load_firmware_i2c
+    from hx_emulator import EmulatedI2C
+
+    zero_delays(load_firmware_i2c.DELAYS)
+    fw = synthetic_firmware()
+
+    def run():
+        dev = EmulatedI2C()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ok = load_firmware_i2c.load_firmware(dev, fw, {})
+        if not ok:
+            raise RuntimeError("load_firmware failed on the stand-in")
+        return {"ioctls": dev.ioctls, "bytes": sum(p[1] for p in FW_PARTITIONS)}
+
+    return run
+
+
+def bench_load_plan():
+    import hx_loadplan
+    import load_firmware_i2c
+    from hx_emulator import EmulatedI2C
+
+    zero_delays(load_firmware_i2c.DELAYS)
+    fw = synthetic_firmware()
+    # what a cache hit costs: the plan read back from its serialized form
+    plan = hx_loadplan.loads(hx_loadplan.dumps(hx_loadplan.compile_plan(fw)))
+
+    def run():
+        dev = EmulatedI2C()
+        ok, _ = hx_loadplan.run(dev, plan, load_firmware_i2c.DELAYS, log=lambda s: None)
+        if not ok:
+            raise RuntimeError("load plan failed on the stand-in")
+        return {"ioctls": dev.ioctls, "bytes": sum(p[1] for p in FW_PARTITIONS)}
+
+    return run
+
+
+def bench_write_sram():
+    from hx_emulator import EmulatedI2C
+
+    data = random.Random(0).randbytes(64 * 1024)
+
+    def run():
+        dev = EmulatedI2C()
+        with contextlib.redirect_stdout(io.StringIO()):
+            dev.write_sram(0x08000400, data)
+        return {"ioctls": dev.ioctls, "bytes": len(data)}
+
+    return run
+
+
+def bench_snap(n=200, frame_len=512):
+    from hx_emulator import EmulatedSpiBus
+    from hx_wakeup_matrix import snap
+
+    bus = EmulatedSpiBus()
+
+    def run():
+        start = bus.ioctls
+        for _ in range(n):
+            snap(bus, frame_len)
+        return {"ioctls": bus.ioctls - start, "ops": n}
+
+    return run
+
+
+def bench_poll30(n=5000, nbytes=512):
+    from hx83121a.regs import REG_EVENT, SPI_READ
+    from hx83121a.spi import SpiBatch
+    from hx_emulator import EmulatedSpiBus
+
+    bus = EmulatedSpiBus()
+    bus.device.event_frame = bytes(range(256)) * 2
+    read30 = SpiBatch([bytes([SPI_READ, REG_EVENT, 0x00]) + bytes(nbytes)], bus.speed)
+
+    def run():
+        start = bus.ioctls
+        for _ in range(n):
+            bus.xfer_many(read30)
+            any(bytes(read30.rx[0])[3:])
+        return {"ioctls": bus.ioctls - start, "ops": n}
+
+    return run
+
+
+def bench_recovery():
+    from hx83121a import recovery
+    from hx_emulator import EmulatedI2C
+
+    zero_delays(recovery.DELAYS)
+    recovery.DELAYS["bootrom_timeout"] = 1.0
+    sysfs = tempfile.mkdtemp(prefix="hx-bench-")
+    atexit.register(shutil.rmtree, sysfs, True)
+    recovery.HID_DRIVER = sysfs
+    recovery.check_touch_input = lambda: os.path.exists(os.path.join(sysfs, "bind"))
+    gpio99_io = recovery.TLMM_BASE + 99 * 0x1000 + 4
+
+    def run():
+        dev = EmulatedI2C()
+        recovery.mmio_rw = GpioStandIn(dev.device, gpio99_io).mmio_rw
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(os.path.join(sysfs, "bind"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            ok = recovery.recover_touch(dev)
+        if not ok:
+            raise RuntimeError("recover_touch failed on the stand-in")
+        return {"ioctls": dev.ioctls}
+
+    return run
+
+
+def bench_touchpad(n=20):
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location("huawei_tp_activate", TOUCHPAD_SCRIPT)
+    tp = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tp)
+    tp.fcntl = TouchpadStandIn(tp)
+    tp.record = lambda *a, **kw: None
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            for _ in range(n):
+                tp.activate_once(trigger="bench")
+        if out.getvalue().count("already in Input Mode 3") != n:
+            raise RuntimeError("touchpad precheck did not see Input Mode 3 on the stand-in")
+        return {"ops": n}
+
+    return run
+
+
+def bench_board_index():
+    from patch_board import SRC_KEY, find_board_blob, index_board
+
+    data = synthetic_board()
+
+    def run():
+        entries, boards = index_board(data)
+        blob = find_board_blob(data, boards, SRC_KEY)
+        n = len(blob)
+        blob.release()
+        return {"bytes": len(data), "ops": len(entries)} if n else {}
+
+    return run
+
+
+def bench_nvm_index():
+    from qca_nvm import index_tags
+
+    data = synthetic_nvm()
+
+    def run():
+        return {"bytes": len(data), "ops": len(index_tags(data).order)}
+
+    return run
+
+
+BENCHMARKS = {
+    "load_firmware": (bench_load_firmware, 3),
+    "load_plan": (bench_load_plan, 3),
+    "write_sram": (bench_write_sram, 3),
+    "snap": (bench_snap, 5),
+    "poll30": (bench_poll30, 5),
+    "recovery": (bench_recovery, 5),
+    "touchpad": (bench_touchpad, 5),
+    "board_index": (bench_board_index, 10),
+    "nvm_index": (bench_nvm_index, 10),
+}
+
+
+# === Harness ===
+
+def calibrate():
+    """Wall time (s) of one pass of a fixed loop of the interpreter work
+    the benchmarks are made of: struct unpacking, dict stores, bytes
+    slicing and a CRC."""
+    buf = bytes(range(256)) * 4
+    t0 = time.perf_counter()
+    d = {}
+    acc = 0
+    for i in range(10000):
+        acc = (acc + struct.unpack_from("<I", buf, i & 0x3FC)[0]) & 0xFFFFFFFF
+        d[i & 0xFF] = buf[i & 0xFF : (i & 0xFF) + 8]
+    zlib.crc32(buf * 16, acc)
+    return time.perf_counter() - t0
+
+
+def measure(setup, repeat):
+    run = setup()
+    run()  # warm-up: first-call imports and caches
+    # calibration passes interleaved with the runs see the same host load
+    best = cal = None
+    for _ in range(repeat):
+        for _ in range(3):
+            c = calibrate()
+            if cal is None or c < cal:
+                cal = c
+        t0 = time.perf_counter()
+        counters = run()
+        wall = time.perf_counter() - t0
+        if best is None or wall < best:
+            best = wall
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    m = {
+        "wall_ms": round(best * 1000, 3),
+        "wall_cal": round(best / cal, 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+    if "ioctls" in counters:
+        m["ioctls"] = counters["ioctls"]
+    if "bytes" in counters:
+        m["rate"] = f"{counters['bytes'] / best / 1024:.0f} KiB/s"
+    elif "ops" in counters:
+        m["rate"] = f"{best / counters['ops'] * 1e6:.1f} us/op"
+    return m
+
+
+def load_budgets(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark tool hot paths against software stand-ins.")
+    ap.add_argument("names", nargs="*", help=f"benchmarks: {', '.join(BENCHMARKS)} (default: all)")
+    ap.add_argument("-r", "--repeat", type=int, help="timed runs per benchmark (default: per benchmark)")
+    ap.add_argument("--budgets", default=BUDGET_FILE)
+    ap.add_argument("--write-budgets", action="store_true",
+                    help="store the measurements plus headroom as the new budgets")
+    ap.add_argument("--json", action="store_true", help="print measurements as JSON")
+    args = ap.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            ap.error(f"unknown benchmark {name!r}")
+
+    budgets = load_budgets(args.budgets)
+    results = {}
+    failed = []
+    for name in args.names or BENCHMARKS:
+        setup, repeat = BENCHMARKS[name]
+        m = results[name] = measure(setup, args.repeat or repeat)
+        budget = budgets.get(name, {})
+        over = [k for k, limit in budget.items() if k in m and m[k] > limit]
+        if over:
+            failed.append(name)
+        if not args.json:
+            cols = "  ".join(
+                f"{k}={m[k]}" + (f"/{budget[k]}" if k in budget else "")
+                for k in ("wall_ms", "wall_cal", "ioctls", "peak_kib") if k in m
+            )
+            status = "OVER " + ",".join(over) if over else ("ok" if budget else "no budget")
+            print(f"{name:14s} {cols}  {m.get('rate', '')}  {status}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    if args.write_budgets:
+        for name, m in results.items():
+            budgets[name] = {
+                k: (round(m[k] * h, 3 if k == "wall_cal" else 1) if isinstance(m[k], float) else int(m[k] * h))
+                for k, h in HEADROOM.items() if k in m
+            }
+        with open(args.budgets, "w") as f:
+            json.dump(budgets, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"budgets written to {args.budgets}")
+        return 0
+    if failed:
+        print(f"over budget: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
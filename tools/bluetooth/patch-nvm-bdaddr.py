@@ -9,63 +9,45 @@ patches it into the NVM file at the correct TLV offset.
 
 Usage:
     sudo python3 patch-nvm-bdaddr.py
+    python3 patch-nvm-bdaddr.py --batch serials.csv --base hpnv21g.b9f --out-dir out/
 
 The script will:
 1. Read the device serial from /sys/class/dmi/id/product_serial
 2. Generate a unique BD address via MD5 hash (locally-administered, unicast)
 3. Back up the original NVM file (.orig)
 4. Patch the 6-byte BD address at TLV tag_id=2 (offset 92)
+
+Batch mode provisions images for many devices: serials come from a CSV
+file (first column; '-' reads stdin), the base NVM is parsed once, and
+worker processes each keep one copy of the template, change only the
+six address bytes per serial and write <out-dir>/<serial>.b9f
+atomically (temp file + rename). manifest.csv maps serial to address.
 """
 
+import argparse
+import csv
 import hashlib
+import multiprocessing
 import os
-import shutil
-import struct
+import re
 import sys
+import time
+
+import qca_nvm
 
 NVM_FILE = "/lib/firmware/qca/hpnv21g.b9f"
 BD_ADDR_TAG_ID = 2
-TLV_HEADER_SIZE = 4  # __le32 type_len
 
 
 def parse_nvm_find_bdaddr(data):
     """Parse QCA NVM TLV format and return offset of BD address data."""
-    if len(data) < TLV_HEADER_SIZE + 12:
+    index = qca_nvm.index_tags(data)
+    if index is None:
         return None
-
-    type_len = struct.unpack_from('<I', data, 0)[0]
-    tlv_type = type_len & 0xFF
-    tlv_length = type_len >> 8
-
-    offset = TLV_HEADER_SIZE
-
-    # Type 4 = enclosing header, skip to inner
-    if tlv_type == 4:
-        if len(data) < offset + TLV_HEADER_SIZE:
-            return None
-        type_len = struct.unpack_from('<I', data, offset)[0]
-        tlv_length = type_len >> 8
-        offset += TLV_HEADER_SIZE
-
-    # Parse tlv_type_nvm entries: tag_id(2) + tag_len(2) + reserve1(4) + reserve2(4) + data
-    idx = 0
-    while idx < tlv_length:
-        entry_offset = offset + idx
-        if entry_offset + 12 > len(data):
-            break
-        tag_id = struct.unpack_from('<H', data, entry_offset)[0]
-        tag_len = struct.unpack_from('<H', data, entry_offset + 2)[0]
-        data_offset = entry_offset + 12
-
-        if data_offset + tag_len > len(data):
-            break
-
-        if tag_id == BD_ADDR_TAG_ID and tag_len == 6:
-            return data_offset
-
-        idx += 12 + tag_len
-
-    return None
+    tag = index.tags.get(BD_ADDR_TAG_ID)
+    if tag is None or tag.length != 6:
+        return None
+    return tag.offset
 
 
 def generate_bdaddr(serial):
@@ -75,7 +57,111 @@ def generate_bdaddr(serial):
     return bytes([first]) + bytes.fromhex(h[2:12])
 
 
+def image_name(serial):
+    return re.sub(r"[^A-Za-z0-9._-]", "_", serial) + ".b9f"
+
+
+def read_serials(path):
+    f = sys.stdin if path == "-" else open(path, newline="")
+    serials = []
+    with f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            serial = row[0].strip()
+            if not serials and serial.lower() == "serial":
+                continue  # header
+            serials.append(serial)
+    return serials
+
+
+# Per-worker state, set once by _init_worker
+_template = None
+_bd_offset = 0
+_out_dir = ""
+_fsync = False
+
+
+def _init_worker(template, bd_offset, out_dir, fsync):
+    global _template, _bd_offset, _out_dir, _fsync
+    _template = bytearray(template)
+    _bd_offset = bd_offset
+    _out_dir = out_dir
+    _fsync = fsync
+
+
+def _write_images(serials):
+    out = []
+    for serial in serials:
+        addr = generate_bdaddr(serial)
+        _template[_bd_offset:_bd_offset + 6] = addr
+        name = image_name(serial)
+        path = os.path.join(_out_dir, name)
+        tmp = f"{path}.tmp.{os.getpid()}"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, _template)
+            if _fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)
+        out.append((serial, ":".join(f"{b:02x}" for b in addr), name))
+    return out
+
+
+def batch(args):
+    serials = read_serials(args.batch)
+    if not serials:
+        print("Error: no serials in batch input", file=sys.stderr)
+        return 1
+    template = open(args.base, "rb").read()
+    bd_offset = parse_nvm_find_bdaddr(template)
+    if bd_offset is None:
+        print(f"Error: could not find BD address tag in {args.base}", file=sys.stderr)
+        return 1
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    jobs = args.jobs or os.cpu_count() or 1
+    chunk = max(1, min(256, len(serials) // (jobs * 4) or 1))
+    chunks = [serials[i:i + chunk] for i in range(0, len(serials), chunk)]
+    results = []
+    if jobs == 1:
+        _init_worker(template, bd_offset, args.out_dir, args.fsync)
+        for c in chunks:
+            results.extend(_write_images(c))
+    else:
+        with multiprocessing.Pool(jobs, _init_worker, (template, bd_offset, args.out_dir, args.fsync)) as pool:
+            for part in pool.imap_unordered(_write_images, chunks):
+                results.extend(part)
+    dt = time.perf_counter() - t0
+
+    results.sort()
+    with open(os.path.join(args.out_dir, "manifest.csv"), "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["serial", "bdaddr", "file"])
+        w.writerows(results)
+    dup_serials = len(serials) - len(set(serials))
+    dup_addrs = len(results) - len({r[1] for r in results})
+    print(f"{len(results)} images in {dt:.2f}s ({len(results) / dt:.0f} images/s, "
+          f"{len(results) * len(template) / dt / 1e6:.1f} MB/s, {jobs} workers)")
+    if dup_serials or dup_addrs:
+        print(f"Warning: {dup_serials} duplicate serials, {dup_addrs} duplicate addresses", file=sys.stderr)
+    return 0
+
+
 def main():
+    ap = argparse.ArgumentParser(description="Patch the BD address in a QCA WCN6855 NVM file.")
+    ap.add_argument("--batch", metavar="CSV", help="provision one image per serial ('-' = stdin)")
+    ap.add_argument("--base", default=NVM_FILE, help="template NVM for --batch")
+    ap.add_argument("--out-dir", default="nvm-out", help="output directory for --batch")
+    ap.add_argument("--jobs", type=int, default=0, help="worker processes (default: CPU count)")
+    ap.add_argument("--fsync", action="store_true", help="fsync every image before rename")
+    args = ap.parse_args()
+    if args.batch:
+        sys.exit(batch(args))
+
     if os.geteuid() != 0:
         print("Error: must run as root", file=sys.stderr)
         sys.exit(1)
@@ -98,7 +184,7 @@ def main():
     print(f"Generated BD address: {addr_str}")
 
     # Read NVM file
-    data = bytearray(open(NVM_FILE, "rb").read())
+    data = open(NVM_FILE, "rb").read()
     bd_offset = parse_nvm_find_bdaddr(data)
     if bd_offset is None:
         print("Error: could not find BD address tag in NVM file", file=sys.stderr)
@@ -111,20 +197,18 @@ def main():
         print("Already patched, nothing to do.")
         sys.exit(0)
 
-    # Backup original
+    # Patch (backs up the original as .orig, writes atomically and
+    # verifies the patched bytes)
     backup = NVM_FILE + ".orig"
-    if not os.path.exists(backup):
-        shutil.copy2(NVM_FILE, backup)
+    had_backup = os.path.exists(backup)
+    try:
+        qca_nvm.patch_tags(NVM_FILE, {BD_ADDR_TAG_ID: addr_bytes}, backup=True)
+    except qca_nvm.NvmPatchError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not had_backup:
         print(f"Backed up original to {backup}")
-
-    # Patch
-    data[bd_offset:bd_offset + 6] = addr_bytes
-    open(NVM_FILE, "wb").write(data)
-
-    # Verify
-    verify = open(NVM_FILE, "rb").read()
-    verify_addr = ":".join(f"{b:02x}" for b in verify[bd_offset:bd_offset + 6])
-    print(f"Patched BD address: {verify_addr}")
+    print(f"Patched BD address: {addr_str}")
     print("Done. Reboot to apply.")
 
 
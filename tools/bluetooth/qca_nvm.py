@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""QCA NVM (.bin/.b9f) TLV tag index and multi-tag patcher.
+
+Layout, as parsed by btqca's qca_tlv_check_data(): an optional type-4
+enclosing TLV header, the type-2 NVM TLV header (__le32 type | len << 8),
+then entries of
+
+    __le16 tag_id, __le16 tag_len, __le32 reserve1, __le32 reserve2, data
+
+index_tags() walks the stream once over a memoryview and records every
+tag's data offset and length. patch_tags() applies any number of
+same-length tag replacements in one pass: copy to a temp file next to
+the target, patch through an mmap, fsync, re-read only the patched
+ranges to verify, then rename over the target.
+
+Usage:
+    qca_nvm.py list hpnv21g.b9f
+    qca_nvm.py get hpnv21g.b9f 2
+    qca_nvm.py set hpnv21g.b9f 2=02aabbccddee 17=0100 [-o out.b9f] [--backup]
+"""
+
+import argparse
+import mmap
+import os
+import shutil
+import struct
+import sys
+from typing import NamedTuple
+
+TLV_HEADER_SIZE = 4      # __le32 type_len
+TAG_HEADER_SIZE = 12     # tag_id, tag_len, reserve1, reserve2
+TLV_TYPE_NVM = 2
+TLV_TYPE_ENCLOSING = 4
+
+
+class Tag(NamedTuple):
+    tag_id: int
+    offset: int          # file offset of the tag data
+    length: int
+
+
+class NvmIndex(NamedTuple):
+    tags: dict[int, Tag]     # first occurrence of each tag_id
+    order: list[Tag]         # every entry, file order
+    end: int                 # file offset after the last complete entry
+
+
+def index_tags(data) -> NvmIndex | None:
+    """One pass over the TLV stream; None if the header is not an NVM TLV."""
+    mv = memoryview(data)
+    if len(mv) < TLV_HEADER_SIZE + TAG_HEADER_SIZE:
+        return None
+    (type_len,) = struct.unpack_from("<I", mv, 0)
+    offset = TLV_HEADER_SIZE
+    if type_len & 0xFF == TLV_TYPE_ENCLOSING:
+        if len(mv) < offset + TLV_HEADER_SIZE:
+            return None
+        (type_len,) = struct.unpack_from("<I", mv, offset)
+        offset += TLV_HEADER_SIZE
+    tlv_length = type_len >> 8
+
+    tags: dict[int, Tag] = {}
+    order: list[Tag] = []
+    unpack = struct.Struct("<HH").unpack_from
+    pos = offset
+    while pos < offset + tlv_length and pos + TAG_HEADER_SIZE <= len(mv):
+        tag_id, tag_len = unpack(mv, pos)
+        data_off = pos + TAG_HEADER_SIZE
+        if data_off + tag_len > len(mv):
+            break
+        t = Tag(tag_id, data_off, tag_len)
+        order.append(t)
+        tags.setdefault(tag_id, t)
+        pos = data_off + tag_len
+    return NvmIndex(tags, order, pos)
+
+
+class NvmPatchError(ValueError):
+    pass
+
+
+def patch_tags(path: str, patches: dict[int, bytes], out: str | None = None,
+               backup: bool = False, index: NvmIndex | None = None) -> dict[int, Tag]:
+    """Replace the data of several tags at once; writes `out` (default: path) atomically.
+
+    Every replacement must have the tag's existing length. Returns the
+    patched tags. Raises NvmPatchError if a tag is missing, a length
+    differs, or the verification read-back does not match.
+    """
+    dest = out or path
+    if index is None:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                index = index_tags(m)
+    if index is None:
+        raise NvmPatchError(f"{path}: not a QCA NVM TLV file")
+    todo = {}
+    for tag_id, value in patches.items():
+        t = index.tags.get(tag_id)
+        if t is None:
+            raise NvmPatchError(f"tag {tag_id} not present")
+        if len(value) != t.length:
+            raise NvmPatchError(f"tag {tag_id}: {len(value)} bytes given, tag holds {t.length}")
+        todo[tag_id] = (t, bytes(value))
+
+    if backup and not os.path.exists(dest + ".orig") and os.path.exists(dest):
+        shutil.copy2(dest, dest + ".orig")
+    tmp = f"{dest}.tmp.{os.getpid()}"
+    shutil.copyfile(path, tmp)
+    try:
+        fd = os.open(tmp, os.O_RDWR)
+        try:
+            with mmap.mmap(fd, 0) as m:
+                for t, value in todo.values():
+                    m[t.offset:t.offset + t.length] = value
+                m.flush()
+            os.fsync(fd)
+            for tag_id, (t, value) in todo.items():
+                if os.pread(fd, t.length, t.offset) != value:
+                    raise NvmPatchError(f"tag {tag_id}: verification failed")
+        finally:
+            os.close(fd)
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    return {tag_id: t for tag_id, (t, _) in todo.items()}
+
+
+def parse_assignment(s: str) -> tuple[int, bytes]:
+    tag, _, value = s.partition("=")
+    return int(tag, 0), bytes.fromhex(value.replace(":", ""))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("cmd", choices=["list", "get", "set"])
+    ap.add_argument("nvm")
+    ap.add_argument("args", nargs="*", help="get: TAG; set: TAG=HEX ...")
+    ap.add_argument("-o", "--output", help="write the patched image here instead of in place")
+    ap.add_argument("--backup", action="store_true", help="keep <target>.orig before the first patch")
+    args = ap.parse_args()
+
+    with open(args.nvm, "rb") as f:
+        data = f.read()
+    index = index_tags(data)
+    if index is None:
+        print(f"{args.nvm}: not a QCA NVM TLV file", file=sys.stderr)
+        return 1
+
+    if args.cmd == "list":
+        for t in index.order:
+            preview = data[t.offset:t.offset + min(t.length, 16)].hex()
+            print(f"tag {t.tag_id:5d}  offset {t.offset:6d}  len {t.length:5d}  {preview}{'...' if t.length > 16 else ''}")
+        print(f"{len(index.order)} entries, {len(index.tags)} distinct tags, {len(data) - index.end} trailing bytes")
+        return 0
+
+    if args.cmd == "get":
+        for a in args.args:
+            t = index.tags.get(int(a, 0))
+            if t is None:
+                print(f"tag {a} not present", file=sys.stderr)
+                return 1
+            print(data[t.offset:t.offset + t.length].hex())
+        return 0
+
+    try:
+        patched = patch_tags(args.nvm, dict(parse_assignment(a) for a in args.args), args.output,
+                             args.backup, index)
+    except (NvmPatchError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    for tag_id, t in patched.items():
+        print(f"tag {tag_id} @ {t.offset}: patched {t.length} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
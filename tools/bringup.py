@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Concurrent boot-time bring-up of the tablet's hardware.
+
+The touchscreen recovery, touchpad activation and the Bluetooth/WiFi
+firmware checks used to be separate oneshot units run one after the
+other, each mostly sleeping: the recovery waits for panel init and the
+Boot ROM, the touchpad unit slept 3 s before it started. This script
+runs them as one asyncio task graph, so boot waits for the slowest
+device instead of the sum of all of them:
+
+  bt_nvm        BD address in hpnv21g.b9f matches the serial-derived one
+  bt_driver     modprobe hci_uart                       after bt_nvm
+  wifi_board    board-2.bin has the HW_GK3 qmi-chip-id=18 calibration
+                (or the calibration overlay is installed)
+  wifi_driver   modprobe ath11k_pci                     after wifi_board
+  touchscreen   hx83121a.recovery (panel init wait, Boot ROM recovery),
+                once the touch controller's I2C client exists
+  touchpad      huawei-tp-activate one-shot activation, once the cover
+                is enumerated (polled, no fixed enumeration delay)
+
+Edges only order tasks: a driver is loaded after its firmware check
+whatever the check found, so a wrong BD address still leaves a working
+controller. Checks only report unless --fix is given, which patches the
+firmware file (patch-nvm-bdaddr.py / board_edit.py clone); a driver
+already bound when its firmware was patched is reloaded.
+
+A device that has not appeared is waited for, then reported as a failed
+task: the recovery script and the one-shot activation both exit 0 when
+their device is missing, which would otherwise read as "ok".
+
+Blocking work (the recovery's ioctls and sysfs writes, the touchpad's
+uevent waits, firmware file parsing) runs in a thread pool; modprobe
+runs as an asyncio subprocess and delays are asyncio sleeps. A task
+that overruns its timeout is reported and abandoned, and the process
+exits without waiting for its thread.
+
+At the end every task's start, end and outcome is printed with the
+critical path: the chain of tasks, each gated by the dependency that
+finished last, that ends with the last task to finish.
+
+Usage:
+  bringup.py                        # run everything
+  bringup.py --fix                  # also patch firmware files that need it
+  bringup.py --skip wifi_board --skip wifi_driver
+  bringup.py --list                 # show the graph and exit
+
+Exit status is 1 if any task failed or timed out.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for sub in ("touchscreen", "wifi", "bluetooth"):
+    sys.path.insert(0, os.path.join(HERE, sub))
+
+TOUCHPAD_SCRIPT = os.path.join(HERE, "touchpad", "huawei-tp-activate.py")
+NVM_SCRIPT = os.path.join(HERE, "bluetooth", "patch-nvm-bdaddr.py")
+BOARD_FILE = "/lib/firmware/ath11k/WCN6855/hw2.0/board-2.bin"
+CALIBRATION_DTBO = "/lib/firmware/ath11k/sc8280xp-huawei-gaokun3-calibration.dtbo"
+SERIAL_FILE = "/sys/class/dmi/id/product_serial"
+
+BT_MODULE = "hci_uart"
+WIFI_MODULE = "ath11k_pci"
+# how long a missing device is polled for before its task fails
+TOUCH_DEVICE_WAIT = 15.0
+COVER_WAIT = 10.0
+DEVICE_POLL = 0.1
+
+PATCHED = "patched"
+
+
+class TaskFailed(Exception):
+    pass
+
+
+@dataclass
+class Task:
+    name: str
+    run: Callable       # blocking function (thread pool) or coroutine function
+    after: tuple[str, ...] = ()
+    delay: float = 0.0
+    timeout: float = 30.0
+    start: float | None = None
+    end: float | None = None
+    status: str = "pending"
+    detail: str = ""
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+def log(msg):
+    print(f"bringup: {msg}", flush=True)
+
+
+def load_script(name, path):
+    """Import a script whose file name is not a module name."""
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def check_bt_nvm(args, tasks):
+    nvm = load_script("patch_nvm_bdaddr", NVM_SCRIPT)
+    try:
+        serial = open(SERIAL_FILE).read().strip()
+    except OSError:
+        serial = "gaokun3"  # patch-nvm-bdaddr.py's fallback
+    want = nvm.generate_bdaddr(serial)
+    try:
+        with open(nvm.NVM_FILE, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise TaskFailed(f"{nvm.NVM_FILE} not found") from None
+    off = nvm.parse_nvm_find_bdaddr(data)
+    if off is None:
+        raise TaskFailed("no BD address tag in NVM file")
+    have = data[off:off + 6]
+    if have == want:
+        return f"BD address {have.hex(':')}"
+    if not args.fix:
+        raise TaskFailed(f"BD address {have.hex(':')}, expected {want.hex(':')} (--fix patches)")
+    nvm.qca_nvm.patch_tags(nvm.NVM_FILE, {nvm.BD_ADDR_TAG_ID: want}, backup=True)
+    log(f"bt_nvm: patched BD address {want.hex(':')}")
+    return PATCHED
+
+
+def check_wifi_board(args, tasks):
+    import mmap
+
+    from patch_board import NEW_KEY, SRC_KEY, index_board
+
+    try:
+        with open(BOARD_FILE, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            _, boards = index_board(data)
+    except FileNotFoundError:
+        raise TaskFailed(f"{BOARD_FILE} not found") from None
+    if NEW_KEY.encode("ascii") in boards:
+        return "qmi-chip-id=18 HW_GK3 entry present"
+    if os.path.exists(CALIBRATION_DTBO):
+        return "calibration overlay installed"
+    if not args.fix:
+        raise TaskFailed("no qmi-chip-id=18 HW_GK3 entry and no calibration overlay (--fix adds the entry)")
+    import board_edit
+
+    board_edit.edit(BOARD_FILE, BOARD_FILE, [("clone", SRC_KEY, NEW_KEY)])
+    return PATCHED
+
+
+async def modprobe(*argv):
+    proc = await asyncio.create_subprocess_exec(
+        "modprobe", *argv, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+    )
+    _, err = await proc.communicate()
+    if proc.returncode:
+        raise TaskFailed(err.decode(errors="replace").strip() or f"modprobe exited {proc.returncode}")
+
+
+def load_driver(module, check):
+    async def run(args, tasks):
+        patched = check in tasks and tasks[check].detail == PATCHED
+        if patched and os.path.isdir(f"/sys/module/{module}"):
+            await modprobe("-r", module)
+            await modprobe(module)
+            return f"{module} reloaded for the patched firmware"
+        await modprobe(module)
+        return f"{module} loaded"
+    return run
+
+
+def wait_for(present, seconds):
+    """Poll present() until it is true or seconds have passed; returns its last value."""
+    deadline = time.monotonic() + seconds
+    while True:
+        found = present()
+        if found or time.monotonic() >= deadline:
+            return found
+        time.sleep(DEVICE_POLL)
+
+
+def touchscreen(args, tasks):
+    from hx83121a import discover, recovery
+
+    loc = discover.locate()
+    client = f"/sys/bus/i2c/devices/{loc.hid_device}"
+    if not wait_for(lambda: os.path.exists(client), TOUCH_DEVICE_WAIT):
+        raise TaskFailed(f"touch I2C client {loc.hid_device} did not appear")
+    if recovery.main():
+        raise TaskFailed("recovery failed")
+    return "done"
+
+
+def touchpad(args, tasks):
+    tp = load_script("huawei_tp_activate", TOUCHPAD_SCRIPT)
+    def cover():
+        try:
+            return tp.find_device()[0]
+        except OSError:
+            return None  # usbcore not up yet
+
+    if not wait_for(cover, COVER_WAIT):
+        raise TaskFailed("keyboard cover not attached")
+    if tp.activate_once(trigger="bringup"):
+        raise TaskFailed("activation failed")
+    return "done"
+
+
+# In dependency order: every task comes after the tasks it waits for.
+GRAPH = [
+    Task("bt_nvm", check_bt_nvm),
+    Task("bt_driver", load_driver(BT_MODULE, "bt_nvm"), after=("bt_nvm",)),
+    Task("wifi_board", check_wifi_board),
+    Task("wifi_driver", load_driver(WIFI_MODULE, "wifi_board"), after=("wifi_board",)),
+    Task("touchscreen", touchscreen, timeout=TOUCH_DEVICE_WAIT + 45.0),
+    Task("touchpad", touchpad, timeout=COVER_WAIT + 30.0),
+]
+
+
+async def run_graph(tasks: list[Task], args) -> None:
+    """Run tasks concurrently, each once the tasks it comes after are done."""
+    by_name = {t.name: t for t in tasks}
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(
+        max_workers=sum(not asyncio.iscoroutinefunction(t.run) for t in tasks) or 1,
+        thread_name_prefix="bringup",
+    )
+    t0 = time.monotonic()
+    running: dict[str, asyncio.Task] = {}
+
+    async def run_one(task):
+        deps = [running[d] for d in task.after if d in running]
+        if deps:
+            await asyncio.wait(deps)
+        task.start = time.monotonic() - t0
+        try:
+            if task.delay:
+                await asyncio.sleep(task.delay)
+            if asyncio.iscoroutinefunction(task.run):
+                work = task.run(args, by_name)
+            else:
+                work = loop.run_in_executor(pool, task.run, args, by_name)
+            task.detail = await asyncio.wait_for(work, task.timeout) or ""
+            task.status = "ok"
+        except asyncio.TimeoutError:
+            task.status = "timeout"
+            task.detail = f"no result after {task.timeout:g} s"
+        except Exception as e:
+            task.status = "failed"
+            task.detail = str(e) or type(e).__name__
+        task.end = time.monotonic() - t0
+        log(f"{task.name} {task.status} after {task.seconds:.2f} s: {task.detail}")
+
+    for task in tasks:
+        running[task.name] = asyncio.create_task(run_one(task))
+    await asyncio.wait(running.values())
+    # a timed-out task's thread may still be blocked in the kernel; don't wait for it
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def critical_path(tasks: list[Task]) -> list[Task]:
+    by_name = {t.name: t for t in tasks}
+    path = [max(tasks, key=lambda t: t.end)]
+    while True:
+        deps = [by_name[d] for d in path[-1].after if d in by_name]
+        if not deps:
+            return path[::-1]
+        path.append(max(deps, key=lambda t: t.end))
+
+
+def report(tasks: list[Task]) -> None:
+    wall = max(t.end for t in tasks)
+    serial = sum(t.seconds for t in tasks)
+    print(f"bring-up: {len(tasks)} tasks in {wall:.2f} s (sum of tasks {serial:.2f} s)")
+    for t in sorted(tasks, key=lambda t: t.start):
+        print(f"  {t.name:12s} {t.start:6.2f} -> {t.end:6.2f}  {t.seconds:6.2f} s  {t.status:7s} {t.detail}")
+    path = critical_path(tasks)
+    chain = " -> ".join(f"{t.name} ({t.seconds:.2f} s)" for t in path)
+    print(f"critical path: {chain}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Bring up the tablet's devices concurrently.")
+    ap.add_argument("--fix", action="store_true", help="patch firmware files whose check fails")
+    ap.add_argument("--skip", action="append", default=[], metavar="TASK", help="leave a task out (repeatable)")
+    ap.add_argument("--list", action="store_true", help="print the task graph and exit")
+    args = ap.parse_args()
+    names = [t.name for t in GRAPH]
+    for name in args.skip:
+        if name not in names:
+            ap.error(f"unknown task {name!r} (tasks: {', '.join(names)})")
+
+    tasks = [t for t in GRAPH if t.name not in args.skip]
+    if args.list:
+        for t in tasks:
+            after = f" after {', '.join(t.after)}" if t.after else ""
+            delay = f", {t.delay:g} s delay" if t.delay else ""
+            print(f"{t.name:12s} timeout {t.timeout:g} s{delay}{after}")
+        return 0
+    if not tasks:
+        return 0
+
+    asyncio.run(run_graph(tasks, args))
+    report(tasks)
+    rc = 1 if any(t.status != "ok" for t in tasks) else 0
+    if any(t.status == "timeout" for t in tasks):
+        sys.stdout.flush()
+        os._exit(rc)  # the interpreter would join the stuck worker thread at exit
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,91 +8,607 @@ The 12d1:10b8 keyboard cover requires:
 2. USB port reset - re-initializes device firmware
 3. Driver rebind - triggers hid-multitouch's mt_set_modes() to set
    Input Mode=3 (Touchpad) on the freshly reset device
+
+Each step waits for the uevent that says it is done (kernel uevents for
+the unbind and the hid-multitouch bind, udev's processed "add" of the
+touchpad event node instead of `udevadm settle`), bounded by a per-step
+deadline. If the uevent socket cannot be opened the old fixed sleeps
+are used. Started at boot (huawei-touchpad.service) before the cover
+has enumerated, the script likewise waits for the cover's "add" uevent
+instead of the unit sleeping 3 s first, and finds no cover only once
+that deadline passes.
+
+With --daemon the script stays resident (huawei-touchpad-daemon.service):
+the device index is built once, the gpio-keys event fd stays open, and
+cover attach/detach uevents and SIGUSR1 from the system-sleep hook
+(huawei-touchpad.sleep) trigger activation without scanning sysfs or
+spawning processes.
+
+The script runs from udev/systemd on every attach and resume, so modules
+only some paths need (socket, signal, glob, subprocess) are imported
+where they are used rather than at startup.
+
+Before resetting anything the current state is checked: the Digitizer
+Input Mode feature (usage 0x0D:0x52, located by parsing the report
+descriptor) is read through hidraw, and SW_TABLET_MODE through EVIOCGSW
+on gpio-keys. Input Mode already 3 skips the reset/rebind, tablet mode
+already off skips the injection; --force restores the unconditional
+sequence. A cover attach always resets: hid-multitouch has just set
+Input Mode 3 itself, so reading it back says nothing about the device.
+The cover may leave GET_REPORT unanswered (see the
+HID_QUIRK_NO_INIT_REPORTS note in README.md), so the feature read is
+bounded and an unanswered read counts as "needs reset".
+
+Each activation (trigger, outcome, time to Input Mode 3) is exported
+through hx83121a.metrics (huawei_touchpad.prom) when the touchscreen
+tools are installed in /usr/local/lib/hx83121a (HX83121A_LIB), and
+skipped otherwise.
 """
 import fcntl
 import os
+import select
 import struct
-import subprocess
 import sys
 import time
 
 VENDOR = 0x12d1
 PRODUCT = 0x10b8
 USBDEVFS_RESET = 21780
+HID_ID = f"0003:{VENDOR:08X}:{PRODUCT:08X}"
+
+SYSFS = "/sys"  # roots of every path looked up; tools/bench.py points them at a stand-in
+DEVFS = "/dev"
 
 EV_SW = 5
 EV_SYN = 0
 SW_TABLET_MODE = 1
 SYN_REPORT = 0
 
+HID_USAGE_INPUT_MODE = 0x000D0052  # Digitizer page, Input Mode
+INPUT_MODE_TOUCHPAD = 3
+
+
+def HIDIOCGFEATURE(length):
+    return 0xC0004807 | (length << 16)
+
+
+def EVIOCGSW(length):
+    return 0x8000451B | (length << 16)
+
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_GROUP_KERNEL = 1
+UEVENT_GROUP_UDEV = 2
+
+# Per-step deadlines (seconds). The fixed sleeps they replace were
+# 2 s after reset, 1 s around unbind/bind, settle --timeout=5 and the
+# unit's 3 s ExecStartPre sleep before a boot-time activation.
+DEADLINES = {
+    "enumerate": 3.0,     # cover not on the bus yet at boot
+    "reset_quiet": 0.2,   # reset done once the device is silent this long
+    "reset": 2.0,
+    "unbind": 1.0,
+    "bind": 3.0,
+    "udev": 5.0,
+    "precheck": 0.5,      # hidraw GET_FEATURE of the Input Mode report
+}
+
+
+def record(trigger, outcome, seconds=None):
+    """Export one activation; a no-op without the hx83121a package."""
+    lib = os.environ.get("HX83121A_LIB", "/usr/local/lib/hx83121a")
+    here = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "touchscreen")
+    for d in (lib, here):
+        if d not in sys.path and os.path.isdir(os.path.join(d, "hx83121a")):
+            sys.path.append(d)
+    try:
+        from hx83121a import metrics
+    except ImportError:
+        return
+    metrics.inc("huawei_touchpad_activations_total", trigger=trigger, outcome=outcome)
+    if seconds is not None:
+        metrics.observe("huawei_touchpad_activation_seconds", seconds, trigger=trigger)
+    metrics.flush("huawei_touchpad")
+
+
+class Uevents:
+    """Kernel and udev uevents from NETLINK_KOBJECT_UEVENT."""
+
+    def __init__(self):
+        import socket
+
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC,
+                                  NETLINK_KOBJECT_UEVENT)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind((0, UEVENT_GROUP_KERNEL | UEVENT_GROUP_UDEV))
+
+    def close(self):
+        self.sock.close()
+
+    def recv(self, timeout):
+        """Next uevent as a dict (SOURCE=kernel|udev), or None on timeout."""
+        if not select.select([self.sock], [], [], max(0.0, timeout))[0]:
+            return None
+        buf = self.sock.recv(1 << 16)
+        if buf.startswith(b"libudev\0"):
+            # struct udev_monitor_netlink_header: properties_off/len at 16
+            off, length = struct.unpack_from("=II", buf, 16)
+            body, source = buf[off:off + length], "udev"
+        elif b"@" in buf.split(b"\0", 1)[0]:
+            body, source = buf.split(b"\0", 1)[1], "kernel"
+        else:
+            return {}
+        ev = dict(kv.split("=", 1) for kv in body.decode(errors="replace").split("\0") if "=" in kv)
+        ev["SOURCE"] = source
+        return ev
+
+    def wait(self, match, timeout):
+        """First uevent for which match(ev) is true, or None at the deadline."""
+        deadline = time.monotonic() + timeout
+        while True:
+            ev = self.recv(deadline - time.monotonic())
+            if ev is None:
+                return None
+            if ev and match(ev):
+                return ev
+
+    def quiet(self, match, quiet, timeout):
+        """Wait until no matching uevent arrived for `quiet` seconds."""
+        deadline = time.monotonic() + timeout
+        last = time.monotonic()
+        while time.monotonic() < deadline:
+            ev = self.recv(min(deadline, last + quiet) - time.monotonic())
+            if ev is None:
+                if time.monotonic() >= last + quiet:
+                    return True
+                continue
+            if ev and match(ev):
+                last = time.monotonic()
+        return False
+
+
+def find_gpio_keys():
+    """Find the gpio-keys event device node."""
+    for entry in os.listdir(f"{SYSFS}/class/input"):
+        if not entry.startswith("event"):
+            continue
+        try:
+            name = open(f"{SYSFS}/class/input/{entry}/device/name").read().strip()
+        except (FileNotFoundError, OSError):
+            continue
+        if name == "gpio-keys":
+            return f"{DEVFS}/input/{entry}"
+    return None
+
+
+def write_tablet_mode_off(fd):
+    now = time.time()
+    sec = int(now)
+    usec = int((now - sec) * 1000000)
+    os.write(fd, struct.pack("llHHi", sec, usec, EV_SW, SW_TABLET_MODE, 0)
+             + struct.pack("llHHi", sec, usec, EV_SYN, SYN_REPORT, 0))
+
+
 def inject_tablet_mode_off():
     """Inject SW_TABLET_MODE=0 to disable tablet mode detection."""
-    # Find gpio-keys event device
-    for entry in os.listdir("/sys/class/input"):
-        if not entry.startswith("event"):
+    devpath = find_gpio_keys()
+    if not devpath:
+        return False
+    try:
+        fd = os.open(devpath, os.O_WRONLY)
+        try:
+            write_tablet_mode_off(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        return False
+    return True
+
+
+def tablet_mode(fd):
+    """Current SW_TABLET_MODE state of an evdev fd, or None if unknown."""
+    buf = bytearray(8)
+    try:
+        fcntl.ioctl(fd, EVIOCGSW(len(buf)), buf, True)
+    except OSError:
+        return None
+    return bool(buf[0] >> SW_TABLET_MODE & 1)
+
+
+def find_input_mode(desc):
+    """Locate the Input Mode feature in a HID report descriptor.
+
+    Returns (report_id, byte offset in the hidraw buffer, buffer length)
+    or None. Handles short items, Push/Pop and 4-byte extended usages.
+    """
+    page = size = count = report_id = 0
+    stack = []
+    usages = []
+    feature_bits = {}
+    found = None
+    i = 0
+    while i < len(desc):
+        b = desc[i]
+        if b == 0xFE:  # long item
+            i += 3 + (desc[i + 1] if i + 1 < len(desc) else 0)
             continue
+        n = (0, 1, 2, 4)[b & 3]
+        data = int.from_bytes(desc[i + 1:i + 1 + n], "little")
+        tag = b & 0xFC
+        i += 1 + n
+        if tag == 0x04:
+            page = data
+        elif tag == 0x74:
+            size = data
+        elif tag == 0x94:
+            count = data
+        elif tag == 0x84:
+            report_id = data
+        elif tag == 0xA4:
+            stack.append((page, size, count, report_id))
+        elif tag == 0xB4 and stack:
+            page, size, count, report_id = stack.pop()
+        elif tag == 0x08:
+            usages.append(data if n == 4 else (page << 16) | data)
+        elif tag in (0x80, 0x90, 0xB0, 0xA0, 0xC0):  # Input, Output, Feature, Collection, End
+            if tag == 0xB0:
+                pos = feature_bits.get(report_id, 0)
+                if HID_USAGE_INPUT_MODE in usages[:count] and found is None:
+                    found = (report_id, pos + usages.index(HID_USAGE_INPUT_MODE) * size)
+                feature_bits[report_id] = pos + size * count
+            usages = []
+    if found is None:
+        return None
+    rid, bit = found
+    return rid, 1 + bit // 8, 1 + (feature_bits[rid] + 7) // 8
+
+
+def read_feature(path, report_id, length, timeout):
+    """HIDIOCGFEATURE, bounded by timeout, without holding the hidraw fd.
+
+    The ioctl ignores O_NONBLOCK and cannot be interrupted (usbhid waits
+    out its own control-transfer timeout), so it runs in a detached
+    grandchild that owns the hidraw fd and answers on a pipe. We only
+    poll() the non-blocking read end; an abandoned helper exits on its
+    own, leaving neither an fd nor a zombie in the daemon.
+    """
+    rfd, wfd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+    pid = os.fork()
+    if pid == 0:
         try:
-            name = open(f"/sys/class/input/{entry}/device/name").read().strip()
-            if name == "gpio-keys":
-                devpath = f"/dev/input/{entry}"
-                now = time.time()
-                sec = int(now)
-                usec = int((now - sec) * 1000000)
-                fd = os.open(devpath, os.O_WRONLY)
-                os.write(fd, struct.pack("llHHi", sec, usec, EV_SW, SW_TABLET_MODE, 0))
-                os.write(fd, struct.pack("llHHi", sec, usec, EV_SYN, SYN_REPORT, 0))
-                os.close(fd)
-                return True
-        except (FileNotFoundError, ValueError, OSError):
+            os.close(rfd)
+            if os.fork() == 0:
+                fd = os.open(path, os.O_RDWR | os.O_CLOEXEC)
+                buf = bytearray(length)
+                buf[0] = report_id
+                n = fcntl.ioctl(fd, HIDIOCGFEATURE(length), buf, True)
+                os.set_blocking(wfd, True)
+                os.write(wfd, bytes(buf[:n]))
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    os.waitpid(pid, 0)
+    try:
+        p = select.poll()
+        p.register(rfd, select.POLLIN)
+        if not p.poll(timeout * 1000):
+            return None
+        try:
+            return os.read(rfd, length) or None  # b"": the helper failed
+        except BlockingIOError:
+            return None
+    finally:
+        os.close(rfd)
+
+
+def read_input_mode(sysname):
+    """Current Input Mode of the cover's touchpad collection, or None."""
+    import glob
+
+    for rd in glob.glob(f"{SYSFS}/bus/usb/devices/{sysname}:*/*/report_descriptor"):
+        try:
+            with open(rd, "rb") as f:
+                loc = find_input_mode(f.read())
+            nodes = os.listdir(os.path.join(os.path.dirname(rd), "hidraw"))
+        except OSError:
+            continue
+        if not loc or not nodes:
             continue
-    return False
+        report_id, offset, length = loc
+        data = read_feature(f"{DEVFS}/{nodes[0]}", report_id, length, DEADLINES["precheck"])
+        return data[offset] if data and len(data) > offset else None
+    return None
+
 
 def find_device():
     """Find USB sysfs name and devpath for 12d1:10b8."""
-    for entry in os.listdir("/sys/bus/usb/devices"):
+    for entry in os.listdir(f"{SYSFS}/bus/usb/devices"):
         if ':' in entry or entry.startswith('.'):
             continue
         try:
-            vid = open(f"/sys/bus/usb/devices/{entry}/idVendor").read().strip()
-            pid = open(f"/sys/bus/usb/devices/{entry}/idProduct").read().strip()
+            vid = open(f"{SYSFS}/bus/usb/devices/{entry}/idVendor").read().strip()
+            pid = open(f"{SYSFS}/bus/usb/devices/{entry}/idProduct").read().strip()
             if int(vid, 16) == VENDOR and int(pid, 16) == PRODUCT:
-                busnum = int(open(f"/sys/bus/usb/devices/{entry}/busnum").read().strip())
-                devnum = int(open(f"/sys/bus/usb/devices/{entry}/devnum").read().strip())
-                return entry, f"/dev/bus/usb/{busnum:03d}/{devnum:03d}"
+                busnum = int(open(f"{SYSFS}/bus/usb/devices/{entry}/busnum").read().strip())
+                devnum = int(open(f"{SYSFS}/bus/usb/devices/{entry}/devnum").read().strip())
+                return entry, f"{DEVFS}/bus/usb/{busnum:03d}/{devnum:03d}"
         except (FileNotFoundError, ValueError):
             continue
     return None, None
 
-# Step 0: Fix tablet mode switch (must be done regardless of keyboard presence)
-inject_tablet_mode_off()
-
-sysname, devpath = find_device()
-if not sysname:
-    sys.exit(0)
 
-# Step 1: USB port reset
-try:
+def usb_reset(devpath):
     fd = os.open(devpath, os.O_WRONLY)
-    fcntl.ioctl(fd, USBDEVFS_RESET, 0)
-    os.close(fd)
-except Exception:
-    sys.exit(1)
-
-# Step 2: Wait for firmware to initialize
-time.sleep(2)
-
-# Step 3: Unbind/bind for fresh hid-multitouch probe
-subprocess.run(["sh", "-c",
-    f"echo {sysname} > /sys/bus/usb/drivers/usb/unbind"],
-    check=False)
-time.sleep(1)
-subprocess.run(["sh", "-c",
-    f"echo {sysname} > /sys/bus/usb/drivers/usb/bind"],
-    check=False)
-
-# Step 4: Wait for devices to settle
-time.sleep(1)
-subprocess.run(["udevadm", "settle", "--timeout=5"], check=False)
-
-# Step 5: Re-inject tablet mode off (bind creates fresh gpio state view)
-inject_tablet_mode_off()
+    try:
+        fcntl.ioctl(fd, USBDEVFS_RESET, 0)
+    finally:
+        os.close(fd)
+
+
+def usb_driver(action, sysname):
+    """Write sysname to the usb driver's bind/unbind attribute."""
+    try:
+        fd = os.open(f"{SYSFS}/bus/usb/drivers/usb/{action}", os.O_WRONLY)
+    except OSError:
+        return False
+    try:
+        os.write(fd, sysname.encode())
+    except OSError:
+        return False  # e.g. already unbound
+    finally:
+        os.close(fd)
+    return True
+
+
+def on_device(sysname):
+    """Matchers for uevents of the cover's USB device and its children."""
+    tail = "/" + sysname
+
+    def device(ev):
+        return ev.get("DEVPATH", "").endswith(tail)
+
+    def below(ev):
+        p = ev.get("DEVPATH", "")
+        return p.endswith(tail) or (tail + ":") in p or (tail + "/") in p
+
+    return device, below
+
+
+def rebind_evented(sysname, devpath, uev):
+    """Reset and rebind, each step ended by its uevent. Returns step timings."""
+    device, below = on_device(sysname)
+    steps = {}
+    t = time.monotonic()
+
+    usb_reset(devpath)
+    # USBDEVFS_RESET returns after re-enumeration; interfaces without
+    # reset hooks are re-probed asynchronously, so wait until it is quiet.
+    uev.quiet(below, DEADLINES["reset_quiet"], DEADLINES["reset"])
+    steps["reset"] = time.monotonic() - t
+
+    t = time.monotonic()
+    if usb_driver("unbind", sysname):
+        uev.wait(lambda ev: ev.get("ACTION") == "unbind" and ev["SOURCE"] == "kernel" and device(ev),
+                 DEADLINES["unbind"])
+    steps["unbind"] = time.monotonic() - t
+
+    t = time.monotonic()
+    usb_driver("bind", sysname)
+    # KOBJ_BIND is sent after probe, so the input devices already exist
+    bound = uev.wait(lambda ev: ev.get("ACTION") == "bind" and ev["SOURCE"] == "kernel"
+                     and ev.get("DRIVER") == "hid-multitouch" and ev.get("HID_ID", "").upper() == HID_ID,
+                     DEADLINES["bind"])
+    steps["bind"] = time.monotonic() - t
+
+    t = time.monotonic()
+    if bound:
+        # udev has tagged the new event node for libinput
+        uev.wait(lambda ev: ev["SOURCE"] == "udev" and ev.get("ACTION") == "add"
+                 and ev.get("SUBSYSTEM") == "input" and ev.get("DEVNAME", "").startswith("/dev/input/event")
+                 and below(ev), DEADLINES["udev"])
+    else:
+        import subprocess
+
+        subprocess.run(["udevadm", "settle", f"--timeout={DEADLINES['udev']:g}"], check=False)
+    steps["udev"] = time.monotonic() - t
+    return steps, bool(bound)
+
+
+def rebind_sleeps(sysname, devpath):
+    """Original fixed-delay sequence, used when uevents are unavailable."""
+    import subprocess
+
+    usb_reset(devpath)
+    time.sleep(2)
+    usb_driver("unbind", sysname)
+    time.sleep(1)
+    usb_driver("bind", sysname)
+    time.sleep(1)
+    subprocess.run(["udevadm", "settle", "--timeout=5"], check=False)
+
+
+def is_cover(ev):
+    return (ev.get("SOURCE") == "kernel" and ev.get("DEVTYPE") == "usb_device"
+            and ev.get("PRODUCT", "").startswith(f"{VENDOR:x}/{PRODUCT:x}/"))
+
+
+class Daemon:
+    """Resident activation: cached device index, open gpio-keys fd."""
+
+    def __init__(self, uev, force=False):
+        self.uev = uev
+        self.force = force
+        self.gpio_fd = None
+        self.sysname, self.devpath = find_device()
+
+    def log(self, msg):
+        print(msg, flush=True)
+
+    def tablet_mode_off(self):
+        for _ in range(2):
+            if self.gpio_fd is None:
+                path = find_gpio_keys()
+                if not path:
+                    return
+                self.gpio_fd = os.open(path, os.O_WRONLY | os.O_CLOEXEC)
+            try:
+                write_tablet_mode_off(self.gpio_fd)
+                return
+            except OSError:
+                os.close(self.gpio_fd)  # gpio-keys went away; look it up again
+                self.gpio_fd = None
+
+    def activate(self, why):
+        t0 = time.monotonic()
+        if self.force or self.gpio_fd is None or tablet_mode(self.gpio_fd) is not False:
+            self.tablet_mode_off()
+        if not self.sysname:
+            self.log(f"{why}: no keyboard cover")
+            record(why, "no_cover")
+            return
+        if not self.force and why != "attach":
+            mode = read_input_mode(self.sysname)
+            if mode == INPUT_MODE_TOUCHPAD:
+                self.log(f"{why}: Input Mode 3 already set ({(time.monotonic() - t0) * 1000:.0f}ms)")
+                record(why, "active", time.monotonic() - t0)
+                return
+        try:
+            steps, bound = rebind_evented(self.sysname, self.devpath, self.uev)
+        except OSError as e:
+            self.log(f"{why}: reset of {self.sysname} failed: {e}")
+            record(why, "failed")
+            return
+        self.tablet_mode_off()
+        total = time.monotonic() - t0
+        self.log(f"{why}: " + " ".join(f"{k}={v * 1000:.0f}ms" for k, v in steps.items())
+                 + f" total={total * 1000:.0f}ms"
+                 + ("" if bound else " (hid-multitouch bind not seen)"))
+        record(why, "reset", total)
+
+    def handle(self, ev):
+        if not is_cover(ev):
+            return
+        name = ev.get("DEVPATH", "").rsplit("/", 1)[-1]
+        if ev.get("ACTION") == "add":
+            self.sysname, self.devpath = name, f"{DEVFS}/" + ev.get("DEVNAME", "")
+            # let the initial hid-multitouch probe finish before resetting
+            self.uev.wait(lambda e: e.get("ACTION") == "bind" and e.get("DRIVER") == "hid-multitouch"
+                          and e.get("HID_ID", "").upper() == HID_ID, DEADLINES["bind"])
+            self.activate("attach")
+        elif ev.get("ACTION") == "remove" and name == self.sysname:
+            self.sysname = self.devpath = None
+            self.log("detach")
+
+    def run(self):
+        import signal
+
+        rfd, wfd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        signal.set_wakeup_fd(wfd)
+        signal.signal(signal.SIGUSR1, lambda *_: None)
+        self.activate("start")
+        while True:
+            ready = select.select([self.uev.sock, rfd], [], [])[0]
+            if rfd in ready:
+                try:
+                    sigs = os.read(rfd, 64)
+                except BlockingIOError:
+                    sigs = b""
+                if signal.SIGUSR1 in sigs:
+                    self.activate("resume")
+            if self.uev.sock in ready:
+                ev = self.uev.recv(0)
+                if ev:
+                    self.handle(ev)
+
+
+def tablet_mode_at(path):
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    except OSError:
+        return None
+    try:
+        return tablet_mode(fd)
+    finally:
+        os.close(fd)
+
+
+def wait_for_cover():
+    """find_device(), after waiting up to DEADLINES["enumerate"] for the cover to enumerate."""
+    try:
+        uev = Uevents()
+    except OSError:
+        time.sleep(DEADLINES["enumerate"])
+        return find_device()
+    try:
+        found = find_device()  # listening first, so an attach in between is not missed
+        if found[0] or not uev.wait(is_cover, DEADLINES["enumerate"]):
+            return found
+        return find_device()
+    finally:
+        uev.close()
+
+
+def activate_once(force=False, trigger="oneshot", wait_cover=False):
+    """The one-shot activation; returns the exit status. Also called by bringup.py.
+
+    wait_cover: give a cover that is not enumerated yet DEADLINES["enumerate"]
+    to appear (the boot-time service) instead of reporting no cover at once.
+    """
+    # Step 0: Fix tablet mode switch (must be done regardless of keyboard presence)
+    gpio = find_gpio_keys()
+    if force or not gpio or tablet_mode_at(gpio) is not False:
+        inject_tablet_mode_off()
+
+    sysname, devpath = find_device()
+    if not sysname and wait_cover:
+        sysname, devpath = wait_for_cover()
+    if not sysname:
+        record(trigger, "no_cover")
+        return 0
+
+    if not force:
+        t_check = time.monotonic()
+        mode = read_input_mode(sysname)
+        if mode == INPUT_MODE_TOUCHPAD:
+            print("touchpad already in Input Mode 3; skipping reset")
+            record(trigger, "active", time.monotonic() - t_check)
+            return 0
+        print(f"Input Mode {'unreadable' if mode is None else mode}; resetting")
+
+    # Listen before acting so no uevent of the sequence is missed
+    try:
+        uev = Uevents()
+    except OSError:
+        uev = None
+
+    t0 = time.monotonic()
+    try:
+        if uev:
+            steps, bound = rebind_evented(sysname, devpath, uev)
+            print(" ".join(f"{k}={v * 1000:.0f}ms" for k, v in steps.items())
+                  + f" total={(time.monotonic() - t0) * 1000:.0f}ms"
+                  + ("" if bound else " (hid-multitouch bind not seen)"))
+        else:
+            rebind_sleeps(sysname, devpath)
+    except OSError:
+        record(trigger, "failed")
+        return 1
+    finally:
+        if uev:
+            uev.close()
+
+    # Re-inject tablet mode off (bind creates fresh gpio state view)
+    inject_tablet_mode_off()
+    record(trigger, "reset", time.monotonic() - t0)
+    return 0
+
+
+def main():
+    force = "--force" in sys.argv[1:]
+    if "--daemon" in sys.argv[1:]:
+        Daemon(Uevents(), force).run()
+        return 0
+    return activate_once(force, wait_cover=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,19 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Shared HX83121A register map and bus transport.
+
+  regs      AHB register map, bridge commands, status values
+  spi       spidev SpiBus, prebuilt SPI_IOC_MESSAGE batches (SpiBatch)
+  i2c       I2C_RDWR access to the AHB bridge (AhbI2C)
+  broker    client side of hx_busd.py: open_spi() / open_i2c()
+  discover  which /dev/i2c-N the chip is on (parallel probe, cached)
+  profile   per-device timing/SPI/CRC profiles under /var/lib/hx83121a
+  rt        opt-in SCHED_FIFO, precise sleeps, jitter accounting
+  metrics   Prometheus textfile/socket export for loader, recovery, touchpad
+  recovery  Boot ROM recovery sequence (hx83121a-touch-recovery)
+
+Several importers are systemd services started cold in the boot path, so
+this file imports nothing: entry points import only the submodules they
+use, and submodules defer optional stdlib modules (json, socket,
+subprocess, ctypes.util, ...) to the function that needs them.
+hx_importtime.py checks the entry points against their budgets.
+"""
@@ -0,0 +1,251 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Client side of the hx_busd.py bus broker.
+
+open_spi()/open_i2c() return a broker-backed bus when the broker socket
+exists (HX_BUS_BROKER=0 disables), else the direct bus class, so tools
+pick the broker up transparently. Wire format: see hx_busd.py.
+
+Every request runs as one ioctl, so a single AHB access (ar/aw,
+ahb_fetch32, burst_enable) is sent as one batch and cannot be split by
+another client. A sequence that relies on bridge state across requests
+(burst mode around an SRAM write, a whole firmware load) runs inside
+session(bus): the broker then serves no other client until it ends.
+
+A broker serves one I2C bus and one spidev node, which it reports in
+its OP_PING reply. open_i2c()/open_spi() use it only for the bus they
+were asked for and open the bus directly otherwise, so an explicit
+--i2c-bus never silently lands on the broker's bus.
+
+socket and json are imported only once a broker is actually in use.
+"""
+
+import os
+import struct
+
+SOCKET_PATH = os.environ.get("HX_BUS_SOCKET", "/run/hx83121a/bus.sock")
+
+OP_SPI = 1
+OP_I2C = 2
+OP_STATS = 3
+OP_PING = 4
+OP_LOCK = 5
+OP_UNLOCK = 6
+
+REQ_HDR = struct.Struct("<BBHI")
+REP_HDR = struct.Struct("<iQ")
+PING_REP = struct.Struct("<i")  # served I2C bus (-1: none), then the spidev path
+SPI_ENT = struct.Struct("<H")
+I2C_ENT = struct.Struct("<BBH")
+I2C_M_RD = 0x0001
+MAX_PACKET = 1 << 17
+
+
+class Session:
+    """Context manager holding the broker for one client; nests."""
+
+    def __init__(self, client: "BrokerClient"):
+        self.client = client
+
+    def __enter__(self):
+        c = self.client
+        if not c.depth:
+            c.call(REQ_HDR.pack(OP_LOCK, 0, 0, 0))
+        c.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        c = self.client
+        c.depth -= 1
+        if not c.depth:
+            c.call(REQ_HDR.pack(OP_UNLOCK, 0, 0, 0))
+
+
+class _NoSession:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class BrokerClient:
+    def __init__(self, path: str | None = None):
+        import socket
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.sock.connect(path or SOCKET_PATH)
+        self.depth = 0
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def call(self, pkt: bytes) -> bytes:
+        self.sock.send(pkt)
+        # up to MAX_PACKET of rx data behind the header; SEQPACKET truncates silently
+        rep = self.sock.recv(MAX_PACKET + REP_HDR.size)
+        err, _ = REP_HDR.unpack_from(rep)
+        if err:
+            raise OSError(err, os.strerror(err))
+        return rep[REP_HDR.size :]
+
+    def spi(self, mode: int, speed: int, frames: list[bytes]) -> bytes:
+        parts = [REQ_HDR.pack(OP_SPI, mode, len(frames), speed)]
+        for f in frames:
+            parts.append(SPI_ENT.pack(len(f)))
+            parts.append(f)
+        return self.call(b"".join(parts))
+
+    def i2c(self, msgs: list[tuple[int, int, bytes | int]]) -> bytes:
+        """msgs: (addr, flags, data) for writes, (addr, I2C_M_RD, length) for reads."""
+        parts = [REQ_HDR.pack(OP_I2C, 0, len(msgs), 0)]
+        for addr, flags, d in msgs:
+            if flags & I2C_M_RD:
+                parts.append(I2C_ENT.pack(addr, flags, d))
+            else:
+                parts.append(I2C_ENT.pack(addr, flags, len(d)))
+                parts.append(bytes(d))
+        return self.call(b"".join(parts))
+
+    def served(self) -> tuple[int, str]:
+        """(I2C bus number or -1, spidev path or "") the broker serves."""
+        rep = self.call(REQ_HDR.pack(OP_PING, 0, 0, 0))
+        (bus,) = PING_REP.unpack_from(rep)
+        return bus, bytes(rep[PING_REP.size :]).decode()
+
+    def stats(self) -> dict:
+        import json
+
+        return json.loads(self.call(REQ_HDR.pack(OP_STATS, 0, 0, 0)))
+
+    def session(self) -> Session:
+        return Session(self)
+
+
+class BrokerSpiMixin:
+    """Replaces the spidev primitives of a SpiBus-style class with broker calls."""
+
+    def __init__(self, dev: str, mode: int, speed: int, client: BrokerClient | None = None):
+        self.dev = dev
+        self.mode = mode
+        self.speed = speed
+        self.fd = -1
+        self.client = client or BrokerClient()
+
+    def close(self) -> None:
+        self.client.close()
+
+    def xfer(self, tx, total_len: int | None = None) -> bytes:
+        b = bytes(bytearray(tx))
+        if total_len is not None and total_len > len(b):
+            b += bytes(total_len - len(b))
+        return self.client.spi(self.mode, self.speed, [b])
+
+    def xfer_many(self, batch) -> None:
+        rx = self.client.spi(self.mode, self.speed, [bytes(t) for t in batch.tx])
+        off = 0
+        for r in batch.rx:
+            n = len(r)
+            r[:] = rx[off : off + n]
+            off += n
+
+    def ar(self, addr: int) -> int:
+        from hx83121a.spi import SpiBatch, ahb_read_frames
+
+        batch = SpiBatch(ahb_read_frames(addr), self.speed)
+        self.xfer_many(batch)
+        return struct.unpack("<I", bytes(batch.rx[-1])[3:7])[0]
+
+    def aw(self, addr: int, value: int) -> None:
+        from hx83121a.regs import REG_AHB_ADDR
+        from hx83121a.spi import BURST_FRAMES, SpiBatch, hw_frame
+
+        self.xfer_many(SpiBatch(BURST_FRAMES + [hw_frame(REG_AHB_ADDR, struct.pack("<II", addr, value))], self.speed))
+
+
+class BrokerI2CMixin:
+    """Replaces the I2C_RDWR primitives of an AhbI2C-style class with broker calls."""
+
+    def __init__(self, bus_num: int = 4, client: BrokerClient | None = None):
+        self.bus_num = bus_num
+        self.fd = -1
+        self.client = client or BrokerClient()
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _i2c_write(self, addr, data):
+        self.client.i2c([(addr, 0, bytes(data))])
+
+    def _i2c_combined(self, addr, wdata, rlen):
+        return self.client.i2c([(addr, 0, bytes(wdata)), (addr, I2C_M_RD, rlen)])
+
+    def xfer_many(self, batch) -> None:
+        rx = self.client.i2c(batch.spec)
+        off = 0
+        for r in batch.rx:
+            n = len(r)
+            r[:] = rx[off : off + n]
+            off += n
+
+    def ahb_fetch32(self, addr):
+        from hx83121a.i2c import I2cBatch
+        from hx83121a.regs import I2C_ADDR_AHB, REG_AHB_ADDR, REG_AHB_DATA, REG_AHB_READ
+
+        batch = I2cBatch((
+            (I2C_ADDR_AHB, bytes([REG_AHB_ADDR]) + struct.pack("<I", addr)),
+            (I2C_ADDR_AHB, bytes([REG_AHB_READ, 0x00])),
+            (I2C_ADDR_AHB, bytes([REG_AHB_DATA])),
+            (I2C_ADDR_AHB, 4),
+        ))
+        self.xfer_many(batch)
+        return struct.unpack("<I", bytes(batch.rx[0]))[0]
+
+    def burst_enable(self, enable=True):
+        from hx83121a.i2c import I2cBatch
+        from hx83121a.regs import BURST_CONTINUOUS, I2C_ADDR_AHB, INCR4, INCR4_AUTO, REG_BURST, REG_INCR
+
+        self.xfer_many(I2cBatch((
+            (I2C_ADDR_AHB, bytes([REG_BURST, BURST_CONTINUOUS])),
+            (I2C_ADDR_AHB, bytes([REG_INCR, INCR4_AUTO if enable else INCR4])),
+        )))
+
+
+def session(bus):
+    """Hold the broker for a multi-request sequence on bus; a no-op on a direct bus."""
+    client = getattr(bus, "client", None)
+    return client.session() if isinstance(client, BrokerClient) else _NoSession()
+
+
+def broker_available() -> bool:
+    return os.environ.get("HX_BUS_BROKER", "1") != "0" and os.path.exists(SOCKET_PATH)
+
+
+def _client_for(i2c_bus: int | None = None, spi_dev: str | None = None) -> BrokerClient | None:
+    """A broker connection if the broker serves the requested bus, else None."""
+    if not broker_available():
+        return None
+    try:
+        client = BrokerClient()
+        bus, dev = client.served()
+    except OSError:
+        return None
+    if (i2c_bus is not None and bus != i2c_bus) or (spi_dev is not None and dev != spi_dev):
+        client.close()
+        return None
+    return client
+
+
+def open_spi(cls, dev: str, mode: int, speed: int):
+    """cls(dev, mode, speed), routed through the broker when it serves dev."""
+    client = _client_for(spi_dev=dev)
+    if client is None:
+        return cls(dev, mode, speed)
+    return type(f"Broker{cls.__name__}", (BrokerSpiMixin, cls), {})(dev, mode, speed, client)
+
+
+def open_i2c(cls, bus_num: int):
+    """cls(bus_num), routed through the broker when it serves bus_num."""
+    client = _client_for(i2c_bus=bus_num)
+    if client is None:
+        return cls(bus_num)
+    return type(f"Broker{cls.__name__}", (BrokerI2CMixin, cls), {})(bus_num, client)
@@ -0,0 +1,195 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Find the I2C adapter the HX83121A is on.
+
+regs.I2C_BUS and regs.HID_DEVICE are what this tablet's kernel happens
+to number the adapter; the number follows probe order and changes with
+kernel config and device tree. locate() returns where the chip is now:
+
+  1. HX83121A_I2C_BUS in the environment, taken as is
+  2. the cache (/var/lib/hx83121a/i2c.json): it records the firmware
+     node of the adapter (DT of_node, ACPI firmware_node, else the
+     parent device path), and if an adapter with that node exists its
+     current number is used without touching any bus
+  3. a probe of every /dev/i2c-* adapter, one thread per adapter: the
+     firmware must declare a client at 0x4F on that adapter (the DT
+     hid-over-i2c node, or its ACPI counterpart) or 0x4F must ACK, 0x48
+     must ACK, and IC_ID must read back from the AHB bridge; whether
+     the HID interface at 0x4F ACKs is recorded. Each adapter gets
+     I2C_TIMEOUT/no retries and the whole probe a deadline, so a hung
+     adapter costs at most PROBE_DEADLINE. A hit is written to the cache.
+  4. the regs defaults, if nothing answered
+
+resolve(bus) is locate() unless a bus was given on the command line.
+
+The cache is invalidated by the node disappearing (different DT/ACPI
+tables) or by locate(refresh=True) (`python3 -m hx83121a.discover
+--refresh`). The probe writes the AHB address register at 0x48 only on
+an adapter that has the touch controller's HID client (declared or
+answering) and where 0x48 ACKs an empty write, so other devices at 0x48
+are left alone.
+"""
+
+import os
+import sys
+import time
+from collections import namedtuple
+
+from hx83121a import profile
+from hx83121a.regs import HID_DEVICE, I2C_ADDR_AHB, I2C_ADDR_HID, I2C_BUS, IC_ID
+
+I2C_PROFILE = os.environ.get("HX83121A_I2C_PROFILE", os.path.join(profile.PROFILE_DIR, "i2c.json"))
+ADAPTER_DIR = "/sys/class/i2c-adapter"
+CLIENT_DIR = "/sys/bus/i2c/devices"
+
+I2C_RETRIES = 0x0701
+I2C_TIMEOUT = 0x0702        # units of 10 ms
+PROBE_TIMEOUT_10MS = 5      # per transfer
+PROBE_DEADLINE = 1.0        # all adapters, seconds
+
+
+# hid_device: i2c client name of the HID interface ("4-004f"); node: the
+# adapter's firmware node (cache key); source: env, cache, probe or default;
+# hid_ack: whether 0x4F answered, if that was checked.
+# (namedtuple rather than typing.NamedTuple: typing costs the recovery
+# service more import time than the rest of the package.)
+Location = namedtuple("Location", "bus hid_device node source hid_ack", defaults=(None,))
+
+
+def hid_client(bus: int) -> str:
+    return f"{bus}-{I2C_ADDR_HID:04x}"
+
+
+def adapter_node(bus: int) -> str | None:
+    """Stable identity of adapter i2c-<bus>: its DT/ACPI node or parent device."""
+    base = os.path.join(ADAPTER_DIR, f"i2c-{bus}")
+    for link in ("of_node", "firmware_node"):
+        path = os.path.join(base, link)
+        if os.path.islink(path):
+            return os.path.realpath(path)
+    if os.path.exists(base):
+        return os.path.dirname(os.path.realpath(base))
+    return None
+
+
+def adapters() -> list[int]:
+    try:
+        names = os.listdir(ADAPTER_DIR)
+    except OSError:
+        names = [n for n in os.listdir("/dev") if n.startswith("i2c-")]
+    return sorted(int(n[4:]) for n in names if n.startswith("i2c-") and n[4:].isdigit())
+
+
+def from_cache(path: str = I2C_PROFILE) -> Location | None:
+    cached = profile.read_json(path)
+    node = cached.get("node")
+    if not isinstance(node, str):
+        return None
+    hint = cached.get("bus")
+    # the cached number first: when nothing was renumbered it is the only lookup
+    order = ([hint] if isinstance(hint, int) else []) + adapters()
+    for bus in order:
+        if adapter_node(bus) == node:
+            return Location(bus, hid_client(bus), node, "cache", cached.get("hid_ack"))
+    return None
+
+
+def probe_adapter(bus: int) -> Location | None:
+    """IC ID at the AHB bridge on /dev/i2c-<bus>, or None."""
+    import fcntl
+
+    from hx83121a.i2c import AhbI2C
+
+    try:
+        dev = AhbI2C(bus)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(dev.fd, I2C_TIMEOUT, PROBE_TIMEOUT_10MS)
+        fcntl.ioctl(dev.fd, I2C_RETRIES, 0)
+        hid_ack = dev.probe(I2C_ADDR_HID)
+        declared = os.path.exists(os.path.join(CLIENT_DIR, hid_client(bus)))
+        if not (declared or hid_ack) or not dev.probe(I2C_ADDR_AHB) or dev.read_ic_id() != IC_ID:
+            return None
+        return Location(bus, hid_client(bus), adapter_node(bus), "probe", hid_ack)
+    except OSError:
+        return None
+    finally:
+        dev.close()
+
+
+def probe_all(deadline: float = PROBE_DEADLINE) -> list[Location]:
+    """Probe every adapter concurrently; adapters still busy at the deadline are skipped."""
+    import threading
+
+    found: list[Location] = []
+    lock = threading.Lock()
+
+    def worker(bus):
+        loc = probe_adapter(bus)
+        if loc:
+            with lock:
+                found.append(loc)
+
+    threads = [threading.Thread(target=worker, args=(bus,), daemon=True) for bus in adapters()]
+    for t in threads:
+        t.start()
+    end = time.monotonic() + deadline
+    for t in threads:
+        t.join(max(0.0, end - time.monotonic()))
+    with lock:
+        # prefer the adapter whose HID interface answers, then the lowest number
+        return sorted(found, key=lambda loc: (not loc.hid_ack, loc.bus))
+
+
+def save(loc: Location, path: str = I2C_PROFILE) -> None:
+    profile.write_json(path, {
+        "node": loc.node,
+        "bus": loc.bus,
+        "hid_ack": loc.hid_ack,
+        "device": profile.device_info(),
+        "updated": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    })
+
+
+def locate(refresh: bool = False, path: str = I2C_PROFILE) -> Location:
+    env = os.environ.get("HX83121A_I2C_BUS")
+    if env:
+        bus = int(env)
+        return Location(bus, hid_client(bus), adapter_node(bus), "env")
+    if not refresh:
+        loc = from_cache(path)
+        if loc:
+            return loc
+    found = probe_all()
+    if found:
+        loc = found[0]
+        if loc.node:
+            try:
+                save(loc, path)
+            except OSError:
+                pass  # read-only profile dir: probe again next time
+        return loc
+    return Location(I2C_BUS, HID_DEVICE, adapter_node(I2C_BUS), "default")
+
+
+def resolve(bus: int | None = None) -> Location:
+    """Location for a --i2c-bus option: an explicit bus wins, else locate()."""
+    if bus is None:
+        return locate()
+    return Location(bus, hid_client(bus), adapter_node(bus), "arg")
+
+
+def main() -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Locate the HX83121A I2C adapter.")
+    ap.add_argument("--refresh", action="store_true", help="ignore the cache and probe all adapters")
+    args = ap.parse_args()
+    loc = locate(refresh=args.refresh)
+    hid = "" if loc.hid_ack is None else f" hid_ack={'yes' if loc.hid_ack else 'no'}"
+    print(f"bus={loc.bus} hid={loc.hid_device} source={loc.source}{hid} node={loc.node or '-'}")
+    return 0 if loc.source != "default" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""I2C_RDWR transport for the HX83121A AHB bridge (/dev/i2c-4, 0x48).
+
+AhbI2C has the bus primitives (_i2c_write, _i2c_combined) and the
+register/AHB accessors built on them. Broker and emulator variants
+replace only the two primitives, so everything above runs unchanged.
+
+I2cBatch prebuilds one I2C_RDWR of up to I2C_RDWR_MAX_MSGS messages,
+the I2C counterpart of hx83121a.spi.SpiBatch; xfer_many() replays it
+with a single ioctl and no per-message Python work.
+
+AhbI2C.caps holds the adapter limits hx_caps.py measured (AHB bytes per
+write, bytes per read, messages per I2C_RDWR); callers size their
+chunks and batches from it. Without a profile for this adapter they are
+the conservative BUS_DEFAULTS.
+"""
+
+import ctypes
+import fcntl
+import os
+import struct
+from array import array
+
+from hx83121a import profile
+from hx83121a.regs import (
+    ADDR_IC_ID,
+    ADDR_IC_STATUS,
+    BURST_CONTINUOUS,
+    I2C_ADDR_AHB,
+    I2C_BUS,
+    INCR4,
+    INCR4_AUTO,
+    REG_AHB_ADDR,
+    REG_AHB_DATA,
+    REG_AHB_READ,
+    REG_BURST,
+    REG_INCR,
+)
+
+I2C_SLAVE_FORCE = 0x0706
+I2C_RDWR = 0x0707
+I2C_M_RD = 0x0001
+I2C_RDWR_MAX_MSGS = 42  # I2C_RDWR_IOCTL_MAX_MSGS in i2c-dev
+
+
+# === I2C Message Structure for I2C_RDWR ===
+class i2c_msg(ctypes.Structure):
+    _fields_ = [
+        ("addr", ctypes.c_ushort),
+        ("flags", ctypes.c_ushort),
+        ("len", ctypes.c_ushort),
+        ("buf", ctypes.POINTER(ctypes.c_ubyte)),
+    ]
+
+
+# native layout of i2c_msg, for building message arrays from bytes; buf
+# is the last field, at _PTR_SLOT of every _PTR_STRIDE pointer-sized words
+I2C_MSG = struct.Struct("@HHHP")
+assert I2C_MSG.size == ctypes.sizeof(i2c_msg)
+_PTR = "Q" if ctypes.sizeof(ctypes.c_void_p) == 8 else "I"
+_PTR_STRIDE = I2C_MSG.size // ctypes.sizeof(ctypes.c_void_p)
+_PTR_SLOT = _PTR_STRIDE - 1
+
+
+def i2c_caps(bus_num: int | None = None) -> dict:
+    """max_write/max_read/max_msgs from the bus profile.
+
+    Defaults if the profile was measured on a different adapter than
+    /dev/i2c-<bus_num> (the recorded firmware node no longer matches).
+    """
+    caps = profile.bus_caps()["i2c"]
+    node = caps.pop("node")
+    if bus_num is not None and node:
+        from hx83121a.discover import adapter_node
+
+        if adapter_node(bus_num) != node:
+            return dict(profile.BUS_DEFAULTS["i2c"])
+    caps["max_write"] = max(4, caps["max_write"] & ~3)
+    caps["max_msgs"] = min(caps["max_msgs"], I2C_RDWR_MAX_MSGS)
+    return caps
+
+
+class i2c_rdwr_ioctl_data(ctypes.Structure):
+    _fields_ = [
+        ("msgs", ctypes.POINTER(i2c_msg)),
+        ("nmsgs", ctypes.c_uint),
+    ]
+
+
+# native layout of i2c_rdwr_ioctl_data (msgs, nmsgs); padding stays zero
+_RDWR_ARG = struct.Struct("@PI")
+
+
+def pack_msgs(msgs, offset=0):
+    """(payload, table) for (addr, data) writes and (addr, n) reads.
+
+    Payloads (zeros for reads) are laid out back to back; table holds one
+    native i2c_msg per message whose buf is offset plus the payload's
+    position. relocate_msgs() turns those offsets into addresses.
+    """
+    data = []
+    ents = []
+    pack = I2C_MSG.pack
+    for addr, d in msgs:
+        flags = I2C_M_RD if isinstance(d, int) else 0
+        d = bytes(d)  # bytes(n): the n bytes a read lands in
+        ents.append(pack(addr, flags, len(d), offset))
+        data.append(d)
+        offset += len(d)
+    return b"".join(data), b"".join(ents)
+
+
+def relocate_msgs(table, base):
+    """Add base to every buf of a pack_msgs() table (a bytearray), in one pass."""
+    ptrs = memoryview(table).cast(_PTR)
+    ptrs[_PTR_SLOT::_PTR_STRIDE] = array(_PTR, map(base.__add__, ptrs[_PTR_SLOT::_PTR_STRIDE].tolist()))
+
+
+class I2cBatch:
+    """Prebuilt I2C_RDWR message list.
+
+    I2cBatch(msgs) takes (addr, data) writes and (addr, n) reads;
+    I2cBatch.view() wraps a slice of a larger relocated message table, so
+    many batches can share one payload buffer (hx_loadplan). After
+    xfer_many() read i is bytes(batch.rx[i]). Messages are separated by
+    repeated starts, as in the combined write+read AhbI2C already issues.
+    """
+
+    def __init__(self, msgs):
+        data, table = pack_msgs(msgs)
+        buf = (ctypes.c_ubyte * max(1, len(data))).from_buffer_copy(data.ljust(1, b"\0"))
+        table = bytearray(table)
+        relocate_msgs(table, ctypes.addressof(buf))
+        self._bind(buf, (i2c_msg * len(msgs)).from_buffer(table), 0, len(msgs))
+
+    @classmethod
+    def view(cls, buf, msgs, first, n):
+        """Batch of msgs[first:first + n]; buf is kept alive with it."""
+        self = cls.__new__(cls)
+        self._bind(buf, msgs, first, n)
+        return self
+
+    @classmethod
+    def singles(cls, buf, msgs, first, n):
+        """Yields a single-message batch per write in msgs[first:first + n].
+
+        For issuing a run of writes as separate I2C_RDWRs: the ioctl
+        arguments are filled in one array instead of a view() each, and
+        a batch need not outlive its transfer.
+        """
+        size = I2C_MSG.size
+        halves = size // 2
+        if I2C_M_RD in memoryview(msgs).cast("B").cast("H")[first * halves + 1 : (first + n) * halves : halves].tolist():
+            raise ValueError("singles() takes writes only")
+        args = (i2c_rdwr_ioctl_data * n)()
+        raw = memoryview(args).cast("B")
+        step = ctypes.sizeof(i2c_rdwr_ioctl_data)
+        base = ctypes.addressof(msgs) + first * size
+        pack = _RDWR_ARG.pack_into
+        new = cls.__new__
+        for i in range(n):
+            pack(raw, i * step, base + i * size, 1)
+            self = new(cls)
+            self.buf, self.msgs, self.first, self.n = buf, msgs, first + i, 1
+            self.data, self.rx, self._spec = args[i], [], None
+            yield self
+
+    def _bind(self, buf, msgs, first, n):
+        if not 0 < n <= I2C_RDWR_MAX_MSGS:
+            raise ValueError(f"I2C_RDWR takes 1..{I2C_RDWR_MAX_MSGS} messages, not {n}")
+        self.buf = buf
+        self.msgs = msgs
+        self.first = first
+        self.n = n
+        ptr = ctypes.cast(ctypes.addressof(msgs) + first * I2C_MSG.size, ctypes.POINTER(i2c_msg))
+        self.data = i2c_rdwr_ioctl_data(ptr, n)
+        self.rx = []
+        self._spec = None
+        halves = I2C_MSG.size // 2
+        flags = memoryview(msgs).cast("B").cast("H")[first * halves + 1 : (first + n) * halves : halves].tolist()
+        if I2C_M_RD in flags:
+            for i, f in enumerate(flags):
+                if f & I2C_M_RD:
+                    m = msgs[first + i]
+                    self.rx.append((ctypes.c_ubyte * m.len).from_address(ctypes.addressof(m.buf.contents)))
+
+    @property
+    def spec(self):
+        """(addr, flags, data | n) per message, as BrokerClient.i2c() takes them."""
+        if self._spec is None:
+            size = I2C_MSG.size
+            ents = memoryview(self.msgs).cast("B")[self.first * size : (self.first + self.n) * size]
+            buf = memoryview(self.buf).cast("B")
+            base = ctypes.addressof(self.buf)
+            self._spec = [
+                (addr, I2C_M_RD, n) if flags & I2C_M_RD else (addr, 0, bytes(buf[ptr - base : ptr - base + n]))
+                for addr, flags, n, ptr in I2C_MSG.iter_unpack(ents)
+            ]
+        return self._spec
+
+    def __len__(self):
+        return self.n
+
+
+class AhbI2C:
+    """I2C communication with HX83121A via AHB bridge."""
+
+    _caps = None
+
+    def __init__(self, bus_num=I2C_BUS):
+        self.fd = os.open(f"/dev/i2c-{bus_num}", os.O_RDWR)
+        self.bus_num = bus_num
+
+    def close(self):
+        os.close(self.fd)
+
+    @property
+    def caps(self):
+        """Adapter limits for this bus, read from the profile on first use."""
+        if self._caps is None:
+            self._caps = i2c_caps(self.bus_num)
+        return self._caps
+
+    def _i2c_combined(self, addr, wdata, rlen):
+        """Combined write+read I2C transaction (repeated start)."""
+        wbuf = (ctypes.c_ubyte * len(wdata))(*wdata)
+        rbuf = (ctypes.c_ubyte * rlen)()
+
+        msgs = (i2c_msg * 2)()
+        msgs[0].addr = addr
+        msgs[0].flags = 0  # write
+        msgs[0].len = len(wdata)
+        msgs[0].buf = ctypes.cast(wbuf, ctypes.POINTER(ctypes.c_ubyte))
+
+        msgs[1].addr = addr
+        msgs[1].flags = I2C_M_RD
+        msgs[1].len = rlen
+        msgs[1].buf = ctypes.cast(rbuf, ctypes.POINTER(ctypes.c_ubyte))
+
+        data = i2c_rdwr_ioctl_data()
+        data.msgs = msgs
+        data.nmsgs = 2
+
+        fcntl.ioctl(self.fd, I2C_RDWR, data)
+        return bytes(rbuf)
+
+    def _i2c_write(self, addr, data):
+        """Simple I2C write transaction."""
+        wbuf = (ctypes.c_ubyte * len(data))(*data)
+        msgs = (i2c_msg * 1)()
+        msgs[0].addr = addr
+        msgs[0].flags = 0
+        msgs[0].len = len(data)
+        msgs[0].buf = ctypes.cast(wbuf, ctypes.POINTER(ctypes.c_ubyte))
+
+        d = i2c_rdwr_ioctl_data()
+        d.msgs = msgs
+        d.nmsgs = 1
+
+        fcntl.ioctl(self.fd, I2C_RDWR, d)
+
+    def xfer_many(self, batch):
+        """Issue a prebuilt I2cBatch as one I2C_RDWR."""
+        fcntl.ioctl(self.fd, I2C_RDWR, batch.data)
+
+    def probe(self, addr):
+        """True if addr ACKs a zero-length write (i2ctransfer w0@addr)."""
+        try:
+            self._i2c_write(addr, [])
+        except OSError:
+            return False
+        return True
+
+    # === Direct I2C Register Access (NOT AHB) ===
+
+    def reg_write(self, reg, value):
+        """Write a single byte to I2C register (direct, not AHB)."""
+        self._i2c_write(I2C_ADDR_AHB, [reg, value])
+
+    def reg_read(self, reg):
+        """Read a single byte from I2C register (direct, not AHB)."""
+        data = self._i2c_combined(I2C_ADDR_AHB, [reg], 1)
+        return data[0]
+
+    # === AHB Bridge Access ===
+
+    def ahb_read(self, addr, length=4):
+        """Read from AHB address via I2C bridge (combined write+read)."""
+        addr_le = struct.pack("<I", addr)
+        wdata = [REG_AHB_ADDR] + list(addr_le)
+        return self._i2c_combined(I2C_ADDR_AHB, wdata, length)
+
+    def ahb_read32(self, addr):
+        """Read 32-bit value from AHB address."""
+        data = self.ahb_read(addr, 4)
+        return struct.unpack("<I", data)[0]
+
+    def ahb_fetch32(self, addr):
+        """Read a word with an explicit read trigger: address, 0x0C, then data register 0x08.
+
+        This is the sequence the recovery script polls the Boot ROM with.
+        """
+        self._i2c_write(I2C_ADDR_AHB, [REG_AHB_ADDR] + list(struct.pack("<I", addr)))
+        self._i2c_write(I2C_ADDR_AHB, [REG_AHB_READ, 0x00])
+        return struct.unpack("<I", self._i2c_combined(I2C_ADDR_AHB, [REG_AHB_DATA], 4))[0]
+
+    def ahb_write(self, addr, data_bytes):
+        """Write to AHB address via I2C bridge (single transaction)."""
+        addr_le = struct.pack("<I", addr)
+        wdata = [REG_AHB_ADDR] + list(addr_le) + list(data_bytes)
+        self._i2c_write(I2C_ADDR_AHB, wdata)
+
+    def ahb_write32(self, addr, value):
+        """Write 32-bit value to AHB address."""
+        self.ahb_write(addr, struct.pack("<I", value))
+
+    # === Burst Mode ===
+
+    def burst_enable(self, enable=True):
+        """Enable/disable burst mode (INCR4)."""
+        self.reg_write(REG_BURST, BURST_CONTINUOUS)
+        self.reg_write(REG_INCR, INCR4_AUTO if enable else INCR4)
+
+    def read_ic_id(self):
+        """Read IC identification."""
+        return self.ahb_read32(ADDR_IC_ID)
+
+    def read_status(self):
+        """Read IC status register."""
+        return self.ahb_read32(ADDR_IC_STATUS) & 0xFF
@@ -0,0 +1,209 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Prometheus metrics for the loader, recovery and touchpad services.
+
+The tools record into a per-thread registry with inc(), gauge() and
+observe(); that is a dict update, nothing is formatted or written until
+flush(tool) runs once at the end of a run (or after each activation in a
+resident daemon). Every sample carries a tool label.
+
+HX83121A_METRICS selects the sink:
+
+  unset / a directory   textfile-collector file <dir>/<tool>.prom
+                        (default /var/lib/node_exporter/textfile_collector;
+                        skipped if the directory does not exist). Written
+                        to a temporary file and renamed, so node_exporter
+                        never reads a partial file. Counters and histograms
+                        are cumulative across runs: the previous file is
+                        read back and this run's values are added.
+  unix:/path            the exposition text of this process as one
+                        datagram to a SOCK_DGRAM socket; the receiver
+                        aggregates runs
+  off                   nothing
+
+Metric names, types, help and buckets are defined in METRICS below, so
+every tool writes the same families. A failed flush is never an error
+for the tool.
+
+The registry is per thread: when bringup.py runs the recovery and the
+touchpad activation concurrently in one process, each flush writes only
+the samples its own tool recorded.
+"""
+
+import os
+from _thread import get_ident
+
+TEXTFILE_DIR = "/var/lib/node_exporter/textfile_collector"
+
+# seconds; Boot ROM waits are 0.1 s polls, loads take ~5-60 s over I2C
+SHORT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LONG_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "hx83121a_recovery_runs_total": (
+        "counter", "Recovery service runs by outcome (healthy, recovered, failed, no_device).", None),
+    "hx83121a_recovery_attempts_total": (
+        "counter", "Recovery sequences by result (ok, bootrom_timeout, hid_nack, no_input).", None),
+    "hx83121a_recovery_duration_seconds": (
+        "histogram", "Time from the first recovery attempt to the outcome.", LONG_BUCKETS),
+    "hx83121a_bootrom_wait_seconds": (
+        "histogram", "Time from the reset pulse to Boot ROM reporting firmware running.", SHORT_BUCKETS),
+    "hx83121a_firmware_loads_total": (
+        "counter", "Firmware loads over I2C by result and mode (interpreted, plan).", None),
+    "hx83121a_firmware_load_duration_seconds": (
+        "histogram", "Duration of a firmware load sequence.", LONG_BUCKETS),
+    "hx83121a_firmware_load_bytes_per_second": (
+        "gauge", "Partition bytes written per second by the last successful load.", None),
+    "hx83121a_bus_errors_total": (
+        "counter", "Failed bus transfers by bus and errno.", None),
+    "huawei_touchpad_activations_total": (
+        "counter", "Touchpad activations by trigger and outcome (active, reset, failed, no_cover).", None),
+    "huawei_touchpad_activation_seconds": (
+        "histogram", "Time from the activation trigger to the touchpad in Input Mode 3.", SHORT_BUCKETS),
+    "hx83121a_last_run_timestamp_seconds": (
+        "gauge", "Unix time of the tool's last metrics flush.", None),
+}
+
+_SUFFIXES = ("_bucket", "_sum", "_count")
+
+# thread id -> ({(series name, label string): value}, keys that are gauges)
+_registries: dict[int, tuple[dict[tuple[str, str], float], set[tuple[str, str]]]] = {}
+
+
+def _registry() -> tuple[dict, set]:
+    reg = _registries.get(get_ident())
+    if reg is None:
+        reg = _registries[get_ident()] = ({}, set())
+    return reg
+
+
+def _escape(value) -> str:
+    """A label value with backslash, double quote and newline escaped, as the exposition format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    samples, _ = _registry()
+    key = (name, _labels(labels))
+    samples[key] = samples.get(key, 0) + value
+
+
+def gauge(name: str, value: float, **labels) -> None:
+    samples, gauges = _registry()
+    key = (name, _labels(labels))
+    samples[key] = value
+    gauges.add(key)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    samples, _ = _registry()
+    lab = _labels(labels)
+    sep = "," if lab else ""
+    for le in METRICS[name][2]:
+        if value <= le:
+            key = (name + "_bucket", f'{lab}{sep}le="{le}"')
+            samples[key] = samples.get(key, 0) + 1
+    for suffix, v in (("_bucket", 1), ("_sum", value), ("_count", 1)):
+        key = (name + suffix, f'{lab}{sep}le="+Inf"' if suffix == "_bucket" else lab)
+        samples[key] = samples.get(key, 0) + v
+
+
+def bus_error(e: BaseException, bus: str = "i2c") -> None:
+    """Count e if it is a failed transfer (OSError)."""
+    if isinstance(e, OSError):
+        import errno
+
+        inc("hx83121a_bus_errors_total", bus=bus, errno=errno.errorcode.get(e.errno, str(e.errno)))
+
+
+def family(series: str) -> str:
+    if series not in METRICS:
+        for suffix in _SUFFIXES:
+            if series.endswith(suffix) and series[: -len(suffix)] in METRICS:
+                return series[: -len(suffix)]
+    return series
+
+
+def parse(text: str) -> dict[tuple[str, str], float]:
+    """Samples of an exposition written by render()."""
+    out = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        name, _, lab = series.partition("{")
+        try:
+            out[(name, lab[:-1])] = float(value)
+        except ValueError:
+            continue
+    return out
+
+
+def _order(sample: tuple) -> tuple:
+    """Sort key: series, then labels, histogram buckets in ascending le."""
+    name, lab, _ = sample
+    head, _, le = lab.partition('le="')
+    return name, head, float(le[:-1]) if le else 0.0
+
+
+def render(samples: dict[tuple[str, str], float]) -> str:
+    by_family: dict[str, list] = {}
+    for (name, lab), v in samples.items():
+        by_family.setdefault(family(name), []).append((name, lab, v))
+    out = []
+    for fam in sorted(by_family):
+        kind, help_text, _ = METRICS.get(fam, ("untyped", "", None))
+        out.append(f"# HELP {fam} {help_text}")
+        out.append(f"# TYPE {fam} {kind}")
+        for name, lab, v in sorted(by_family[fam], key=_order):
+            v = int(v) if v == int(v) else repr(v)
+            out.append(f"{name}{{{lab}}} {v}" if lab else f"{name} {v}")
+    return "\n".join(out) + "\n"
+
+
+def _merge(previous: dict, tool_label: str, samples: dict, gauges: set) -> dict:
+    """previous plus samples: gauges replace, the rest add."""
+    merged = dict(previous)
+    for (name, lab), v in samples.items():
+        key = (name, f"{tool_label},{lab}" if lab else tool_label)
+        if (name, lab) in gauges:
+            merged[key] = v
+        else:
+            merged[key] = merged.get(key, 0) + v
+    return merged
+
+
+def flush(tool: str) -> None:
+    """Write this thread's samples for tool to the configured sink, then reset them."""
+    import time
+
+    target = os.environ.get("HX83121A_METRICS", TEXTFILE_DIR)
+    if target == "off":
+        _registries.pop(get_ident(), None)
+        return
+    gauge("hx83121a_last_run_timestamp_seconds", round(time.time()))
+    samples, gauges = _registries.pop(get_ident())
+    tool_label = _labels({"tool": tool})
+    try:
+        if target.startswith("unix:"):
+            import socket
+
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+                s.sendto(render(_merge({}, tool_label, samples, gauges)).encode(), target[5:])
+        elif os.path.isdir(target):
+            path = os.path.join(target, f"{tool}.prom")
+            try:
+                with open(path) as f:
+                    previous = parse(f.read())
+            except OSError:
+                previous = {}
+            tmp = f"{path}.tmp.{os.getpid()}"
+            with open(tmp, "w") as f:
+                f.write(render(_merge(previous, tool_label, samples, gauges)))
+            os.replace(tmp, path)
+    except OSError:
+        pass  # no collector running or read-only: metrics are best effort
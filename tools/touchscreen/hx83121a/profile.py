@@ -0,0 +1,145 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Per-device tuning profiles for the HX83121A tools.
+
+Profiles are small JSON files under /var/lib/hx83121a written by the
+tuning tools and read by the loader, recovery and probe scripts at
+startup. A missing or unreadable profile is never an error: every
+consumer falls back to its built-in defaults.
+
+json and socket are imported on first use: the recovery service reads
+its timing profile at boot, and with no profile it never needs either.
+"""
+
+import os
+import time
+
+PROFILE_DIR = os.environ.get("HX83121A_PROFILE_DIR", "/var/lib/hx83121a")
+TIMING_PROFILE = os.environ.get("HX83121A_TIMING_PROFILE", os.path.join(PROFILE_DIR, "timing.json"))
+SPI_PROFILE = os.environ.get("HX83121A_SPI_PROFILE", os.path.join(PROFILE_DIR, "spi.json"))
+SRAM_CRC_PROFILE = os.environ.get("HX83121A_SRAM_CRC_PROFILE", os.path.join(PROFILE_DIR, "sram_crc.json"))
+BUS_PROFILE = os.environ.get("HX83121A_BUS_PROFILE", os.path.join(PROFILE_DIR, "bus.json"))
+
+SPI_DEFAULTS = {"dev": "/dev/spidev0.0", "mode": 3, "speed": 1_000_000}
+
+# Transport limits until hx_caps.py has measured them: 4-byte AHB writes,
+# i2c-dev's 42 messages per I2C_RDWR, spidev's default bufsiz.
+BUS_DEFAULTS = {
+    "i2c": {"max_write": 4, "max_read": 4088, "max_msgs": 42},
+    "spi": {"bufsiz": 4096},
+}
+
+
+def read_json(path: str) -> dict:
+    try:
+        with open(path) as f:
+            import json
+
+            doc = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return doc if isinstance(doc, dict) else {}
+
+
+def write_json(path: str, doc: dict) -> None:
+    """Write atomically so a crash never leaves a half-written profile."""
+    import json
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+        f.write("\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def device_info() -> dict:
+    import socket
+
+    info = {"host": socket.gethostname()}
+    for key in ("product_name", "product_serial", "bios_version"):
+        try:
+            with open(f"/sys/class/dmi/id/{key}") as f:
+                info[key] = f.read().strip()
+        except OSError:
+            pass
+    return info
+
+
+def load_timing(prefix: str, defaults: dict[str, float], path: str = TIMING_PROFILE) -> dict[str, float]:
+    """Return defaults overlaid with "<prefix>.<name>" entries from the profile."""
+    delays = dict(defaults)
+    stored = read_json(path).get("delays", {})
+    for name in delays:
+        v = stored.get(f"{prefix}.{name}")
+        if isinstance(v, (int, float)) and v >= 0:
+            delays[name] = float(v)
+    return delays
+
+
+def save_timing(delays: dict[str, float], results: dict | None = None, path: str = TIMING_PROFILE) -> None:
+    """Merge fully-qualified delays (seconds) into the timing profile."""
+    doc = read_json(path)
+    doc.setdefault("delays", {}).update(delays)
+    if results:
+        doc.setdefault("results", {}).update(results)
+    doc["device"] = device_info()
+    doc["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    write_json(path, doc)
+
+
+def spi_defaults(path: str = SPI_PROFILE) -> dict:
+    """SPI dev/mode/speed, from spi_bench.py's last stable result."""
+    cfg = dict(SPI_DEFAULTS)
+    stored = read_json(path)
+    for key, default in SPI_DEFAULTS.items():
+        if isinstance(stored.get(key), type(default)):
+            cfg[key] = stored[key]
+    return cfg
+
+
+def save_spi(cfg: dict, results: list | None = None, path: str = SPI_PROFILE) -> None:
+    doc = {k: cfg[k] for k in SPI_DEFAULTS}
+    if results is not None:
+        doc["results"] = results
+    doc["device"] = device_info()
+    doc["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    write_json(path, doc)
+
+
+def bus_caps(path: str = BUS_PROFILE) -> dict:
+    """{"i2c": {...}, "spi": {...}} limits: BUS_DEFAULTS overlaid with hx_caps.py's probe.
+
+    The i2c part also has "node", the firmware node of the adapter that
+    was probed (None if unknown), so a caller can tell whether the limits
+    apply to the bus it opened.
+    """
+    stored = read_json(path)
+    caps = {}
+    for bus, defaults in BUS_DEFAULTS.items():
+        got = stored.get(bus)
+        got = got if isinstance(got, dict) else {}
+        caps[bus] = {k: got[k] if isinstance(got.get(k), int) and got[k] > 0 else v for k, v in defaults.items()}
+    node = stored.get("i2c", {}).get("node") if isinstance(stored.get("i2c"), dict) else None
+    caps["i2c"]["node"] = node if isinstance(node, str) else None
+    return caps
+
+
+def save_bus_caps(doc: dict, path: str = BUS_PROFILE) -> None:
+    doc = dict(doc)
+    doc["device"] = device_info()
+    doc["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    write_json(path, doc)
+
+
+def load_sram_crc(image_sha256: str, path: str = SRAM_CRC_PROFILE) -> dict[str, int]:
+    """Per-partition hw_crc_check() baseline recorded for one firmware image."""
+    crc = read_json(path).get(image_sha256, {}).get("crc", {})
+    return {k: v for k, v in crc.items() if isinstance(v, int)}
+
+
+def save_sram_crc(image_sha256: str, crc: dict[str, int], path: str = SRAM_CRC_PROFILE) -> None:
+    doc = read_json(path)
+    doc[image_sha256] = {"crc": crc, "device": device_info(), "updated": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+    write_json(path, doc)
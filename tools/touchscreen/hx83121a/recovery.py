@@ -0,0 +1,273 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+HX83121A Touch Recovery Service
+Triggers Boot ROM via GPIO reset if touchscreen HID is not functional.
+
+Key findings:
+- 0x4F (HID) only ACKs when GPIO 174 is actively driven LOW (OE=1)
+- Panel driver resets GPIO 99 (TDDI shared reset) during init, killing touch
+- After GPIO reset, a failed bind attempt (174 HIGH) is needed to "wake" HID
+- Then unbind + set 174 LOW + rebind succeeds
+
+Entry point: hx83121a-touch-recovery (hx83121a-touch-recovery.service).
+Runs early in boot, so bus access goes through I2C_RDWR ioctls and sysfs
+writes instead of i2ctransfer/dmesg/bash child processes, and only
+cheap modules are imported (see hx_importtime.py).
+
+Run outcome, attempt results, Boot ROM wait and recovery duration are
+exported through hx83121a.metrics (hx83121a_recovery.prom).
+"""
+import mmap
+import os
+import struct
+import time
+
+from hx83121a import broker, discover, metrics, profile, rt
+from hx83121a.i2c import AhbI2C
+from hx83121a.regs import ADDR_IC_STATUS, HID_DEVICE, I2C_ADDR_HID, I2C_BUS, STATUS_FW_RUNNING
+
+TLMM_BASE = 0x0F100000
+HID_DRIVER = "/sys/bus/i2c/drivers/i2c_hid_of"
+PANEL_INIT_MSG = b"Init sequence completed"
+
+# Sequence delays in seconds. hx_delay_tune.py stores validated minimums
+# as "recovery.<name>" in the timing profile.
+DELAYS = profile.load_timing("recovery", {
+    "unbind": 0.3,
+    "gpio174_settle": 0.01,
+    "reset_pulse": 0.05,
+    "bootrom_poll": 0.1,
+    "bootrom_timeout": 5.0,
+    "wake_bind": 1.0,
+    "hid_low_settle": 0.5,
+    "bind_settle": 2.0,
+    "panel_settle": 0.5,
+    "panel_timeout": 5.0,
+    "retry": 2.0,
+})
+
+def log(msg):
+    print(f"hx83121a: {msg}", flush=True)
+
+def mmio_rw(addr, val=None):
+    page = addr & ~0xFFF
+    off = addr & 0xFFF
+    fd = None
+    m = None
+    try:
+        fd = os.open("/dev/mem", os.O_RDWR | os.O_SYNC)
+        m = mmap.mmap(fd, 0x1000, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=page)
+        if val is not None:
+            m[off:off+4] = struct.pack("<I", val)
+        return struct.unpack("<I", m[off:off+4])[0]
+    finally:
+        if m:
+            m.close()
+        if fd is not None:
+            os.close(fd)
+
+def open_bus(bus_num=I2C_BUS):
+    return broker.open_i2c(AhbI2C, bus_num)
+
+def ahb_read32(bus, addr):
+    try:
+        return bus.ahb_fetch32(addr)
+    except OSError as e:
+        metrics.bus_error(e)
+        return None
+
+def check_hid_responds(bus):
+    return bus.probe(I2C_ADDR_HID)
+
+def check_touch_input():
+    try:
+        with open("/proc/bus/input/devices", "rb") as f:
+            return b"4858:121A" in f.read()
+    except OSError:
+        return False
+
+def hid_driver(action, device=HID_DEVICE):
+    try:
+        with open(f"{HID_DRIVER}/{action}", "w") as f:
+            f.write(device)
+    except OSError:
+        pass  # already (un)bound
+
+def unbind_hid(device=HID_DEVICE):
+    hid_driver("unbind", device)
+    time.sleep(DELAYS["unbind"])
+
+def bind_hid(device=HID_DEVICE):
+    hid_driver("bind", device)
+
+def wait_panel_init(timeout):
+    """Wait for the panel driver's init message in the kernel log.
+
+    Reads /dev/kmsg (backlog first, then new records) instead of running
+    dmesg every 100 ms; falls back to polling dmesg if kmsg is not
+    readable.
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        fd = os.open("/dev/kmsg", os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        fd = None
+    if fd is None:
+        import subprocess
+
+        while time.monotonic() < deadline:
+            r = subprocess.run(["dmesg"], capture_output=True)
+            if PANEL_INIT_MSG in r.stdout:
+                return True
+            time.sleep(0.1)
+        return False
+    import select
+
+    try:
+        while True:
+            try:
+                if PANEL_INIT_MSG in os.read(fd, 8192):
+                    return True
+                continue
+            except BlockingIOError:
+                pass
+            except BrokenPipeError:
+                continue  # records overwritten while reading; next read resyncs
+            left = deadline - time.monotonic()
+            if left <= 0 or not select.select([fd], [], [], left)[0]:
+                return False
+    finally:
+        os.close(fd)
+
+def recover_touch(bus, hid_device=HID_DEVICE):
+    """
+    Proven recovery sequence (matches gpio_reset2.py two-round flow):
+    Round 1: unbind → GPIO174 HIGH → GPIO99 reset → Boot ROM → bind (expected to fail, wakes HID)
+    Round 2: unbind → GPIO174 actively LOW → verify 0x4F ACK → bind (succeeds)
+    """
+    gpio174_cfg_addr = TLMM_BASE + 174 * 0x1000
+    gpio174_io_addr = gpio174_cfg_addr + 4
+    gpio99_cfg_addr = TLMM_BASE + 99 * 0x1000
+    gpio99_io_addr = gpio99_cfg_addr + 4
+
+    cfg174_orig = mmio_rw(gpio174_cfg_addr)
+    cfg99_orig = mmio_rw(gpio99_cfg_addr)
+
+    # === Round 1: GPIO reset with 174 HIGH, bind (will likely fail) ===
+    unbind_hid(hid_device)
+
+    # GPIO 174 HIGH (I2C mode select)
+    mmio_rw(gpio174_cfg_addr, cfg174_orig | (1 << 9))
+    mmio_rw(gpio174_io_addr, 0x02)
+    time.sleep(DELAYS["gpio174_settle"])
+
+    # GPIO 99 reset pulse
+    mmio_rw(gpio99_cfg_addr, cfg99_orig | (1 << 9))
+    mmio_rw(gpio99_io_addr, 0x00)
+    pulse = rt.precise_sleep(DELAYS["reset_pulse"])
+    mmio_rw(gpio99_io_addr, 0x02)
+    log(f"Reset pulse {pulse * 1000:.2f} ms (requested {DELAYS['reset_pulse'] * 1000:.1f} ms)")
+    mmio_rw(gpio99_cfg_addr, cfg99_orig & ~(1 << 9))
+
+    # Wait for Boot ROM
+    boot_ok = False
+    t0 = time.monotonic()
+    late_max = 0.0
+    while time.monotonic() - t0 < DELAYS["bootrom_timeout"]:
+        late_max = max(late_max, rt.precise_sleep(DELAYS["bootrom_poll"]) - DELAYS["bootrom_poll"])
+        status = ahb_read32(bus, ADDR_IC_STATUS)
+        if status == STATUS_FW_RUNNING:
+            log(f"Boot ROM loaded firmware in {time.monotonic() - t0:.2f}s (poll late max {late_max * 1000:.2f} ms)")
+            metrics.observe("hx83121a_bootrom_wait_seconds", time.monotonic() - t0)
+            boot_ok = True
+            break
+
+    if not boot_ok:
+        log("Boot ROM timeout")
+        metrics.inc("hx83121a_recovery_attempts_total", result="bootrom_timeout")
+        mmio_rw(gpio174_io_addr, 0x00)
+        mmio_rw(gpio174_cfg_addr, cfg174_orig)
+        return False
+
+    # Bind with 174 HIGH (expected to fail, but wakes HID interface)
+    log("Round 1: bind with 174 HIGH (wake HID)...")
+    bind_hid(hid_device)
+    time.sleep(DELAYS["wake_bind"])
+
+    # === Round 2: unbind, set 174 LOW, rebind ===
+    log("Round 2: unbind + 174 LOW + rebind...")
+    unbind_hid(hid_device)
+
+    # GPIO 174 actively driven LOW (keep OE=1!)
+    mmio_rw(gpio174_io_addr, 0x00)
+    time.sleep(DELAYS["hid_low_settle"])
+
+    if not check_hid_responds(bus):
+        log("0x4F still NACK after 174 LOW")
+        metrics.inc("hx83121a_recovery_attempts_total", result="hid_nack")
+        return False
+
+    log("0x4F ACK confirmed")
+    bind_hid(hid_device)
+    time.sleep(DELAYS["bind_settle"])
+
+    if check_touch_input():
+        log("Touch recovered!")
+        metrics.inc("hx83121a_recovery_attempts_total", result="ok")
+        return True
+
+    log("Bind OK but no input devices")
+    metrics.inc("hx83121a_recovery_attempts_total", result="no_input")
+    return False
+
+def run():
+    rt_mode = rt.realtime_from_env()
+    if rt_mode:
+        log("RT mode: " + " ".join(f"{k}={v}" for k, v in rt_mode.items()))
+    loc = discover.locate()
+    log(f"I2C bus {loc.bus} ({loc.source})")
+    if not os.path.exists(f"/sys/bus/i2c/devices/{loc.hid_device}"):
+        log("I2C device not found, skipping")
+        metrics.inc("hx83121a_recovery_runs_total", outcome="no_device")
+        return 0
+
+    # Wait for panel driver to finish init (resets GPIO99 at ~3.9s, done by ~5s)
+    log("Waiting for panel init...")
+    if wait_panel_init(DELAYS["panel_timeout"]):
+        log("Panel init done")
+    else:
+        log("Panel init not detected, proceeding anyway")
+    time.sleep(DELAYS["panel_settle"])  # small settle time after panel init
+
+    bus = open_bus(loc.bus)
+    try:
+        # Check if touch is already functional
+        if check_touch_input() and check_hid_responds(bus):
+            log("Touchscreen working (HID responsive)")
+            metrics.inc("hx83121a_recovery_runs_total", outcome="healthy")
+            return 0
+
+        log("Touch not functional, attempting recovery...")
+
+        t0 = time.monotonic()
+        for attempt in range(1, 4):
+            log(f"Attempt {attempt}/3")
+            if recover_touch(bus, loc.hid_device):
+                metrics.inc("hx83121a_recovery_runs_total", outcome="recovered")
+                metrics.observe("hx83121a_recovery_duration_seconds", time.monotonic() - t0, outcome="recovered")
+                return 0
+            time.sleep(DELAYS["retry"])
+        metrics.observe("hx83121a_recovery_duration_seconds", time.monotonic() - t0, outcome="failed")
+    finally:
+        bus.close()
+
+    log("Recovery failed")
+    metrics.inc("hx83121a_recovery_runs_total", outcome="failed")
+    bind_hid(loc.hid_device)
+    return 1
+
+def main():
+    try:
+        return run()
+    finally:
+        metrics.flush("hx83121a_recovery")
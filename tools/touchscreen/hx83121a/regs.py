@@ -0,0 +1,66 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""HX83121A register map (see the AHB memory map in docs/TOUCHSCREEN.md).
+
+Values follow Xiaomi's hxchipset driver (himax_ic_HX83121.c) and the
+probing recorded in docs/TOUCHSCREEN.md.
+"""
+
+# === Bus addresses ===
+I2C_BUS = 4                 # /dev/i2c-4
+I2C_ADDR_AHB = 0x48         # AHB bridge
+I2C_ADDR_HID = 0x4F         # HID-over-I2C interface
+HID_DEVICE = "4-004f"       # i2c_hid_of device name
+
+# === Bridge registers ===
+# SPI frames are F2 <reg> <payload> (write) and F3 <reg> 00 <n bytes>
+# (read); over I2C the register is the first byte of the transfer.
+SPI_WRITE = 0xF2
+SPI_READ = 0xF3
+REG_AHB_ADDR = 0x00         # address (+ data words for a write)
+REG_AHB_DATA = 0x08         # read data
+REG_AHB_READ = 0x0C         # trigger a read of REG_AHB_ADDR
+REG_INCR = 0x0D             # INCR_4 (0x12), + auto-increment (0x13)
+REG_BURST = 0x13            # burst continuous mode (0x31)
+REG_EVENT = 0x30            # touch event plane
+REG_SAFE_PW1 = 0x31
+REG_SAFE_PW2 = 0x32
+
+BURST_CONTINUOUS = 0x31
+INCR4 = 0x12
+INCR4_AUTO = 0x13
+SAFE_PW = (0x27, 0x95)      # REG_SAFE_PW1, REG_SAFE_PW2
+
+# === AHB addresses ===
+ADDR_CODE_SRAM = 0x08000000
+ADDR_SYSTEM_RESET = 0x90000018
+ADDR_ACTIV_RELOD = 0x90000048
+ADDR_FW_ISR_CTRL = 0x9000005C
+ADDR_LEAVE_SAFE = 0x90000098
+ADDR_IC_STATUS = 0x900000A8
+ADDR_HANDSHAKE = 0x900000AC
+ADDR_IC_ID = 0x900000D0
+ADDR_TCON_RESET = 0x80020020
+ADDR_ADC_RESET = 0x80020094
+ADDR_RAW_OUT_SEL = 0x800204B4
+ADDR_RELOAD_STATUS = 0x80050000
+ADDR_RELOAD_CRC32 = 0x80050018
+ADDR_CRC_ADDR = 0x80050020
+ADDR_CRC_CMD = 0x80050028
+ADDR_FLASH_RELOAD = 0x10007F00
+ADDR_SORTING_MODE = 0x10007F04
+ADDR_RELOAD_DONE = 0x100072C0
+ADDR_N_FRAME = 0x10007294
+ADDR_RAW_OUT_SEL_FW = 0x100072EC
+
+CODE_SRAM_SIZE = 0x40000
+
+# === Values ===
+IC_ID = 0x83121A00
+DATA_SYSTEM_RESET = 0x00000055
+DATA_FW_STOP = 0x000000A5
+DATA_ACTIV_RELOD = 0x000000EC
+DATA_LEAVE_SAFE = 0x00000053
+STATUS_IDLE = 0x04
+STATUS_FW_RUNNING = 0x05
+STATUS_SAFE_MODE = 0x0C
+PROTECTED_WORD = 0x78787878  # code SRAM reads while firmware runs
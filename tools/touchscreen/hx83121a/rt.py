@@ -0,0 +1,150 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Opt-in real-time execution for timing-critical HX83121A bus loops.
+
+enter_realtime() moves the calling process to SCHED_FIFO (reset on fork,
+so helper processes stay ordinary CFS tasks), pins it to one CPU and
+locks current and future memory with mlockall(). Each step is best
+effort: without CAP_SYS_NICE/CAP_IPC_LOCK the tool still runs and the
+returned summary says what could not be applied.
+
+Pacer and precise_sleep() wait on absolute deadlines (coarse sleep, then
+a short spin) and record requested vs achieved timing, so a run can tell
+whether a timing-dependent failure came from the device or the host.
+
+Environment for tools without command-line flags (loader, recovery):
+  HX83121A_RT=1  HX83121A_RT_PRIO=50  HX83121A_RT_CPU=3
+"""
+
+import array
+import os
+import time
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+SPIN_S = 0.0002  # final stretch busy-waited instead of slept
+
+
+def enter_realtime(priority: int = 50, cpu: int | None = None, lock: bool = True) -> dict:
+    done: dict[str, str] = {}
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+            done["affinity"] = f"cpu{cpu}"
+        except OSError as e:
+            done["affinity"] = f"failed: {e.strerror}"
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO | os.SCHED_RESET_ON_FORK, os.sched_param(priority))
+        done["sched"] = f"SCHED_FIFO/{priority}"
+    except OSError as e:
+        done["sched"] = f"failed: {e.strerror}"
+    if lock:
+        import ctypes
+        import ctypes.util  # slow (pulls in subprocess); only needed here
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) == 0:
+            done["mlockall"] = "ok"
+        else:
+            done["mlockall"] = f"failed: {os.strerror(ctypes.get_errno())}"
+    return done
+
+
+def realtime_from_env() -> dict | None:
+    if os.environ.get("HX83121A_RT", "0") != "1":
+        return None
+    cpu = os.environ.get("HX83121A_RT_CPU")
+    return enter_realtime(int(os.environ.get("HX83121A_RT_PRIO", "50")), int(cpu) if cpu else None)
+
+
+def prefault(*buffers) -> None:
+    """Touch every page of writable scratch buffers (contents are zeroed)."""
+    import ctypes
+
+    for b in buffers:
+        ctypes.memset(ctypes.addressof(b), 0, ctypes.sizeof(b))
+
+
+class JitterMeter:
+    """Requested vs achieved durations in preallocated arrays."""
+
+    def __init__(self, capacity: int = 4096):
+        self.requested = array.array("d", bytes(8 * capacity))
+        self.achieved = array.array("d", bytes(8 * capacity))
+        self.n = 0
+
+    def add(self, requested: float, achieved: float) -> None:
+        if self.n < len(self.achieved):
+            self.requested[self.n] = requested
+            self.achieved[self.n] = achieved
+            self.n += 1
+
+    def report(self) -> dict:
+        if not self.n:
+            return {"samples": 0}
+        err = sorted((self.achieved[i] - self.requested[i]) * 1e6 for i in range(self.n))
+        n = len(err)
+        return {
+            "samples": n,
+            "requested_ms_mean": round(sum(self.requested[:n]) / n * 1000, 3),
+            "achieved_ms_mean": round(sum(self.achieved[:n]) / n * 1000, 3),
+            "late_us_p50": round(err[n // 2], 1),
+            "late_us_p99": round(err[min(n - 1, n * 99 // 100)], 1),
+            "late_us_max": round(err[-1], 1),
+            "early_us_max": round(max(0.0, -err[0]), 1),
+        }
+
+    def line(self, tag: str) -> str:
+        r = self.report()
+        if not r["samples"]:
+            return f"{tag}: no samples"
+        return (
+            f"{tag}: n={r['samples']} requested={r['requested_ms_mean']}ms achieved={r['achieved_ms_mean']}ms "
+            f"late_us p50={r['late_us_p50']} p99={r['late_us_p99']} max={r['late_us_max']}"
+        )
+
+
+def sleep_until(deadline: float) -> None:
+    now = time.perf_counter()
+    if deadline - now > SPIN_S:
+        time.sleep(deadline - now - SPIN_S)
+    while time.perf_counter() < deadline:
+        pass
+
+
+def precise_sleep(seconds: float, meter: JitterMeter | None = None) -> float:
+    """Sleep to an absolute deadline; returns the achieved duration."""
+    t0 = time.perf_counter()
+    sleep_until(t0 + seconds)
+    achieved = time.perf_counter() - t0
+    if meter is not None:
+        meter.add(seconds, achieved)
+    return achieved
+
+
+class Pacer:
+    """Fixed-rate loop on absolute deadlines; a late tick does not shift later ones.
+
+    A tick that finds its deadline passed runs at once; the next deadline
+    is the first one of the original grid after it, and missed counts the
+    deadlines that went by.
+    """
+
+    def __init__(self, interval: float, meter: JitterMeter | None = None):
+        self.interval = interval
+        self.meter = meter or JitterMeter()
+        self.next = time.perf_counter() + interval
+        self.last = time.perf_counter()
+        self.missed = 0
+
+    def wait(self) -> None:
+        now = time.perf_counter()
+        if now > self.next:
+            late = int((now - self.next) // self.interval) + 1
+            self.missed += late
+            self.next += late * self.interval
+        else:
+            sleep_until(self.next)
+            self.next += self.interval
+        t = time.perf_counter()
+        self.meter.add(self.interval, t - self.last)
+        self.last = t
@@ -0,0 +1,261 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""spidev transport for the HX83121A SPI bridge.
+
+SpiBus sends one chip-select frame per ioctl (hw/hr register access,
+ar/aw AHB words). SpiBatch prebuilds an SPI_IOC_MESSAGE(n) so a fixed
+list of frames costs a single ioctl; hot loops build it once and replay
+it with xfer_many().
+
+spidev rejects a message longer than its bufsiz with EMSGSIZE, so frames
+and batches above the limit (SRAM bursts, event-plane reads, dumps) are
+split into several messages by split_frames(): whole frames where they
+fit, and a frame too long for one message is cut with chip select held
+asserted across the cut. The limit is read from sysfs when the bus is
+opened and halved if spidev still rejects a message.
+"""
+
+import array
+import ctypes
+import errno
+import fcntl
+import os
+import struct
+
+from hx83121a.regs import (
+    BURST_CONTINUOUS,
+    INCR4,
+    REG_AHB_ADDR,
+    REG_AHB_DATA,
+    REG_AHB_READ,
+    REG_BURST,
+    REG_INCR,
+    SPI_READ,
+    SPI_WRITE,
+)
+
+SPI_IOC_WR_MODE = 0x40016B01
+SPI_IOC_WR_BITS_PER_WORD = 0x40016B03
+SPI_IOC_WR_MAX_SPEED_HZ = 0x40046B04
+
+# spidev rejects messages whose summed tx or rx length exceeds its bufsiz
+# module parameter (4096 by default), and _IOC_SIZE caps n at 511.
+SPI_MAX_MESSAGE_BYTES = 4096
+SPI_MAX_MESSAGE_XFERS = 511
+SPI_MIN_MESSAGE_BYTES = 64  # EMSGSIZE below this is not a bufsiz problem
+
+
+def spi_ioc_message(n: int) -> int:
+    return 0x40006B00 | (n * 32 << 16)
+
+
+def spidev_bufsiz() -> int:
+    try:
+        with open("/sys/module/spidev/parameters/bufsiz") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        # sysfs unreadable (e.g. in a container): what hx_caps.py measured
+        from hx83121a import profile
+
+        return profile.bus_caps()["spi"]["bufsiz"]
+
+
+def split_frames(lengths: list[int], limit: int, max_xfers: int = SPI_MAX_MESSAGE_XFERS) -> list[list[tuple]]:
+    """Lay frames of the given lengths out as messages spidev accepts.
+
+    Returns one list of (frame, offset, length, cs_change) per message,
+    none longer than limit bytes or max_xfers transfers. A frame that does
+    not fit the room left starts a new message if it fits a whole one,
+    else it is cut. Within a message cs_change ends a frame as in
+    SpiBatch; on a message's last transfer it means the opposite, so a
+    cut frame keeps chip select asserted into the next message and the
+    device still sees one frame.
+    """
+    messages = []
+    msg: list[list[int]] = []
+    used = 0
+    for i, n in enumerate(lengths):
+        off = 0
+        while off < n:
+            if msg and (len(msg) == max_xfers or used == limit or (off == 0 and n - off <= limit < used + n)):
+                messages.append(msg)
+                msg, used = [], 0
+            k = min(n - off, limit - used)
+            msg.append([i, off, k, 0])
+            used += k
+            off += k
+    if msg:
+        messages.append(msg)
+    for msg in messages:
+        for piece in msg:
+            piece[3] = int(piece[1] + piece[2] == lengths[piece[0]])
+        msg[-1][3] ^= 1
+    return [[tuple(p) for p in msg] for msg in messages]
+
+
+class SpiIocTransfer(ctypes.Structure):
+    _fields_ = [
+        ("tx_buf", ctypes.c_uint64),
+        ("rx_buf", ctypes.c_uint64),
+        ("len", ctypes.c_uint32),
+        ("speed_hz", ctypes.c_uint32),
+        ("delay_usecs", ctypes.c_uint16),
+        ("bits_per_word", ctypes.c_uint8),
+        ("cs_change", ctypes.c_uint8),
+        ("tx_nbits", ctypes.c_uint8),
+        ("rx_nbits", ctypes.c_uint8),
+        ("word_delay_usecs", ctypes.c_uint8),
+        ("pad", ctypes.c_uint8),
+    ]
+
+
+class SpiBatch:
+    """Prebuilt SPI_IOC_MESSAGE(n): one ioctl for a fixed list of transfers.
+
+    Every transfer is its own chip-select frame (cs_change between them),
+    exactly as if each had been sent with SpiBus.xfer(). A batch longer
+    than the bus's bufsiz is sent as the messages(limit) layout instead.
+    """
+
+    def __init__(self, frames: list[bytes], speed: int):
+        n = len(frames)
+        self.speed = speed
+        self.size = sum(map(len, frames))
+        self._split: dict[int, list] = {}
+        self.request = spi_ioc_message(n)
+        self.xfers = (SpiIocTransfer * n)()
+        self.tx = [(ctypes.c_uint8 * len(f)).from_buffer_copy(f) for f in frames]
+        self.rx = [(ctypes.c_uint8 * len(f))() for f in frames]
+        for i, x in enumerate(self.xfers):
+            x.tx_buf = ctypes.addressof(self.tx[i])
+            x.rx_buf = ctypes.addressof(self.rx[i])
+            x.len = len(frames[i])
+            x.speed_hz = speed
+            x.bits_per_word = 8
+            x.cs_change = 1 if i < n - 1 else 0
+
+    def __len__(self) -> int:
+        return len(self.tx)
+
+    def messages(self, limit: int) -> list[tuple]:
+        """(request, xfers) per ioctl for a spidev bufsiz of limit."""
+        if self.size <= limit and len(self.tx) <= SPI_MAX_MESSAGE_XFERS:
+            return [(self.request, self.xfers)]
+        split = self._split.get(limit)
+        if split is None:
+            split = self._split[limit] = []
+            for msg in split_frames([len(t) for t in self.tx], limit):
+                xfers = (SpiIocTransfer * len(msg))()
+                for x, (i, off, n, cs) in zip(xfers, msg):
+                    x.tx_buf = ctypes.addressof(self.tx[i]) + off
+                    x.rx_buf = ctypes.addressof(self.rx[i]) + off
+                    x.len = n
+                    x.speed_hz = self.speed
+                    x.bits_per_word = 8
+                    x.cs_change = cs
+                split.append((spi_ioc_message(len(msg)), xfers))
+        return split
+
+
+class SpiBus:
+    bufsiz = SPI_MAX_MESSAGE_BYTES
+
+    def __init__(self, dev: str, mode: int, speed: int):
+        self.dev = dev
+        self.mode = mode
+        self.speed = speed
+        self.bufsiz = spidev_bufsiz()
+        self.fd = os.open(dev, os.O_RDWR)
+        fcntl.ioctl(self.fd, SPI_IOC_WR_MODE, array.array("B", [mode]))
+        fcntl.ioctl(self.fd, SPI_IOC_WR_BITS_PER_WORD, array.array("B", [8]))
+        fcntl.ioctl(self.fd, SPI_IOC_WR_MAX_SPEED_HZ, array.array("I", [speed]))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def xfer(self, tx: bytes | bytearray | list[int], total_len: int | None = None) -> bytes:
+        tx_buf = bytearray(tx)
+        if total_len is None:
+            total_len = len(tx_buf)
+        tx_buf.extend(b"\x00" * max(0, total_len - len(tx_buf)))
+        n = total_len
+        if n > self.bufsiz:
+            batch = SpiBatch([bytes(tx_buf[:n])], self.speed)
+            # class-level call: a trace wrapper on the instance has this xfer already
+            type(self).xfer_many(self, batch)
+            return bytes(batch.rx[0])
+        tb = (ctypes.c_uint8 * n)(*tx_buf[:n])
+        rb = (ctypes.c_uint8 * n)()
+        x = SpiIocTransfer()
+        x.tx_buf = ctypes.addressof(tb)
+        x.rx_buf = ctypes.addressof(rb)
+        x.len = n
+        x.speed_hz = self.speed
+        x.bits_per_word = 8
+        try:
+            fcntl.ioctl(self.fd, spi_ioc_message(1), x)
+        except OSError as e:
+            if not self._shrink(e, n):
+                raise
+            return type(self).xfer(self, tx_buf, n)
+        return bytes(rb)
+
+    def xfer_many(self, batch: SpiBatch) -> None:
+        for k, (request, xfers) in enumerate(batch.messages(self.bufsiz)):
+            try:
+                self._message(request, xfers)
+            except OSError as e:
+                # only a rejected first message leaves the batch unsent
+                if not self._shrink(e, sum(x.len for x in xfers)) or k:
+                    raise
+                return type(self).xfer_many(self, batch)
+
+    def _message(self, request: int, xfers) -> None:
+        fcntl.ioctl(self.fd, request, xfers)
+
+    def _shrink(self, e: OSError, size: int) -> bool:
+        """After spidev rejected a size-byte message: lower bufsiz, True to retry.
+
+        bufsiz is then smaller than sysfs said (or sysfs was unreadable).
+        spidev checks the length before clocking anything, so nothing of
+        the rejected message reached the device.
+        """
+        if e.errno != errno.EMSGSIZE or size <= SPI_MIN_MESSAGE_BYTES:
+            return False
+        self.bufsiz = size // 2
+        return True
+
+    def hw(self, cmd: int, payload: bytes = b"") -> None:
+        self.xfer([SPI_WRITE, cmd] + list(payload))
+
+    def hr(self, cmd: int, n: int) -> bytes:
+        out = self.xfer([SPI_READ, cmd, 0x00] + [0] * n)
+        return out[3 : 3 + n]
+
+    def burst(self) -> None:
+        self.hw(REG_BURST, bytes([BURST_CONTINUOUS]))
+        self.hw(REG_INCR, bytes([INCR4]))
+
+    def ar(self, addr: int) -> int:
+        self.burst()
+        self.hw(REG_AHB_ADDR, struct.pack("<I", addr))
+        self.hw(REG_AHB_READ, b"\x00")
+        return struct.unpack("<I", self.hr(REG_AHB_DATA, 4))[0]
+
+    def aw(self, addr: int, value: int) -> None:
+        self.burst()
+        self.hw(REG_AHB_ADDR, struct.pack("<I", addr) + struct.pack("<I", value))
+
+
+def hw_frame(cmd: int, payload: bytes = b"") -> bytes:
+    return bytes([SPI_WRITE, cmd]) + payload
+
+
+BURST_FRAMES = [hw_frame(REG_BURST, bytes([BURST_CONTINUOUS])), hw_frame(REG_INCR, bytes([INCR4]))]
+
+
+def ahb_read_frames(addr: int) -> list[bytes]:
+    return BURST_FRAMES + [
+        hw_frame(REG_AHB_ADDR, struct.pack("<I", addr)),
+        hw_frame(REG_AHB_READ, b"\x00"),
+        bytes([SPI_READ, REG_AHB_DATA, 0x00]) + bytes(4),
+    ]
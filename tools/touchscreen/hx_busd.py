@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""HX83121A bus broker: one owner for /dev/spidev0.0 and /dev/i2c-4.
+
+The daemon keeps both buses open and configured and executes client
+batches one at a time, so probes, the loader and the recovery service no
+longer collide mid-sequence. Clients talk to it over a SOCK_SEQPACKET
+Unix socket (one datagram per batch, one per reply):
+
+  request   <BBHI  op, spi_mode, count, spi_speed_hz   then entries
+    OP_SPI  entries <H len + tx   -> one SPI_IOC_MESSAGE(count), each
+                                     entry its own chip-select frame
+                                     (split_frames messages above bufsiz)
+    OP_I2C  entries <BBH addr, flags, len (+ data for writes)
+                                  -> one I2C_RDWR with count messages
+    OP_STATS                      -> JSON per-client accounting
+    OP_PING                       -> <i served I2C bus (-1: none) +
+                                     spidev path (latency probe, and
+                                     how clients check the bus)
+    OP_LOCK / OP_UNLOCK           -> serve only this client until it
+                                     unlocks or disconnects
+  reply     <iQ    errno, bus_ns   then rx bytes / read data
+            (at most MAX_PACKET bytes after the header)
+
+Requests are received into a preallocated buffer per connection
+(recvmsg_into) and parsed through memoryviews; batches are copied into
+preallocated ctypes buffers and run with a single ioctl, so a batch
+costs one recv, one ioctl and one send and allocates only its reply. While a
+client holds the lock, other clients' sockets are taken out of the
+selector and their requests wait in the socket until it is released.
+
+The SPI port is opened in the SPI profile's mode (spi_bench.py) and its
+max speed is left at the controller's limit: each request carries its
+own clock, set per transfer.
+
+Client side: hx83121a.broker.open_spi()/open_i2c() return a
+broker-backed bus when the socket exists (HX_BUS_BROKER=0 disables),
+else the direct bus class, so tools pick the broker up transparently.
+
+Usage:
+  hx_busd.py serve [--spi-dev ...] [--i2c-bus N]   (default: hx83121a.discover)
+  hx_busd.py stats | ping [-n 1000]
+"""
+
+import argparse
+import array
+import ctypes
+import errno
+import fcntl
+import json
+import os
+import selectors
+import socket
+import struct
+import sys
+import time
+
+import hx83121a.profile as hx_profile
+from hx83121a import discover
+from hx83121a.broker import (
+    I2C_ENT,
+    I2C_M_RD,
+    MAX_PACKET,
+    OP_I2C,
+    OP_LOCK,
+    OP_PING,
+    OP_SPI,
+    OP_STATS,
+    OP_UNLOCK,
+    PING_REP,
+    REP_HDR,
+    REQ_HDR,
+    SOCKET_PATH,
+    SPI_ENT,
+    BrokerClient,
+)
+from hx83121a.i2c import I2C_RDWR, I2C_RDWR_MAX_MSGS, i2c_msg, i2c_rdwr_ioctl_data
+from hx83121a.spi import (
+    SPI_IOC_WR_BITS_PER_WORD,
+    SPI_IOC_WR_MODE,
+    SPI_MAX_MESSAGE_XFERS as SPI_MAX_XFERS,
+    SpiIocTransfer,
+    spi_ioc_message,
+    spidev_bufsiz,
+    split_frames,
+)
+
+
+# largest request: MAX_PACKET of payload behind one entry header per transfer
+REQ_MAX = REQ_HDR.size + 0xFFFF * max(SPI_ENT.size, I2C_ENT.size) + MAX_PACKET
+
+
+class SpiPort:
+    def __init__(self, dev: str, mode: int):
+        self.fd = os.open(dev, os.O_RDWR)
+        self.mode = -1
+        self.set_mode(mode)
+        fcntl.ioctl(self.fd, SPI_IOC_WR_BITS_PER_WORD, array.array("B", [8]))
+        # no SPI_IOC_WR_MAX_SPEED_HZ: it would clamp every request's speed_hz
+        self.bufsiz = spidev_bufsiz()
+        # a request can carry more than bufsiz; it is then split into messages
+        self.tx = (ctypes.c_uint8 * MAX_PACKET)()
+        self.rx = (ctypes.c_uint8 * MAX_PACKET)()
+        self.tx_mv = memoryview(self.tx).cast("B")
+        self.rx_mv = memoryview(self.rx).cast("B")
+        self.tx_base = ctypes.addressof(self.tx)
+        self.rx_base = ctypes.addressof(self.rx)
+        self.xfers = (SpiIocTransfer * SPI_MAX_XFERS)()
+        for x in self.xfers:
+            x.bits_per_word = 8
+
+    def set_mode(self, mode: int) -> None:
+        if mode != self.mode:
+            fcntl.ioctl(self.fd, SPI_IOC_WR_MODE, array.array("B", [mode]))
+            self.mode = mode
+
+    def run(self, mode: int, speed: int, count: int, req: memoryview, pos: int) -> bytes:
+        if count == 0:
+            raise OSError(errno.EINVAL, "bad transfer count")
+        self.set_mode(mode)
+        off = 0
+        starts = []
+        fits = count <= SPI_MAX_XFERS
+        for i in range(count):
+            (n,) = SPI_ENT.unpack_from(req, pos)
+            pos += SPI_ENT.size
+            if off + n > MAX_PACKET:
+                raise OSError(errno.EMSGSIZE, "batch too large")
+            self.tx_mv[off : off + n] = req[pos : pos + n]
+            pos += n
+            starts.append(off)
+            off += n
+            fits = fits and off <= self.bufsiz
+            if fits:
+                x = self.xfers[i]
+                x.tx_buf = self.tx_base + starts[i]
+                x.rx_buf = self.rx_base + starts[i]
+                x.len = n
+                x.speed_hz = speed
+                x.cs_change = 1 if i < count - 1 else 0
+        if fits:
+            fcntl.ioctl(self.fd, spi_ioc_message(count), self.xfers)
+            return self.rx_mv[:off].tobytes()
+        # the broker owns the bus, so chip select held between messages is safe
+        lengths = [b - a for a, b in zip(starts, starts[1:] + [off])]
+        for msg in split_frames(lengths, self.bufsiz):
+            for x, (i, o, n, cs) in zip(self.xfers, msg):
+                x.tx_buf = self.tx_base + starts[i] + o
+                x.rx_buf = self.rx_base + starts[i] + o
+                x.len = n
+                x.speed_hz = speed
+                x.cs_change = cs
+            fcntl.ioctl(self.fd, spi_ioc_message(len(msg)), self.xfers)
+        return self.rx_mv[:off].tobytes()
+
+
+class I2cPort:
+    def __init__(self, bus: int):
+        self.fd = os.open(f"/dev/i2c-{bus}", os.O_RDWR)
+        self.buf = (ctypes.c_ubyte * MAX_PACKET)()
+        self.mv = memoryview(self.buf).cast("B")
+        self.base = ctypes.addressof(self.buf)
+        self.msgs = (i2c_msg * I2C_RDWR_MAX_MSGS)()
+        self.data = i2c_rdwr_ioctl_data()
+        self.data.msgs = self.msgs
+
+    def run(self, count: int, req: memoryview, pos: int) -> bytes:
+        if count == 0 or count > I2C_RDWR_MAX_MSGS:
+            raise OSError(errno.EINVAL, "bad message count")
+        off = 0
+        reads = []
+        for i in range(count):
+            addr, flags, n = I2C_ENT.unpack_from(req, pos)
+            pos += I2C_ENT.size
+            if off + n > MAX_PACKET:
+                raise OSError(errno.EMSGSIZE, "batch too large")
+            if not flags & I2C_M_RD:
+                self.mv[off : off + n] = req[pos : pos + n]
+                pos += n
+            else:
+                reads.append((off, n))
+            m = self.msgs[i]
+            m.addr = addr
+            m.flags = flags
+            m.len = n
+            m.buf = ctypes.cast(self.base + off, ctypes.POINTER(ctypes.c_ubyte))
+            off += n
+        self.data.nmsgs = count
+        fcntl.ioctl(self.fd, I2C_RDWR, self.data)
+        return b"".join(self.mv[o : o + n] for o, n in reads)
+
+
+class Broker:
+    def __init__(self, args: argparse.Namespace):
+        self.spi = SpiPort(args.spi_dev, args.spi_mode) if args.spi_dev else None
+        if args.i2c_bus is None:
+            args.i2c_bus = discover.locate().bus
+        self.i2c = I2cPort(args.i2c_bus) if args.i2c_bus >= 0 else None
+        self.served = PING_REP.pack(args.i2c_bus if self.i2c else -1)
+        self.served += args.spi_dev.encode() if self.spi else b""
+        self.clients: dict[socket.socket, dict] = {}
+        self.bufs: dict[socket.socket, memoryview] = {}
+        self.retired: list[dict] = []
+        self.owner: socket.socket | None = None  # client holding OP_LOCK
+        self.parked: list[socket.socket] = []
+        self.sel = selectors.DefaultSelector()
+        os.makedirs(os.path.dirname(args.socket), exist_ok=True)
+        try:
+            os.unlink(args.socket)
+        except FileNotFoundError:
+            pass
+        self.lsock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.lsock.bind(args.socket)
+        os.chmod(args.socket, 0o660)
+        self.lsock.listen(16)
+        self.sel.register(self.lsock, selectors.EVENT_READ)
+
+    def accept(self) -> None:
+        conn, _ = self.lsock.accept()
+        pid, uid, _ = struct.unpack("3i", conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, 12))
+        try:
+            with open(f"/proc/{pid}/comm") as f:
+                comm = f.read().strip()
+        except OSError:
+            comm = "?"
+        self.clients[conn] = {"pid": pid, "uid": uid, "comm": comm, "batches": 0, "bytes": 0, "bus_ns": 0, "errors": 0}
+        self.bufs[conn] = memoryview(bytearray(REQ_MAX))
+        self.sel.register(conn, selectors.EVENT_READ)
+
+    def drop(self, conn: socket.socket) -> None:
+        self.sel.unregister(conn)
+        self.retired.append(self.clients.pop(conn))
+        del self.bufs[conn]
+        del self.retired[:-64]
+        conn.close()
+        if conn is self.owner:
+            self.release()
+
+    def release(self) -> None:
+        self.owner = None
+        for conn in self.parked:
+            self.sel.register(conn, selectors.EVENT_READ)
+        self.parked.clear()
+
+    def handle(self, conn: socket.socket) -> None:
+        if self.owner is not None and conn is not self.owner:
+            # leave the request in the socket until the lock is released
+            self.sel.unregister(conn)
+            self.parked.append(conn)
+            return
+        buf = self.bufs[conn]
+        try:
+            # room for a full MAX_PACKET payload plus headers; MSG_TRUNC flags anything longer
+            n, _, flags, _ = conn.recvmsg_into([buf])
+        except OSError:
+            n = 0
+        if not n:
+            self.drop(conn)
+            return
+        if n < REQ_HDR.size or flags & socket.MSG_TRUNC:
+            self.reply(conn, errno.EMSGSIZE if flags & socket.MSG_TRUNC else errno.EINVAL, 0)
+            return
+        acct = self.clients[conn]
+        req = buf[:n]
+        op, mode, count, speed = REQ_HDR.unpack_from(req)
+        err, out, t0 = 0, b"", time.perf_counter_ns()
+        try:
+            if op == OP_SPI and self.spi:
+                out = self.spi.run(mode, speed, count, req, REQ_HDR.size)
+            elif op == OP_I2C and self.i2c:
+                out = self.i2c.run(count, req, REQ_HDR.size)
+            elif op == OP_LOCK:
+                self.owner = conn
+            elif op == OP_UNLOCK:
+                if conn is self.owner:
+                    self.release()
+            elif op == OP_STATS:
+                out = json.dumps({"active": list(self.clients.values()), "retired": self.retired}).encode()
+            elif op == OP_PING:
+                out = self.served
+            else:
+                err = errno.ENODEV
+        except OSError as e:
+            err = e.errno or errno.EIO
+        except struct.error:
+            err = errno.EINVAL
+        dt = time.perf_counter_ns() - t0
+        if op in (OP_SPI, OP_I2C):
+            acct["batches"] += 1
+            acct["bytes"] += n + len(out)
+            acct["bus_ns"] += dt
+            acct["errors"] += bool(err)
+        self.reply(conn, err, dt, out)
+
+    def reply(self, conn: socket.socket, err: int, dt: int, out: bytes = b"") -> None:
+        try:
+            conn.send(REP_HDR.pack(err, dt) + out)
+        except OSError:
+            self.drop(conn)
+
+    def serve(self) -> None:
+        while True:
+            for key, _ in self.sel.select():
+                if key.fileobj is self.lsock:
+                    self.accept()
+                else:
+                    self.handle(key.fileobj)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("cmd", choices=["serve", "stats", "ping"])
+    ap.add_argument("--socket", default=SOCKET_PATH)
+    spi = hx_profile.spi_defaults()
+    ap.add_argument("--spi-dev", default=spi["dev"], help="empty to disable SPI")
+    ap.add_argument("--spi-mode", type=int, default=spi["mode"])
+    ap.add_argument("--i2c-bus", type=int, help="-1 to disable I2C (default: hx83121a.discover)")
+    ap.add_argument("-n", type=int, default=1000)
+    args = ap.parse_args()
+
+    if args.cmd == "serve":
+        broker = Broker(args)
+        print(f"hx_busd: serving {args.socket} spi={args.spi_dev or '-'} i2c={args.i2c_bus}", flush=True)
+        try:
+            broker.serve()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    client = BrokerClient(args.socket)
+    if args.cmd == "stats":
+        st = client.stats()
+        for tag in ("active", "retired"):
+            for c in st[tag]:
+                print(
+                    f"{tag:7s} pid={c['pid']:<7d} {c['comm']:16s} batches={c['batches']:<8d} "
+                    f"bus_ms={c['bus_ns'] / 1e6:10.3f} bytes={c['bytes']} errors={c['errors']}"
+                )
+        return 0
+
+    bus, dev = client.served()
+    print(f"serving i2c bus {bus if bus >= 0 else '-'}, spi {dev or '-'}")
+    ping = REQ_HDR.pack(OP_PING, 0, 0, 0)
+    t0 = time.perf_counter_ns()
+    for _ in range(args.n):
+        client.call(ping)
+    print(f"round trip: {(time.perf_counter_ns() - t0) / args.n / 1000:.1f} us over {args.n} calls")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Transport capability probe for the HX83121A I2C and SPI buses.
+
+The loader writes SRAM 4 bytes per AHB write and batches at most 42
+messages per I2C_RDWR because nothing knew what this adapter and bridge
+accept. This probe measures it and stores the result in the bus profile
+(/var/lib/hx83121a/bus.json), which AhbI2C.caps, hx_loadplan.py,
+hx_dump.py and hx83121a.spi read at startup:
+
+  max_msgs   messages per I2C_RDWR: 42, 32, ... 2 until one batch of
+             combined IC ID reads comes back whole
+  max_read   bytes per AHB burst read: --read-addr is read once in 4-byte
+             words as the reference, then in bursts of growing length
+             until one fails or differs
+  max_write  bytes per AHB burst write (only with --scratch): a pattern
+             written in one burst must read back intact; the scratch
+             window's old contents are restored word by word afterwards
+  clock_hz   the adapter's DT clock-frequency (the GENI SE runs at
+             400 kHz or 1 MHz depending on the DT, see TOUCH_OPTIMIZATION.md),
+             next to the SCL rate the burst reads imply
+  bufsiz     spidev's per-message limit: sysfs if readable, else the
+             largest power of two spidev accepts (a too-long message is
+             refused with EMSGSIZE before anything is clocked)
+
+Nothing is probed unless the AHB bridge answers with the IC ID. The bus
+is opened directly, not through hx_busd.py. Limits a probe could not
+establish keep their BUS_DEFAULTS value, and one that passed nothing
+falls back to single words; none is ever raised past what passed.
+SPI mode and clock are spi_bench.py's (spi.json).
+
+Usage:
+  hx_caps.py probe                           # report only
+  hx_caps.py probe --scratch 0x20010000 --write-profile
+  hx_caps.py probe --emulate --emulate-max-len 1024 --emulate-max-msgs 16
+  hx_caps.py show                            # print the stored profile
+"""
+
+import argparse
+import errno
+import os
+import struct
+import sys
+import time
+
+import hx83121a.profile as hx_profile
+from hx83121a import discover
+from hx83121a.i2c import I2C_RDWR_MAX_MSGS, AhbI2C, I2cBatch
+from hx83121a.regs import ADDR_IC_ID, I2C_ADDR_AHB, IC_ID, REG_AHB_ADDR, REG_AHB_DATA, SPI_READ
+from hx83121a.spi import SpiBatch, SpiBus
+
+MSG_COUNTS = (42, 32, 16, 8, 4, 2)
+BURST_LENGTHS = (16, 64, 256, 1024, 4088, 8192, 16384)
+SPI_LIMITS = tuple(1 << k for k in range(16, 5, -1))  # 64 KiB .. 64 bytes
+READ_ADDR = 0x20000000  # Data SRAM
+EMULATED_SCRATCH = 0x10000000
+I2C_RATES = (100_000, 400_000, 1_000_000, 3_400_000)
+
+
+def pattern(n: int, seed: int) -> bytes:
+    return bytes((seed + i * 7 + (i >> 8)) & 0xFF for i in range(n))
+
+
+def read_words(dev: AhbI2C, addr: int, n: int) -> bytes:
+    return b"".join(dev.ahb_read(addr + off, 4) for off in range(0, n, 4))
+
+
+def probe_msgs(dev: AhbI2C) -> tuple[int | None, list[dict]]:
+    rows = []
+    for count in MSG_COUNTS:
+        msgs = ((I2C_ADDR_AHB, bytes([REG_AHB_ADDR]) + struct.pack("<I", ADDR_IC_ID)), (I2C_ADDR_AHB, 4)) * (count // 2)
+        batch = I2cBatch(msgs)
+        try:
+            dev.xfer_many(batch)
+        except OSError as e:
+            rows.append({"msgs": count, "errno": e.errno})
+            continue
+        ok = all(struct.unpack("<I", bytes(r))[0] == IC_ID for r in batch.rx)
+        rows.append({"msgs": count, "ok": ok})
+        if ok:
+            return count, rows
+    return None, rows
+
+
+def probe_read(dev: AhbI2C, addr: int, lengths: list[int]) -> tuple[int | None, float | None, list[dict]]:
+    """Largest burst read that matches the word-by-word reference, and its SCL estimate."""
+    ref = read_words(dev, addr, max(lengths))
+    if read_words(dev, addr, max(lengths)) != ref:
+        raise SystemExit(f"0x{addr:08x} changes between reads; pass --read-addr of memory the firmware leaves alone")
+    best, hz, rows = None, None, []
+    for n in lengths:
+        try:
+            t0 = time.perf_counter()
+            got = dev.ahb_read(addr, n)
+            dt = time.perf_counter() - t0
+        except OSError as e:
+            rows.append({"len": n, "errno": e.errno})
+            break
+        ok = got == ref[:n]
+        rows.append({"len": n, "ok": ok, "us": round(dt * 1e6)})
+        if not ok:
+            break
+        best = n
+        # 9 clocks per byte: address + 5 written, n read
+        hz = 9 * (n + 7) / dt if dt else None
+    return best, hz, rows
+
+
+def probe_write(dev: AhbI2C, addr: int, lengths: list[int], max_read: int) -> tuple[int | None, list[dict]]:
+    """Largest single AHB write that reads back intact; the window is restored."""
+    saved = read_words(dev, addr, max(lengths))
+    best, rows = None, []
+    try:
+        for n in lengths:
+            data = pattern(n, n)
+            try:
+                dev.ahb_write(addr, data)
+                got = b"".join(dev.ahb_read(addr + off, min(max_read, n - off)) for off in range(0, n, max_read))
+            except OSError as e:
+                rows.append({"len": n, "errno": e.errno})
+                break
+            ok = got == data
+            rows.append({"len": n, "ok": ok})
+            if not ok:
+                break
+            best = n
+    finally:
+        for off in range(0, len(saved), 4):
+            dev.ahb_write(addr + off, saved[off : off + 4])
+    return best, rows
+
+
+def adapter_clock(bus: int) -> int | None:
+    """clock-frequency of the adapter's DT node (big-endian u32), if it has one."""
+    path = os.path.join(discover.ADAPTER_DIR, f"i2c-{bus}", "of_node", "clock-frequency")
+    try:
+        with open(path, "rb") as f:
+            return struct.unpack(">I", f.read(4))[0]
+    except (OSError, struct.error):
+        return None
+
+
+def rate_class(hz: float | None) -> str:
+    """The slowest standard I2C rate at least as fast as a measured effective rate."""
+    if hz is None:
+        return "unknown"
+    for rate in I2C_RATES:
+        if hz <= rate:
+            return f"{rate // 1000} kHz"
+    return "faster than any I2C mode"
+
+
+def probe_bufsiz(bus: SpiBus) -> tuple[int | None, str]:
+    try:
+        with open("/sys/module/spidev/parameters/bufsiz") as f:
+            return int(f.read()), "sysfs"
+    except (OSError, ValueError):
+        pass
+    for n in SPI_LIMITS:
+        # a data-register read: harmless if it fits and is clocked out
+        batch = SpiBatch([bytes([SPI_READ, REG_AHB_DATA, 0x00]) + bytes(n - 3)], bus.speed)
+        request, xfers = batch.messages(1 << 30)[0]
+        try:
+            bus._message(request, xfers)
+        except OSError as e:
+            if e.errno == errno.EMSGSIZE:
+                continue
+            return None, f"errno {e.errno}"
+        return n, "probe"
+    return None, f"no message of {SPI_LIMITS[-1]} bytes or more accepted"
+
+
+def outcomes(rows: list[dict], key: str) -> str:
+    return " ".join(
+        f"{r[key]}:" + ("ok" if r.get("ok") else f"errno {r['errno']}" if "errno" in r else "mismatch") for r in rows
+    )
+
+
+def open_buses(args: argparse.Namespace):
+    if args.emulate:
+        import hx_emulator
+
+        device = hx_emulator.HxDevice(bufsiz=args.emulate_bufsiz)
+        for off in range(0, max(BURST_LENGTHS), 4):
+            device.write_word(args.read_addr + off, struct.unpack("<I", pattern(4, off))[0])
+        i2c = hx_emulator.EmulatedI2C(device, max_len=args.emulate_max_len, max_msgs=args.emulate_max_msgs)
+        return 0, i2c, hx_emulator.EmulatedSpiBus(device)
+    bus = discover.resolve(args.i2c_bus).bus
+    spi = hx_profile.spi_defaults()
+    try:
+        spi_bus = SpiBus(spi["dev"], spi["mode"], spi["speed"])
+    except OSError as e:
+        print(f"SPI: {spi['dev']} not usable ({e.strerror}); bufsiz not probed")
+        spi_bus = None
+    return bus, AhbI2C(bus), spi_bus
+
+
+def cmd_probe(args: argparse.Namespace) -> int:
+    if args.scratch is None and args.emulate:
+        args.scratch = EMULATED_SCRATCH
+    lengths = [n for n in BURST_LENGTHS if n <= args.max_len]
+    bus, dev, spi_bus = open_buses(args)
+    defaults = hx_profile.BUS_DEFAULTS
+    try:
+        ic_id = dev.read_ic_id()
+        if ic_id != IC_ID:
+            print(f"i2c-{bus}: IC ID 0x{ic_id:08x}, expected 0x{IC_ID:08x}; not probing")
+            return 1
+        print(f"=== Transport capabilities ({'emulator' if args.emulate else f'i2c-{bus}'}) ===")
+
+        max_msgs, rows = probe_msgs(dev)
+        print(f"I2C_RDWR messages: {outcomes(rows, 'msgs')}")
+        if max_msgs is None:
+            print("not even a combined read works as a batch; nothing stored")
+            return 1
+
+        dev.burst_enable(True)
+        try:
+            max_read, measured_hz, rows = probe_read(dev, args.read_addr, lengths)
+            print(f"burst read  @0x{args.read_addr:08x}: {outcomes(rows, 'len')}")
+            max_write = None
+            if args.scratch is not None and max_read:
+                max_write, rows = probe_write(dev, args.scratch, lengths, max_read or 4)
+                print(f"burst write @0x{args.scratch:08x}: {outcomes(rows, 'len')}")
+            elif args.scratch is not None:
+                print("burst write: not probed, no burst read to check it with")
+            else:
+                print("burst write: not probed (--scratch)")
+        finally:
+            dev.burst_enable(False)
+    finally:
+        dev.close()
+
+    clock_hz = None if args.emulate else adapter_clock(bus)
+    bufsiz, source = (None, "not probed") if spi_bus is None else probe_bufsiz(spi_bus)
+    if spi_bus is not None:
+        spi_bus.close()
+
+    i2c = {
+        # a probe that ran but passed nothing leaves single words
+        "max_write": (max_write or 4) if args.scratch is not None else defaults["i2c"]["max_write"],
+        "max_read": max_read or 4,
+        "max_msgs": min(max_msgs, I2C_RDWR_MAX_MSGS),
+        "node": None if args.emulate else discover.adapter_node(bus),
+        "bus": bus,
+        "clock_hz": clock_hz,
+        "measured_hz": round(measured_hz) if measured_hz else None,
+    }
+    spi = {"bufsiz": bufsiz or defaults["spi"]["bufsiz"], "source": source}
+    print(
+        f"\nI2C: {i2c['max_write']} bytes/write, {i2c['max_read']} bytes/read, {i2c['max_msgs']} msgs/I2C_RDWR; "
+        f"clock {f'{clock_hz // 1000} kHz' if clock_hz else 'unknown'} (DT), "
+        f"reads imply {rate_class(measured_hz)}"
+    )
+    print(f"SPI: bufsiz {spi['bufsiz']} ({source})")
+    if args.write_profile and not args.emulate:
+        hx_profile.save_bus_caps({"i2c": i2c, "spi": spi})
+        print(f"written: {hx_profile.BUS_PROFILE}")
+    elif args.write_profile:
+        print("(--emulate: profile not written)")
+    return 0
+
+
+def cmd_show(args: argparse.Namespace) -> int:
+    stored = hx_profile.read_json(hx_profile.BUS_PROFILE)
+    caps = hx_profile.bus_caps()
+    state = f"updated {stored['updated']}" if "updated" in stored else "not written, defaults"
+    print(f"{hx_profile.BUS_PROFILE}: {state}")
+    for bus, limits in caps.items():
+        print(f"  {bus}: " + ", ".join(f"{k}={v}" for k, v in limits.items()))
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("probe", help="measure the transport limits")
+    p.add_argument("--i2c-bus", type=int, help="default: hx83121a.discover")
+    p.add_argument("--read-addr", type=lambda v: int(v, 0), default=READ_ADDR, help="memory the read probe reads")
+    p.add_argument("--scratch", type=lambda v: int(v, 0), help="SRAM the write probe may overwrite (restored)")
+    p.add_argument("--max-len", type=int, default=max(BURST_LENGTHS), help="longest burst tried")
+    p.add_argument("--write-profile", action="store_true", help=f"store the result in {hx_profile.BUS_PROFILE}")
+    p.add_argument("--emulate", action="store_true", help="probe the software stand-in")
+    p.add_argument("--emulate-max-len", type=int, help="stand-in adapter's bytes per message")
+    p.add_argument("--emulate-max-msgs", type=int, default=I2C_RDWR_MAX_MSGS, help="stand-in's messages per I2C_RDWR")
+    p.add_argument("--emulate-bufsiz", type=int, default=4096, help="stand-in spidev bufsiz")
+    sub.add_parser("show", help="print the stored bus profile")
+    args = ap.parse_args()
+    return cmd_probe(args) if args.cmd == "probe" else cmd_show(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
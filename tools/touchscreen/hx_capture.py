@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Delta-compressed storage for long cmd 0x30 event-plane captures.
+
+Consecutive event frames are nearly always identical, so each frame is
+stored relative to the previous one:
+
+  SAME   frame identical to the previous one: 9-byte record, no payload
+  PATCH  changed 64-byte blocks as (offset, length, bytes) runs
+  KEY    full frame (zlib), written every --keyframe-interval frames and
+         whenever the frame length changes; carries the absolute time
+
+Record header is <BII: kind, microseconds since the previous frame,
+payload length; PATCH runs are <II offset, length. Version 1 had
+uint16 lengths and offsets (<BIH, <QH, <HH), which wrapped for frames
+above 64 KiB; the reader still decodes v1 files, the writer only
+writes v2. Keyframe positions are collected in an index appended on
+close, so a reader can seek to any timestamp by decoding forward from
+the nearest keyframe. A capture cut short by a crash has no index;
+the reader then rebuilds it with one scan.
+
+Usage:
+  hx_capture.py info capture.hxc
+  hx_capture.py extract capture.hxc --at 12.5 [-o frame.bin]
+  hx_capture.py export capture.hxc frames.raw
+"""
+
+import argparse
+import bisect
+import os
+import struct
+import sys
+import time
+import zlib
+from typing import Iterator
+
+MAGIC = b"HXCP"
+VERSION = 2
+FILE_HDR = struct.Struct("<4sHHQ")  # magic, version, reserved, wall-clock start ns
+REC_HDR = struct.Struct("<BII")
+KEY_HDR = struct.Struct("<QI")      # absolute t_ns, raw frame length
+RUN_HDR = struct.Struct("<II")
+# (REC_HDR, KEY_HDR, RUN_HDR) per readable version
+LAYOUTS = {
+    1: (struct.Struct("<BIH"), struct.Struct("<QH"), struct.Struct("<HH")),
+    VERSION: (REC_HDR, KEY_HDR, RUN_HDR),
+}
+INDEX_MAGIC = b"HXIX"
+INDEX_ENTRY = struct.Struct("<QQ")  # t_ns, file offset of the KEY record
+TRAILER = struct.Struct("<Q4s")     # index offset, b"HXCE"
+
+KIND_KEY = 1
+KIND_SAME = 2
+KIND_PATCH = 3
+
+BLOCK = 64
+
+
+def diff_runs(prev: bytes, cur: bytes) -> list[tuple[int, int]]:
+    """Changed regions as merged (offset, length) runs of BLOCK granularity."""
+    runs: list[tuple[int, int]] = []
+    n = len(cur)
+    start = -1
+    for off in range(0, n, BLOCK):
+        changed = prev[off : off + BLOCK] != cur[off : off + BLOCK]
+        if changed and start < 0:
+            start = off
+        elif not changed and start >= 0:
+            runs.append((start, off - start))
+            start = -1
+    if start >= 0:
+        runs.append((start, n - start))
+    return runs
+
+
+class CaptureWriter:
+    def __init__(self, path: str, keyframe_interval: int = 256):
+        self.f = open(path, "wb", buffering=1 << 16)
+        self.f.write(FILE_HDR.pack(MAGIC, VERSION, 0, time.time_ns()))
+        self.keyframe_interval = keyframe_interval
+        self.prev: bytes | None = None
+        self.last_t = 0
+        self.since_key = 0
+        self.index: list[tuple[int, int]] = []
+        self.frames = 0
+        self.raw_bytes = 0
+
+    def add(self, frame: bytes, t_ns: int | None = None) -> None:
+        if t_ns is None:
+            t_ns = time.monotonic_ns()
+        dt_us = min(max(0, (t_ns - self.last_t) // 1000), 0xFFFFFFFF)
+        prev = self.prev
+        self.frames += 1
+        self.raw_bytes += len(frame)
+        if prev is None or len(prev) != len(frame) or self.since_key >= self.keyframe_interval:
+            self.index.append((t_ns, self.f.tell()))
+            payload = KEY_HDR.pack(t_ns, len(frame)) + zlib.compress(frame, 1)
+            self.f.write(REC_HDR.pack(KIND_KEY, dt_us, len(payload)))
+            self.f.write(payload)
+            self.since_key = 0
+        elif frame == prev:
+            self.f.write(REC_HDR.pack(KIND_SAME, dt_us, 0))
+        else:
+            parts = []
+            for off, ln in diff_runs(prev, frame):
+                parts.append(RUN_HDR.pack(off, ln))
+                parts.append(frame[off : off + ln])
+            payload = b"".join(parts)
+            self.f.write(REC_HDR.pack(KIND_PATCH, dt_us, len(payload)))
+            self.f.write(payload)
+        self.since_key += 1
+        self.prev = bytes(frame)
+        # Track the time the reader will reconstruct, not t_ns itself, so
+        # microsecond rounding does not accumulate between keyframes.
+        self.last_t = t_ns if self.since_key == 1 else self.last_t + dt_us * 1000
+
+    def close(self) -> None:
+        if self.f.closed:
+            return
+        index_off = self.f.tell()
+        self.f.write(INDEX_MAGIC + struct.pack("<I", len(self.index)))
+        for t, off in self.index:
+            self.f.write(INDEX_ENTRY.pack(t, off))
+        self.f.write(TRAILER.pack(index_off, b"HXCE"))
+        self.f.close()
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class CaptureReader:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        magic, self.version, _, self.start_wall_ns = FILE_HDR.unpack_from(self.data, 0)
+        if magic != MAGIC or self.version not in LAYOUTS:
+            raise ValueError(f"{path}: not an hx capture (v{', v'.join(map(str, LAYOUTS))})")
+        self.rec_hdr, self.key_hdr, self.run_hdr = LAYOUTS[self.version]
+        self.end = len(self.data)
+        self.index = self._read_index()
+        if self.index is None:
+            self.index = self._scan_index()
+        self.index_t = [t for t, _ in self.index]
+
+    def _read_index(self) -> list[tuple[int, int]] | None:
+        if len(self.data) < FILE_HDR.size + TRAILER.size:
+            return None
+        index_off, tag = TRAILER.unpack_from(self.data, len(self.data) - TRAILER.size)
+        if tag != b"HXCE" or self.data[index_off : index_off + 4] != INDEX_MAGIC:
+            return None
+        (count,) = struct.unpack_from("<I", self.data, index_off + 4)
+        base = index_off + 8
+        self.end = index_off
+        return [INDEX_ENTRY.unpack_from(self.data, base + i * INDEX_ENTRY.size) for i in range(count)]
+
+    def _scan_index(self) -> list[tuple[int, int]]:
+        index = []
+        rec_hdr, key_hdr = self.rec_hdr, self.key_hdr
+        pos = FILE_HDR.size
+        while pos + rec_hdr.size <= self.end:
+            kind, _, ln = rec_hdr.unpack_from(self.data, pos)
+            if pos + rec_hdr.size + ln > self.end:
+                self.end = pos  # truncated tail
+                break
+            if kind == KIND_KEY:
+                index.append((key_hdr.unpack_from(self.data, pos + rec_hdr.size)[0], pos))
+            pos += rec_hdr.size + ln
+        return index
+
+    def frames(self, start: int | None = None) -> Iterator[tuple[int, bytes]]:
+        """Yield (t_ns, frame) from the record at `start` (a keyframe offset)."""
+        data = self.data
+        rec_hdr, key_hdr, run_hdr = self.rec_hdr, self.key_hdr, self.run_hdr
+        pos = FILE_HDR.size if start is None else start
+        t = 0
+        frame = bytearray()
+        while pos + rec_hdr.size <= self.end:
+            kind, dt_us, ln = rec_hdr.unpack_from(data, pos)
+            pos += rec_hdr.size
+            if kind == KIND_KEY:
+                t, _ = key_hdr.unpack_from(data, pos)
+                frame = bytearray(zlib.decompress(data[pos + key_hdr.size : pos + ln]))
+            else:
+                t += dt_us * 1000
+                if kind == KIND_PATCH:
+                    p, end = pos, pos + ln
+                    while p < end:
+                        off, rl = run_hdr.unpack_from(data, p)
+                        p += run_hdr.size
+                        frame[off : off + rl] = data[p : p + rl]
+                        p += rl
+            pos += ln
+            yield t, bytes(frame)
+
+    def seek(self, t_ns: int) -> Iterator[tuple[int, bytes]]:
+        """Frames from the last one at or before t_ns onwards."""
+        if not self.index:
+            return
+        i = max(0, bisect.bisect_right(self.index_t, t_ns) - 1)
+        before = None
+        started = False
+        for t, frame in self.frames(self.index[i][1]):
+            if not started:
+                if t <= t_ns:
+                    before = (t, frame)
+                    continue
+                started = True
+                if before:
+                    yield before
+            yield t, frame
+        if not started and before:
+            yield before
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("cmd", choices=["info", "extract", "export"])
+    ap.add_argument("capture")
+    ap.add_argument("out", nargs="?")
+    ap.add_argument("--at", type=float, default=0.0, help="seconds from the first frame")
+    ap.add_argument("-o", "--output")
+    args = ap.parse_args()
+
+    r = CaptureReader(args.capture)
+    t_first = r.index[0][0] if r.index else 0
+
+    if args.cmd == "info":
+        n = raw = nz_frames = 0
+        t_last = t_first
+        for t_last, frame in r.frames():
+            n += 1
+            raw += len(frame)
+            nz_frames += any(frame)
+        size = os.path.getsize(args.capture)
+        print(
+            f"frames={n} keyframes={len(r.index)} nonzero_frames={nz_frames} "
+            f"span={(t_last - t_first) / 1e9:.3f}s"
+        )
+        print(f"raw={raw} stored={size} ratio={raw / size if size else 0:.1f}x")
+        return 0
+
+    if args.cmd == "extract":
+        target = t_first + int(args.at * 1e9)
+        t, frame = next(iter(r.seek(target)), (None, None))
+        if frame is None:
+            print("capture is empty", file=sys.stderr)
+            return 1
+        print(f"t={(t - t_first) / 1e9:.6f}s len={len(frame)} nz={sum(1 for b in frame if b)}")
+        if args.output:
+            with open(args.output, "wb") as f:
+                f.write(frame)
+        return 0
+
+    if not args.out:
+        ap.error("export needs an output path")
+    with open(args.out, "wb") as f:
+        for _, frame in r.frames():
+            f.write(frame)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Minimum-delay autotuner for HX83121A reset and wakeup sequences.
+
+Each named delay in a sequence is bisected between --floor-ms and its
+current value for the shortest setting that still reaches the target
+state reliably: trials continue until the Wilson interval of the success
+rate at --confidence lies above --min-success (pass) or below it
+(fail); a candidate still undecided after --trials attempts fails.
+Only a lower bound that clears --min-success is accepted, so a short
+lucky run cannot make a delay "reliable". Delays are tuned
+one at a time in sequence order with the others held at their current
+best. Results (plus --margin headroom) are merged into the per-device
+timing profile read by load_firmware_i2c.py, hx83121a-touch-recovery,
+hx_event_plane_probe.py and named waits in wakeup scenarios.
+
+Targets:
+  scenario  a wakeup scenario from hx_wakeup_matrix; tunables are its
+            named wait steps; success is --expect (status/hid/event).
+            The scenario's "setup" steps must return the IC to a known
+            starting state, otherwise trials are not independent.
+  loader    the full load_firmware() flow (needs --firmware).
+  recovery  recover_touch() from hx83121a.recovery.
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+from statistics import NormalDist
+
+import hx83121a.profile as hx_profile
+import hx_wakeup_matrix as matrix
+from hx83121a import discover
+from hx83121a.regs import ADDR_IC_STATUS, I2C_ADDR_HID
+from hx83121a.spi import SpiBus
+
+LOADER_TUNABLES = ["system_reset", "post_reset", "safe_mode", "tcon_reset", "adc_reset_low", "adc_reset", "sense_on", "fw_start"]
+RECOVERY_TUNABLES = ["gpio174_settle", "reset_pulse", "bootrom_poll", "wake_bind", "hid_low_settle", "bind_settle", "unbind"]
+
+
+class ScenarioTarget:
+    def __init__(self, args: argparse.Namespace):
+        scenarios = matrix.read_scenarios(args.scenario_file)
+        if args.scenario not in scenarios:
+            raise SystemExit(f"unknown scenario: {args.scenario}")
+        self.sc = scenarios[args.scenario]
+        if not self.sc.get("setup"):
+            print(f"warning: scenario {args.scenario} has no setup steps; trials may not be independent")
+        stored = hx_profile.read_json(hx_profile.TIMING_PROFILE).get("delays", {})
+        self.delays = {}
+        for step in self.sc.get("steps", []):
+            if step.get("op") == "wait" and step.get("name"):
+                self.delays[step["name"]] = stored.get(step["name"], matrix._num(step["ms"]) / 1000.0)
+        self.speed = args.speed
+        self.expect = args.expect
+        self.want = args.status
+        self.frame_len = args.frame_len
+        self.watch = args.watch_ms / 1000.0
+        self.bus = SpiBus(args.dev, args.mode, args.speed)
+        self.i2c = None
+        if self.expect == "hid":
+            import load_firmware_i2c
+
+            self.i2c = load_firmware_i2c.HX83121A_I2C(args.i2c_bus)
+        self._plans: dict[tuple, matrix.Plan] = {}
+
+    def trial(self, delays: dict[str, float]) -> bool:
+        key = tuple(sorted(delays.items()))
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = matrix.compile_scenario(self.sc, self.speed, delays)
+        if plan.setup and not matrix.execute(self.bus, plan.setup):
+            return False  # never reached the starting state: a miss, as in hx_wakeup_matrix
+        if not matrix.execute(self.bus, plan.items):
+            return False
+        if self.expect == "status":
+            return self.bus.ar(ADDR_IC_STATUS) & 0xFF == self.want
+        if self.expect == "event":
+            return matrix.watch_event_plane(self.bus, self.frame_len, self.watch, 0.005) is not None
+        return self.i2c.probe(I2C_ADDR_HID)
+
+    def close(self) -> None:
+        self.bus.close()
+        if self.i2c:
+            self.i2c.close()
+
+
+class LoaderTarget:
+    def __init__(self, args: argparse.Namespace):
+        if not args.firmware:
+            raise SystemExit("--firmware is required for the loader target")
+        import load_firmware_i2c
+
+        self.mod = load_firmware_i2c
+        with open(args.firmware, "rb") as f:
+            self.fw = f.read()
+        self.bus = args.i2c_bus
+        self.hid_device = args.hid_device
+        self.delays = {f"loader.{k}": self.mod.DELAYS[k] for k in LOADER_TUNABLES}
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.mod.unbind_i2c_hid(self.hid_device)
+
+    def trial(self, delays: dict[str, float]) -> bool:
+        self.mod.DELAYS.update({k.split(".", 1)[1]: v for k, v in delays.items()})
+        dev = self.mod.HX83121A_I2C(self.bus)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                return bool(self.mod.load_firmware(dev, self.fw))
+        except OSError:
+            return False
+        finally:
+            dev.close()
+
+    def close(self) -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.mod.bind_i2c_hid(self.hid_device)
+
+
+class RecoveryTarget:
+    def __init__(self, args: argparse.Namespace):
+        from hx83121a import recovery
+
+        self.mod = recovery
+        self.bus = recovery.open_bus(args.i2c_bus)
+        self.hid_device = args.hid_device
+        self.delays = {f"recovery.{k}": self.mod.DELAYS[k] for k in RECOVERY_TUNABLES}
+
+    def trial(self, delays: dict[str, float]) -> bool:
+        self.mod.DELAYS.update({k.split(".", 1)[1]: v for k, v in delays.items()})
+        with contextlib.redirect_stdout(io.StringIO()):
+            return bool(self.mod.recover_touch(self.bus, self.hid_device))
+
+    def close(self) -> None:
+        self.bus.close()
+
+
+def passes(target, delays: dict[str, float], args: argparse.Namespace) -> tuple[bool, int, int]:
+    """Trial until the Wilson interval is clear of min_success, at most `trials` times."""
+    k = n = 0
+    while n < args.trials:
+        k += bool(target.trial(delays))
+        n += 1
+        lo, hi = matrix.wilson_interval(k, n, args.z)
+        if lo > args.min_success:
+            return True, k, n
+        if hi < args.min_success:
+            break
+    return False, k, n
+
+
+def tune_one(target, delays: dict[str, float], name: str, args: argparse.Namespace) -> dict:
+    start = delays[name]
+    lo, hi = args.floor_ms / 1000.0, start
+    res = args.resolution_ms / 1000.0
+    runs = 0
+    ok, k, n = passes(target, delays, args)
+    runs += n
+    if not ok:
+        print(f"  {name}: current value {start * 1000:.1f} ms already fails ({k}/{n}); left unchanged")
+        return {"from_s": start, "to_s": start, "trials": runs, "validated": False}
+    while hi - lo > res:
+        mid = (lo + hi) / 2
+        trial = dict(delays, **{name: mid})
+        ok, k, n = passes(target, trial, args)
+        runs += n
+        lo_ci, _ = matrix.wilson_interval(k, n, args.z)
+        print(f"  {name}={mid * 1000:7.1f} ms  {k}/{n} {'pass' if ok else 'fail'} (ci_lo={lo_ci:.3f})")
+        if ok:
+            hi = mid
+        else:
+            lo = mid
+    tuned = min(start, hi * (1.0 + args.margin))
+    delays[name] = tuned
+    return {"from_s": start, "to_s": round(tuned, 4), "trials": runs, "validated": True}
+
+
+def main() -> int:
+    spi = hx_profile.spi_defaults()
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("target", choices=["scenario", "loader", "recovery"])
+    ap.add_argument("--delays", default="", help="comma-separated subset of delay names to tune")
+    ap.add_argument("--trials", type=int, default=60, help="max trials per candidate delay")
+    ap.add_argument("--min-success", type=float, default=0.9,
+                    help="success rate the Wilson lower bound must exceed (below 1.0)")
+    ap.add_argument("--confidence", type=float, default=0.95, help="two-sided confidence of the Wilson interval")
+    ap.add_argument("--floor-ms", type=float, default=0.0)
+    ap.add_argument("--resolution-ms", type=float, default=5.0)
+    ap.add_argument("--margin", type=float, default=0.25, help="headroom added to the minimum that passed")
+    ap.add_argument("--dry-run", action="store_true", help="do not write the timing profile")
+    ap.add_argument("--i2c-bus", type=int, help="default: hx83121a.discover")
+    ap.add_argument("--firmware", help="firmware image for the loader target")
+    ap.add_argument("--dev", default=spi["dev"])
+    ap.add_argument("--mode", type=int, default=spi["mode"])
+    ap.add_argument("--speed", type=int, default=spi["speed"])
+    ap.add_argument("--scenario-file", default=matrix.DEFAULT_SCENARIO_FILE)
+    ap.add_argument("--scenario", default="activ_relod")
+    ap.add_argument("--expect", choices=["status", "hid", "event"], default="status")
+    ap.add_argument("--status", type=lambda v: int(v, 0), default=0x05, help="status byte for --expect status")
+    ap.add_argument("--frame-len", type=int, default=512)
+    ap.add_argument("--watch-ms", type=int, default=300)
+    args = ap.parse_args()
+    if not 0.0 < args.min_success < 1.0:
+        ap.error("--min-success must be between 0 and 1 (a lower bound never reaches 1.0)")
+    if not 0.0 < args.confidence < 1.0:
+        ap.error("--confidence must be between 0 and 1")
+    args.z = NormalDist().inv_cdf(0.5 + args.confidence / 2)
+    if args.target != "scenario" or args.expect == "hid":
+        loc = discover.resolve(args.i2c_bus)
+        args.i2c_bus, args.hid_device = loc.bus, loc.hid_device
+
+    target = {"scenario": ScenarioTarget, "loader": LoaderTarget, "recovery": RecoveryTarget}[args.target](args)
+    names = [x.strip() for x in args.delays.split(",") if x.strip()] or list(target.delays)
+    for name in names:
+        if name not in target.delays:
+            ap.error(f"unknown delay {name}; choose from {', '.join(target.delays)}")
+    if not names:
+        ap.error("target has no named delays to tune")
+
+    print("=== HX Delay Autotuner ===")
+    print(
+        f"target={args.target} trials<={args.trials} min_success={args.min_success} "
+        f"confidence={args.confidence} margin={args.margin}"
+    )
+    delays = dict(target.delays)
+    results = {}
+    t0 = time.monotonic()
+    try:
+        for name in names:
+            print(f"\n[{name}] start={delays[name] * 1000:.1f} ms")
+            results[name] = tune_one(target, delays, name, args)
+    finally:
+        target.close()
+
+    print(f"\n=== Timing profile ({time.monotonic() - t0:.0f}s) ===")
+    for name, r in results.items():
+        print(f"{name:32s} {r['from_s'] * 1000:8.1f} ms -> {r['to_s'] * 1000:8.1f} ms  trials={r['trials']}")
+    if not args.dry_run:
+        hx_profile.save_timing({n: delays[n] for n in results}, results)
+        print(f"written: {hx_profile.TIMING_PROFILE}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
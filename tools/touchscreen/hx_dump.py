@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Bulk dump of HX83121A SRAM and register windows.
+
+Reads use the bridge's auto-increment mode (0x0D = 0x13) so one
+transaction returns up to --chunk bytes instead of one 32-bit word:
+
+  SPI  one SPI_IOC_MESSAGE per chunk: F2 00 addr, F2 0C 00, F3 08 00+n
+       (hx83121a.spi splits chunks above spidev's bufsiz into messages)
+  I2C  one I2C_RDWR per chunk: [0x00 addr] write + n-byte read
+
+--chunk defaults to 4088 on SPI and to the read length the bus profile
+allows on I2C (hx_caps.py; 4088 if the adapter was never probed). It is
+rounded down to whole words, so at least 4, and on I2C capped at 65532:
+an i2c_msg length is 16 bits.
+
+Each region streams to <out>/<name>.bin with progress and throughput on
+stderr; manifest.json records base, length and IC status per region.
+`diff` compares a dump against a firmware image partition by partition
+(parse_partition_table), which is what post-mortem analysis needs:
+which partition changed, where, and whether the window read back as
+0x78787878 (read-protected while firmware runs).
+
+Usage:
+  hx_dump.py dump --bus spi --region code --region fwcfg -o /tmp/dump
+  hx_dump.py dump --bus i2c --range 0x20000000:0x20000 -o /tmp/dump
+  hx_dump.py diff /tmp/dump --firmware hx83121a_gaokun_fw.bin
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+import hx83121a.profile as hx_profile
+import hx_trace
+from hx83121a import broker, discover
+from hx83121a.regs import (
+    ADDR_IC_STATUS,
+    BURST_CONTINUOUS,
+    INCR4,
+    INCR4_AUTO,
+    PROTECTED_WORD,
+    REG_AHB_ADDR,
+    REG_AHB_DATA,
+    REG_AHB_READ,
+    REG_BURST,
+    REG_INCR,
+    SPI_READ,
+)
+from hx83121a.spi import SpiBatch, SpiBus, hw_frame
+from load_firmware_i2c import HX83121A_I2C, parse_partition_table, sram_dest
+
+# name: (base, length) -- see the AHB memory map in docs/TOUCHSCREEN.md
+REGIONS = {
+    "flash": (0x00000000, 0x40000),
+    "code": (0x08000000, 0x40000),
+    "fwcfg": (0x10006000, 0x2000),
+    "data": (0x20000000, 0x20000),
+    "tcon": (0x80020000, 0x100),
+    "reload": (0x80050000, 0x100),
+    "core": (0x90000000, 0x1000),
+}
+
+PROTECTED = struct.pack("<I", PROTECTED_WORD)
+# longest read one i2c_msg can carry (its len is a u16)
+I2C_MSG_MAX = 0xFFFF
+
+
+class SpiReader:
+    def __init__(self, bus, chunk: int, speed: int):
+        self.bus = bus
+        self.speed = speed
+        self.chunk = chunk & ~3
+
+    def begin(self) -> None:
+        self.bus.hw(REG_BURST, bytes([BURST_CONTINUOUS]))
+        self.bus.hw(REG_INCR, bytes([INCR4_AUTO]))
+
+    def end(self) -> None:
+        self.bus.hw(REG_INCR, bytes([INCR4]))
+
+    def read(self, addr: int, n: int) -> bytes:
+        batch = SpiBatch(
+            [
+                hw_frame(REG_AHB_ADDR, struct.pack("<I", addr)),
+                hw_frame(REG_AHB_READ, b"\x00"),
+                bytes([SPI_READ, REG_AHB_DATA, 0x00]) + bytes(n),
+            ],
+            self.speed,
+        )
+        self.bus.xfer_many(batch)
+        return bytes(batch.rx[2])[3:]
+
+    def status(self) -> int:
+        return self.bus.ar(ADDR_IC_STATUS) & 0xFF
+
+    def session(self):
+        return broker.session(self.bus)
+
+
+class I2cReader:
+    def __init__(self, dev, chunk: int | None):
+        self.dev = dev
+        self.chunk = min(chunk or dev.caps["max_read"], I2C_MSG_MAX) & ~3
+
+    def begin(self) -> None:
+        self.dev.burst_enable(True)
+
+    def end(self) -> None:
+        self.dev.burst_enable(False)
+
+    def read(self, addr: int, n: int) -> bytes:
+        return self.dev.ahb_read(addr, n)
+
+    def status(self) -> int:
+        return self.dev.ahb_read32(ADDR_IC_STATUS) & 0xFF
+
+    def session(self):
+        return broker.session(self.dev)
+
+
+def parse_range(s: str) -> tuple[int, int]:
+    base, _, length = s.partition(":")
+    return int(base, 0), int(length, 0)
+
+
+def dump_region(reader, base: int, length: int, path: str) -> dict:
+    t0 = time.perf_counter()
+    last = t0
+    done = errors = 0
+    reader.begin()
+    try:
+        with open(path, "wb") as f:
+            while done < length:
+                n = min(reader.chunk, length - done)
+                try:
+                    f.write(reader.read(base + done, n))
+                except OSError:
+                    errors += 1
+                    f.write(bytes(n))  # keep offsets aligned; the manifest records the error
+                done += n
+                now = time.perf_counter()
+                if now - last >= 0.2 or done == length:
+                    last = now
+                    rate = done / (now - t0) / 1024 if now > t0 else 0
+                    print(f"\r  {os.path.basename(path)}: {done}/{length} ({done * 100 // length}%) {rate:.1f} KiB/s",
+                          end="", file=sys.stderr, flush=True)
+    finally:
+        reader.end()  # leave the bridge out of auto-increment even if the dump stops
+    dt = time.perf_counter() - t0
+    print(file=sys.stderr)
+    return {"base": base, "length": length, "seconds": round(dt, 4),
+            "bytes_per_s": round(length / dt) if dt else 0, "chunk": reader.chunk, "read_errors": errors}
+
+
+def open_reader(args: argparse.Namespace):
+    spi = hx_profile.spi_defaults()
+    if args.emulate:
+        import hx_emulator
+
+        device = hx_emulator.HxDevice()
+        if args.bus == "spi":
+            return SpiReader(hx_emulator.EmulatedSpiBus(device), args.chunk or 4088, spi["speed"])
+        return I2cReader(hx_emulator.EmulatedI2C(device), args.chunk)
+    if args.bus == "spi":
+        bus = hx_trace.maybe_record(broker.open_spi(SpiBus, spi["dev"], spi["mode"], spi["speed"]))
+        return SpiReader(bus, args.chunk or 4088, spi["speed"])
+    bus = discover.resolve(args.i2c_bus).bus
+    return I2cReader(hx_trace.maybe_record(broker.open_i2c(HX83121A_I2C, bus)), args.chunk)
+
+
+def diff_against(base: int, data: bytes, fw: bytes) -> list[dict]:
+    rows = []
+    for p in parse_partition_table(fw):
+        dest = sram_dest(p)
+        lo, hi = max(dest, base), min(dest + p["size"], base + len(data))
+        if lo >= hi:
+            continue
+        want = fw[p["fw_offset"] + lo - dest : p["fw_offset"] + hi - dest]
+        got = data[lo - base : hi - base]
+        bad = [i for i in range(0, len(want), 4) if want[i : i + 4] != got[i : i + 4]]
+        rows.append({
+            "partition": f"{dest:08x}",
+            "type": p["type"],
+            "compared": hi - lo,
+            "mismatched_words": len(bad),
+            "first_mismatch": f"{lo + bad[0]:08x}" if bad else None,
+            "protected_words": sum(1 for i in range(0, len(got), 4) if got[i : i + 4] == PROTECTED),
+        })
+    return rows
+
+
+def print_diff(name: str, rows: list[dict]) -> int:
+    bad = 0
+    for r in rows:
+        state = "MATCH" if not r["mismatched_words"] else f"DIFF {r['mismatched_words']} words from {r['first_mismatch']}"
+        if r["protected_words"] * 4 == r["compared"]:
+            state = "read-protected (0x78787878)"
+        bad += r["mismatched_words"] > 0
+        print(f"{name:8s} {r['type']:6s} {r['partition']} {r['compared']:7d} bytes  {state}")
+    return bad
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    d = sub.add_parser("dump")
+    d.add_argument("--bus", choices=["spi", "i2c"], default="spi")
+    d.add_argument("--i2c-bus", type=int, help="default: hx83121a.discover")
+    d.add_argument("--region", action="append", choices=sorted(REGIONS), default=[])
+    d.add_argument("--range", action="append", type=parse_range, default=[], help="BASE:LEN")
+    d.add_argument("--chunk", type=int, default=None, help="bytes per burst read (default: see above)")
+    d.add_argument("--diff", metavar="FW", help="diff against this firmware image when done")
+    d.add_argument("--emulate", action="store_true", help="dump hx_emulator instead of hardware")
+    d.add_argument("-o", "--out", required=True, help="output directory")
+    f = sub.add_parser("diff")
+    f.add_argument("dump", help="dump directory (manifest.json) or a single .bin")
+    f.add_argument("--firmware", required=True)
+    f.add_argument("--base", type=lambda s: int(s, 0), default=REGIONS["code"][0], help="base for a single .bin")
+    args = ap.parse_args()
+
+    if args.cmd == "dump":
+        if args.chunk is not None and args.chunk < 4:
+            ap.error("--chunk must be at least 4 (one word)")
+        todo = [(name, *REGIONS[name]) for name in args.region]
+        todo += [(f"{base:08x}", base, length) for base, length in args.range]
+        if not todo:
+            todo = [("code", *REGIONS["code"])]
+        os.makedirs(args.out, exist_ok=True)
+        reader = open_reader(args)
+        manifest = {"bus": args.bus, "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "device": hx_profile.device_info(), "regions": {}}
+        try:
+            # burst mode is bridge state: no other broker client in between
+            with reader.session():
+                manifest["status_before"] = reader.status()
+                for name, base, length in todo:
+                    manifest["regions"][name] = dump_region(reader, base, length, os.path.join(args.out, f"{name}.bin"))
+                manifest["status_after"] = reader.status()
+        finally:
+            hx_profile.write_json(os.path.join(args.out, "manifest.json"), manifest)
+        total = sum(r["length"] for r in manifest["regions"].values())
+        secs = sum(r["seconds"] for r in manifest["regions"].values())
+        print(f"dumped {total} bytes in {secs:.2f}s ({total / secs / 1024 if secs else 0:.1f} KiB/s) to {args.out}")
+        if not args.diff:
+            return 0
+        args.dump, args.firmware = args.out, args.diff
+
+    with open(args.firmware, "rb") as fh:
+        fw = fh.read()
+    if os.path.isdir(args.dump):
+        regions = hx_profile.read_json(os.path.join(args.dump, "manifest.json")).get("regions", {})
+        files = [(name, os.path.join(args.dump, f"{name}.bin"), r["base"]) for name, r in regions.items()]
+    else:
+        files = [(os.path.basename(args.dump), args.dump, args.base)]
+    bad = 0
+    for name, path, base in files:
+        with open(path, "rb") as fh:
+            bad += print_diff(name, diff_against(base, fh.read(), fw))
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
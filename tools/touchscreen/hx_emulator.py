@@ -0,0 +1,302 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Software stand-in for the HX83121A SPI and I2C AHB bridge.
+
+Models just enough of the chip for tool development and benchmarks
+without hardware: the F2/F3 register framing, the AHB address/data
+bridge (cmd 0x00/0x0C/0x08) with optional auto-increment (0x0D bit 0),
+the safe-mode password, the status transitions the wakeup scenarios
+and sense_on rely on, the reload-engine CRC and spidev's bufsiz limit
+(per message; chip select held across messages by cs_change on the last
+transfer joins them into one frame, as on spidev). It is not cycle accurate.
+
+EmulatedSpiBus is a drop-in for hx83121a.spi.SpiBus and EmulatedI2C
+for load_firmware_i2c.HX83121A_I2C; both can share one HxDevice.
+EmulatedI2C can also model an adapter's limits (max_len bytes per
+message, max_msgs per I2C_RDWR) the way the kernel rejects them, for
+hx_caps.py's probes. It never reads the host's bus profile: caps are
+BUS_DEFAULTS unless given.
+"""
+
+import ctypes
+import errno
+import random
+import struct
+import zlib
+
+from hx83121a import profile
+from hx83121a.i2c import I2C_M_RD, I2C_MSG, I2C_RDWR_MAX_MSGS
+from hx83121a.regs import (
+    ADDR_ACTIV_RELOD,
+    ADDR_CODE_SRAM as CODE_SRAM,
+    ADDR_CRC_ADDR,
+    ADDR_CRC_CMD,
+    ADDR_HANDSHAKE,
+    ADDR_IC_ID,
+    ADDR_IC_STATUS as ADDR_STATUS,
+    ADDR_LEAVE_SAFE,
+    ADDR_RELOAD_CRC32,
+    ADDR_SYSTEM_RESET,
+    CODE_SRAM_SIZE,
+    DATA_ACTIV_RELOD,
+    DATA_LEAVE_SAFE,
+    DATA_SYSTEM_RESET,
+    I2C_ADDR_AHB,
+    IC_ID,
+    INCR4,
+    PROTECTED_WORD,
+    REG_AHB_ADDR,
+    REG_AHB_DATA,
+    REG_AHB_READ,
+    REG_BURST,
+    REG_EVENT,
+    REG_INCR,
+    REG_SAFE_PW1,
+    REG_SAFE_PW2,
+    SAFE_PW,
+    SPI_READ,
+    SPI_WRITE,
+    STATUS_FW_RUNNING,
+    STATUS_IDLE,
+    STATUS_SAFE_MODE,
+)
+from hx83121a.spi import SpiBus
+from load_firmware_i2c import HX83121A_I2C
+
+
+class HxDevice:
+    """Register/memory model of one HX83121A behind the SPI bridge."""
+
+    def __init__(self, bufsiz: int = 4096, fail_above_hz: int | None = None, seed: int = 0):
+        self.bufsiz = bufsiz
+        self.fail_above_hz = fail_above_hz
+        self.rng = random.Random(seed)
+        self.mem: dict[int, int] = {}
+        self.regs: dict[int, int] = {}
+        self.addr = 0
+        self.read_ptr = 0
+        self.status = STATUS_IDLE
+        self.event_frame: bytes | None = None
+        self.transfers = 0
+        self.bytes = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.regs = {REG_BURST: 0x00, REG_INCR: INCR4}
+        self.mem[ADDR_IC_ID] = IC_ID
+        self.mem[ADDR_HANDSHAKE] = 0x000000F8
+
+    @property
+    def auto_increment(self) -> bool:
+        return bool(self.regs.get(REG_INCR, 0) & 0x01)
+
+    def read_word(self, addr: int) -> int:
+        if addr == ADDR_STATUS:
+            return self.status
+        if CODE_SRAM <= addr < CODE_SRAM + CODE_SRAM_SIZE and self.status == STATUS_FW_RUNNING:
+            return PROTECTED_WORD  # read-protected while firmware runs
+        return self.mem.get(addr & ~3, 0)
+
+    def write_word(self, addr: int, value: int) -> None:
+        addr &= ~3
+        self.mem[addr] = value
+        if addr == ADDR_SYSTEM_RESET and value == DATA_SYSTEM_RESET:
+            self.status = STATUS_IDLE
+            self.reset()
+        elif addr == ADDR_ACTIV_RELOD and value == DATA_ACTIV_RELOD:
+            self.status = STATUS_FW_RUNNING
+        elif addr == ADDR_LEAVE_SAFE and value == DATA_LEAVE_SAFE and self.status == STATUS_SAFE_MODE:
+            self.status = STATUS_FW_RUNNING
+        elif addr == ADDR_CRC_CMD and value & 0xFF == 0x99:
+            # reload-engine CRC over (value >> 8) bytes; zlib's CRC-32 stands
+            # in for the chip's polynomial, only equality matters to callers
+            base = self.mem.get(ADDR_CRC_ADDR, 0)
+            words = b"".join(struct.pack("<I", self.mem.get(base + i, 0)) for i in range(0, value >> 8, 4))
+            self.mem[ADDR_RELOAD_CRC32] = zlib.crc32(words)
+
+    def ahb_write(self, data: bytes) -> None:
+        self.addr = struct.unpack_from("<I", data)[0]
+        step = 4 if self.auto_increment else 0
+        a = self.addr
+        for off in range(4, len(data) - 3, 4):
+            self.write_word(a, struct.unpack_from("<I", data, off)[0])
+            a += step
+
+    def ahb_read(self, n: int) -> bytes:
+        step = 4 if self.auto_increment else 0
+        out = bytearray()
+        a = self.read_ptr
+        while len(out) < n:
+            out += struct.pack("<I", self.read_word(a))
+            a += step
+        return bytes(out[:n])
+
+    def reg_write(self, cmd: int, payload: bytes) -> None:
+        if cmd == REG_AHB_ADDR:
+            self.ahb_write(payload)
+        elif cmd == REG_AHB_READ:
+            self.read_ptr = self.addr
+        elif cmd in (REG_SAFE_PW1, REG_SAFE_PW2):
+            self.regs[cmd] = payload[0] if payload else 0
+            pw = (self.regs.get(REG_SAFE_PW1), self.regs.get(REG_SAFE_PW2))
+            if pw == SAFE_PW:
+                self.status = STATUS_SAFE_MODE
+            elif self.status == STATUS_SAFE_MODE and pw == (0, 0):
+                self.status = STATUS_IDLE
+        elif payload:
+            self.regs[cmd] = payload[0]
+
+    def reg_read(self, cmd: int, n: int) -> bytes:
+        if cmd == REG_AHB_DATA:
+            return self.ahb_read(n)
+        if cmd == REG_EVENT:
+            f = self.event_frame or b""
+            return (f + bytes(n))[:n]
+        return bytes([self.regs.get(cmd, 0)]) + bytes(max(0, n - 1))
+
+    def transfer(self, tx: bytes, speed: int) -> bytes:
+        """One chip-select frame; returns the full-duplex rx bytes."""
+        self.transfers += 1
+        self.bytes += len(tx)
+        rx = bytearray(len(tx))
+        if len(tx) >= 2 and tx[0] == SPI_WRITE:
+            self.reg_write(tx[1], bytes(tx[2:]))
+        elif len(tx) >= 3 and tx[0] == SPI_READ:
+            rx[3:] = self.reg_read(tx[1], len(tx) - 3)
+        if self.fail_above_hz and speed > self.fail_above_hz and len(rx) > 3:
+            i = self.rng.randrange(3, len(rx))
+            rx[i] ^= 1 << self.rng.randrange(8)
+        return bytes(rx)
+
+
+class EmulatedSpiBus(SpiBus):
+    """SpiBus whose ioctls are served by an HxDevice instead of spidev."""
+
+    def __init__(self, device: HxDevice | None = None, mode: int = 3, speed: int = 1_000_000):
+        self.device = device or HxDevice()
+        self.fd = -1
+        self.mode = mode
+        self.speed = speed
+        self.bufsiz = self.device.bufsiz  # what sysfs would report
+        self.ioctls = 0
+        self.frame = bytearray()  # chip select held across messages
+        self.frame_rx: list[tuple[int, int]] = []
+
+    def close(self) -> None:
+        pass
+
+    def xfer(self, tx, total_len: int | None = None) -> bytes:
+        b = bytearray(tx)
+        if total_len is not None:
+            b.extend(bytes(max(0, total_len - len(b))))
+        if len(b) > self.bufsiz:
+            return SpiBus.xfer(self, b)
+        if len(b) > self.device.bufsiz:
+            e = OSError(errno.EMSGSIZE, "Message too long")
+            if not self._shrink(e, len(b)):
+                raise e
+            return type(self).xfer(self, b)
+        self.ioctls += 1
+        return self.device.transfer(bytes(b), self.speed)
+
+    def _message(self, request: int, xfers) -> None:
+        if sum(x.len for x in xfers) > self.device.bufsiz:
+            raise OSError(errno.EMSGSIZE, "Message too long")
+        self.ioctls += 1
+        last = len(xfers) - 1
+        for i, x in enumerate(xfers):
+            self.frame += ctypes.string_at(x.tx_buf, x.len)
+            self.frame_rx.append((x.rx_buf, x.len))
+            if bool(x.cs_change) == (i == last):
+                continue  # chip select stays asserted: the frame goes on
+            rx = self.device.transfer(bytes(self.frame), self.speed)
+            off = 0
+            for addr, n in self.frame_rx:
+                ctypes.memmove(addr, rx[off : off + n], n)
+                off += n
+            self.frame.clear()
+            self.frame_rx.clear()
+
+
+class EmulatedI2C(HX83121A_I2C):
+    """Stand-in for load_firmware_i2c.HX83121A_I2C on the same HxDevice.
+
+    Only the two I2C_RDWR primitives are replaced, so every higher-level
+    method of the real class (ahb_read, write_sram, ...) runs unchanged.
+    """
+
+    def __init__(
+        self,
+        device: HxDevice | None = None,
+        bus_num: int = 4,
+        caps: dict | None = None,
+        max_len: int | None = None,
+        max_msgs: int = I2C_RDWR_MAX_MSGS,
+    ):
+        self.device = device or HxDevice()
+        self.fd = -1
+        self.bus_num = bus_num
+        self.ioctls = 0
+        self._caps = dict(caps or profile.BUS_DEFAULTS["i2c"])
+        self.max_len = max_len
+        self.max_msgs = max_msgs
+
+    def _check_len(self, *lengths):
+        # i2c_check_for_quirks(): the adapter refuses the whole transfer
+        if self.max_len is not None and max(lengths) > self.max_len:
+            raise OSError(errno.EOPNOTSUPP, "message longer than the adapter allows")
+
+    def close(self):
+        pass
+
+    def _i2c_write(self, addr, data):
+        self.ioctls += 1
+        EmulatedI2C._check_len(self, len(data))
+        if addr != I2C_ADDR_AHB:
+            return
+        data = bytes(data)
+        if data:
+            self.device.reg_write(data[0], data[1:])
+
+    def _i2c_combined(self, addr, wdata, rlen):
+        self.ioctls += 1
+        EmulatedI2C._check_len(self, len(wdata), rlen)
+        wdata = bytes(wdata)
+        if addr != I2C_ADDR_AHB or not wdata:
+            return bytes(rlen)
+        if wdata[0] == REG_AHB_ADDR and len(wdata) >= 5:
+            # loader-style ahb_read: address write + repeated-start read
+            self.device.reg_write(REG_AHB_ADDR, wdata[1:5])
+            self.device.reg_write(REG_AHB_READ, b"\x00")
+            return self.device.reg_read(REG_AHB_DATA, rlen)
+        return self.device.reg_read(wdata[0], rlen)
+
+    def xfer_many(self, batch):
+        """One I2C_RDWR: a write followed by a read is a combined transfer.
+
+        Goes through the class primitives, not the instance attributes that
+        hx_trace wraps, so a recorded batch is traced once.
+        """
+        if batch.n == 1 and not batch.rx:  # a plan's writes (I2cBatch.singles)
+            addr, _, n, ptr = I2C_MSG.unpack_from(batch.msgs, batch.first * I2C_MSG.size)
+            EmulatedI2C._i2c_write(self, addr, ctypes.string_at(ptr, n))
+            return
+        ioctls = self.ioctls
+        spec = batch.spec
+        if len(spec) > self.max_msgs:
+            self.ioctls = ioctls + 1
+            raise OSError(errno.EINVAL, "too many messages in one I2C_RDWR")
+        EmulatedI2C._check_len(self, *(d if flags & I2C_M_RD else len(d) for _, flags, d in spec))
+        rx = iter(batch.rx)
+        i = 0
+        while i < len(spec):
+            addr, flags, d = spec[i]
+            if flags & I2C_M_RD:
+                next(rx)[:] = bytes(d)  # read with no register addressed
+                i += 1
+            elif i + 1 < len(spec) and spec[i + 1][1] & I2C_M_RD:
+                next(rx)[:] = EmulatedI2C._i2c_combined(self, addr, d, spec[i + 1][2])
+                i += 2
+            else:
+                EmulatedI2C._i2c_write(self, addr, d)
+                i += 1
+        self.ioctls = ioctls + 1
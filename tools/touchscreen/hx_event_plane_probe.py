@@ -8,88 +8,34 @@ Focus:
 """
 
 import argparse
-import array
-import ctypes
-import fcntl
 import hashlib
-import os
-import struct
 import time
 
-
-SPI_IOC_WR_MODE = 0x40016B01
-SPI_IOC_WR_BITS_PER_WORD = 0x40016B03
-SPI_IOC_WR_MAX_SPEED_HZ = 0x40046B04
-
-
-def spi_ioc_message(n: int) -> int:
-    return 0x40006B00 | (n * 32 << 16)
-
-
-class SpiIocTransfer(ctypes.Structure):
-    _fields_ = [
-        ("tx_buf", ctypes.c_uint64),
-        ("rx_buf", ctypes.c_uint64),
-        ("len", ctypes.c_uint32),
-        ("speed_hz", ctypes.c_uint32),
-        ("delay_usecs", ctypes.c_uint16),
-        ("bits_per_word", ctypes.c_uint8),
-        ("cs_change", ctypes.c_uint8),
-        ("tx_nbits", ctypes.c_uint8),
-        ("rx_nbits", ctypes.c_uint8),
-        ("word_delay_usecs", ctypes.c_uint8),
-        ("pad", ctypes.c_uint8),
-    ]
-
-
-class Bus:
-    def __init__(self, dev: str, mode: int, speed: int):
-        self.fd = os.open(dev, os.O_RDWR)
-        self.speed = speed
-        fcntl.ioctl(self.fd, SPI_IOC_WR_MODE, array.array("B", [mode]))
-        fcntl.ioctl(self.fd, SPI_IOC_WR_BITS_PER_WORD, array.array("B", [8]))
-        fcntl.ioctl(self.fd, SPI_IOC_WR_MAX_SPEED_HZ, array.array("I", [speed]))
-
-    def close(self) -> None:
-        os.close(self.fd)
-
-    def xfer(self, tx: bytes | bytearray | list[int], total_len: int | None = None) -> bytes:
-        b = bytearray(tx)
-        if total_len is None:
-            total_len = len(b)
-        b.extend(b"\x00" * max(0, total_len - len(b)))
-        n = total_len
-        tb = (ctypes.c_uint8 * n)(*b[:n])
-        rb = (ctypes.c_uint8 * n)()
-        x = SpiIocTransfer()
-        x.tx_buf = ctypes.addressof(tb)
-        x.rx_buf = ctypes.addressof(rb)
-        x.len = n
-        x.speed_hz = self.speed
-        x.bits_per_word = 8
-        fcntl.ioctl(self.fd, spi_ioc_message(1), x)
-        return bytes(rb)
-
-    def hw(self, cmd: int, payload: bytes = b"") -> None:
-        self.xfer([0xF2, cmd] + list(payload))
-
-    def hr(self, cmd: int, n: int) -> bytes:
-        out = self.xfer([0xF3, cmd, 0x00] + [0] * n)
-        return out[3 : 3 + n]
-
-    def burst(self) -> None:
-        self.hw(0x13, b"\x31")
-        self.hw(0x0D, b"\x12")
-
-    def ar(self, addr: int) -> int:
-        self.burst()
-        self.hw(0x00, struct.pack("<I", addr))
-        self.hw(0x0C, b"\x00")
-        return struct.unpack("<I", self.hr(0x08, 4))[0]
-
-    def aw(self, addr: int, value: int) -> None:
-        self.burst()
-        self.hw(0x00, struct.pack("<I", addr) + struct.pack("<I", value))
+import hx83121a.profile as hx_profile
+import hx83121a.rt as hx_rt
+import hx_capture
+import hx_trace
+from hx83121a import broker
+from hx83121a.regs import (
+    ADDR_ACTIV_RELOD,
+    ADDR_FW_ISR_CTRL,
+    ADDR_HANDSHAKE,
+    ADDR_IC_ID,
+    ADDR_IC_STATUS,
+    ADDR_RAW_OUT_SEL_FW,
+    ADDR_RELOAD_STATUS,
+    DATA_ACTIV_RELOD,
+    DATA_FW_STOP,
+    REG_EVENT,
+    REG_SAFE_PW1,
+    REG_SAFE_PW2,
+    SAFE_PW,
+    SPI_READ,
+)
+from hx83121a.spi import SpiBatch, SpiBus as Bus
+
+
+DELAYS = hx_profile.load_timing("probe", {"fw_stop": 0.03, "activ_relod": 0.20})
 
 
 def sha12(data: bytes) -> str:
@@ -101,7 +47,7 @@ def nz(data: bytes) -> int:
 
 
 def sample30(bus: Bus, nbytes: int) -> tuple[int, str]:
-    p = bus.hr(0x30, nbytes)
+    p = bus.hr(REG_EVENT, nbytes)
     return nz(p), sha12(p)
 
 
@@ -109,41 +55,47 @@ def dump_state(bus: Bus, tag: str, nbytes: int) -> None:
     n, h = sample30(bus, nbytes)
     print(
         f"{tag}: "
-        f"icid=0x{bus.ar(0x900000D0):08x} "
-        f"status=0x{bus.ar(0x900000A8):08x} "
-        f"hs=0x{bus.ar(0x900000AC):08x} "
-        f"fw=0x{bus.ar(0x9000005C):08x} "
-        f"raw_out=0x{bus.ar(0x100072EC):08x} "
-        f"r0=0x{bus.ar(0x80050000):08x} "
+        f"icid=0x{bus.ar(ADDR_IC_ID):08x} "
+        f"status=0x{bus.ar(ADDR_IC_STATUS):08x} "
+        f"hs=0x{bus.ar(ADDR_HANDSHAKE):08x} "
+        f"fw=0x{bus.ar(ADDR_FW_ISR_CTRL):08x} "
+        f"raw_out=0x{bus.ar(ADDR_RAW_OUT_SEL_FW):08x} "
+        f"r0=0x{bus.ar(ADDR_RELOAD_STATUS):08x} "
         f"cmd30_nz={n} cmd30_sha={h}"
     )
 
 
 def enter_safe(bus: Bus) -> None:
-    bus.hw(0x31, b"\x27")
-    bus.hw(0x32, b"\x95")
+    bus.hw(REG_SAFE_PW1, bytes([SAFE_PW[0]]))
+    bus.hw(REG_SAFE_PW2, bytes([SAFE_PW[1]]))
 
 
 def leave_safe(bus: Bus) -> None:
-    bus.hw(0x31, b"\x00")
-    bus.hw(0x32, b"\x00")
+    bus.hw(REG_SAFE_PW1, b"\x00")
+    bus.hw(REG_SAFE_PW2, b"\x00")
 
 
 def force_status_05(bus: Bus) -> None:
-    bus.aw(0x9000005C, 0x000000A5)
-    time.sleep(0.03)
-    bus.aw(0x90000048, 0x000000EC)
-    time.sleep(0.20)
+    bus.aw(ADDR_FW_ISR_CTRL, DATA_FW_STOP)
+    time.sleep(DELAYS["fw_stop"])
+    bus.aw(ADDR_ACTIV_RELOD, DATA_ACTIV_RELOD)
+    time.sleep(DELAYS["activ_relod"])
 
 
 def main() -> int:
+    spi = hx_profile.spi_defaults()
     ap = argparse.ArgumentParser()
-    ap.add_argument("--dev", default="/dev/spidev0.0")
-    ap.add_argument("--mode", type=int, default=3)
-    ap.add_argument("--speed", type=int, default=1_000_000)
+    ap.add_argument("--dev", default=spi["dev"])
+    ap.add_argument("--mode", type=int, default=spi["mode"])
+    ap.add_argument("--speed", type=int, default=spi["speed"])
     ap.add_argument("--nbytes", type=int, default=512)
     ap.add_argument("--poll-count", type=int, default=120)
     ap.add_argument("--poll-interval-ms", type=int, default=20)
+    ap.add_argument("--capture", help="store every polled cmd 0x30 frame (see hx_capture.py)")
+    ap.add_argument("--keyframe-interval", type=int, default=256)
+    ap.add_argument("--rt", action="store_true", help="SCHED_FIFO + CPU pinning + mlockall for the poll loop")
+    ap.add_argument("--rt-prio", type=int, default=50)
+    ap.add_argument("--rt-cpu", type=int, help="pin to this CPU in --rt mode")
     args = ap.parse_args()
 
     print("=== HX Event Plane Probe ===")
@@ -151,7 +103,7 @@ def main() -> int:
         f"dev={args.dev} mode={args.mode} speed={args.speed} "
         f"nbytes={args.nbytes} poll_count={args.poll_count}"
     )
-    bus = Bus(args.dev, args.mode, args.speed)
+    bus = hx_trace.maybe_record(broker.open_spi(Bus, args.dev, args.mode, args.speed))
     try:
         leave_safe(bus)
         dump_state(bus, "initial", args.nbytes)
@@ -160,10 +112,10 @@ def main() -> int:
         values = [0x00000000, 0x00000001, 0x00000002, 0x00000003, 0x00000004, 0x00000005, 0x0000000A]
         print("\n[raw_out_sel sweep]")
         for v in values:
-            bus.aw(0x100072EC, v)
+            bus.aw(ADDR_RAW_OUT_SEL_FW, v)
             time.sleep(0.03)
             n, h = sample30(bus, args.nbytes)
-            status = bus.ar(0x900000A8)
+            status = bus.ar(ADDR_IC_STATUS)
             print(f"raw_out_sel=0x{v:08x} status=0x{status:08x} cmd30_nz={n} cmd30_sha={h}")
 
         print("\n[force status 0x05 then burst poll]")
@@ -172,20 +124,34 @@ def main() -> int:
 
         seen = set()
         nonzero_hits = 0
+        cap = hx_capture.CaptureWriter(args.capture, args.keyframe_interval) if args.capture else None
+        # One prebuilt transfer reused every poll: no per-iteration ctypes setup.
+        read30 = SpiBatch([bytes([SPI_READ, REG_EVENT, 0x00]) + bytes(args.nbytes)], args.speed)
+        if args.rt:
+            hx_rt.prefault(read30.rx[0])
+            print("rt: " + " ".join(f"{k}={v}" for k, v in hx_rt.enter_realtime(args.rt_prio, args.rt_cpu).items()))
+        pacer = hx_rt.Pacer(args.poll_interval_ms / 1000.0)
         for i in range(args.poll_count):
-            p = bus.hr(0x30, args.nbytes)
+            bus.xfer_many(read30)
+            p = bytes(read30.rx[0])[3:]
+            if cap:
+                cap.add(p)
             n = nz(p)
             h = sha12(p)
             seen.add(h)
             if n > 0:
                 nonzero_hits += 1
                 print(f"hit iter={i:03d} nz={n} sha={h}")
-            time.sleep(args.poll_interval_ms / 1000.0)
+            pacer.wait()
+        if cap:
+            cap.close()
+            print(f"capture: {args.capture} frames={cap.frames} raw={cap.raw_bytes}")
 
         print(
             f"poll_summary: unique_hashes={len(seen)} "
             f"nonzero_hits={nonzero_hits}/{args.poll_count}"
         )
+        print(pacer.meter.line("poll_interval") + f" missed={pacer.missed}")
         dump_state(bus, "final", args.nbytes)
         leave_safe(bus)
     finally:
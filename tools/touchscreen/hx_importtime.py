@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Import-time budget check for the boot-path entry points.
+
+Each entry point is imported in a fresh `python3 -X importtime` and the
+self time of every module it pulls in beyond the interpreter's own
+startup set is summed. The best of --runs is compared against its budget
+(milliseconds on the target machine), and the slowest modules are listed
+so a regression points at the import that caused it.
+
+Usage:
+  hx_importtime.py                  # all entry points
+  hx_importtime.py recovery busd    # some of them
+  hx_importtime.py --runs 10 --top 15
+
+Exit status is 1 if any entry point is over budget.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOUCHPAD = os.path.join(HERE, "..", "touchpad", "huawei-tp-activate.py")
+
+# name: (module or script path, budget in ms). Budgets are the measured
+# cost plus ~50% headroom; an entry point that starts importing json,
+# subprocess or ctypes.util at module level blows through it.
+TARGETS = {
+    "recovery": ("hx83121a.recovery", 15.0),
+    "touchpad": (TOUCHPAD, 20.0),
+    "resumed": ("hx_resumed", 35.0),
+    "loader": ("load_firmware_i2c", 25.0),
+    "busd": ("hx_busd", 30.0),
+}
+
+# Script files without an importable name are loaded through importlib.util,
+# which is then part of the baseline so it is not charged to the script.
+# -X importtime does not report exec_module() itself, so the loader prints
+# its duration and the script's own time is that minus its imports.
+SCRIPT_LOADER = (
+    "import importlib.util as u, sys, time; "
+    "s = u.spec_from_file_location('target', {path!r}); m = u.module_from_spec(s); "
+    "t = time.perf_counter_ns(); s.loader.exec_module(m); "
+    "sys.stderr.write(f'exec time: {{(time.perf_counter_ns() - t) // 1000}}\\n')"
+)
+
+
+def importtime(code: str) -> dict[str, int]:
+    """Module -> self time (us) for `python3 -X importtime -c code`."""
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+    )
+    if r.returncode:
+        raise RuntimeError(r.stderr.strip().splitlines()[-1] if r.stderr.strip() else f"exit {r.returncode}")
+    out = {}
+    for line in r.stderr.splitlines():
+        if line.startswith("exec time:"):
+            out[None] = int(line.split(":")[1])
+            continue
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|", 2)
+        if self_us.strip().isdigit():
+            out[name.strip()] = int(self_us)
+    return out
+
+
+def measure(target: str, runs: int) -> tuple[float, list[tuple[int, str]]]:
+    """Best total (ms) over runs and the per-module self times of that run."""
+    script = target.endswith(".py")
+    if script:
+        baseline_code = "import importlib.util, sys, time"
+        code = SCRIPT_LOADER.format(path=os.path.abspath(target))
+    else:
+        baseline_code = "pass"
+        code = f"import {target}"
+    baseline = set(importtime(baseline_code))
+    best = None
+    for _ in range(runs):
+        times = importtime(code)
+        mods = [(us, m) for m, us in times.items() if m is not None and m not in baseline]
+        if script:
+            mods.append((times[None] - sum(us for us, _ in mods), os.path.basename(target)))
+        mods.sort(reverse=True)
+        total = sum(us for us, _ in mods) / 1000
+        if best is None or total < best[0]:
+            best = (total, mods)
+    return best
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Check entry-point import time against budgets.")
+    ap.add_argument("targets", nargs="*", help=f"entry points: {', '.join(TARGETS)} (default: all)")
+    ap.add_argument("--runs", type=int, default=5, help="imports per entry point; the fastest counts")
+    ap.add_argument("--top", type=int, default=8, help="slowest modules listed per entry point")
+    args = ap.parse_args()
+    for name in args.targets:
+        if name not in TARGETS:
+            ap.error(f"unknown entry point {name!r}")
+
+    over = 0
+    for name in args.targets or TARGETS:
+        target, budget = TARGETS[name]
+        try:
+            total, mods = measure(target, args.runs)
+        except RuntimeError as e:
+            print(f"{name:10s} import failed: {e}")
+            over += 1
+            continue
+        ok = total <= budget
+        over += not ok
+        print(f"{name:10s} {total:6.1f} ms / {budget:.0f} ms  {'ok' if ok else 'OVER BUDGET'}  ({len(mods)} modules)")
+        for us, m in mods[: args.top]:
+            print(f"    {us / 1000:6.2f} ms  {m}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Precompiled I2C transaction plans for the firmware load sequence.
+
+load_firmware() recomputes every address, struct and ctypes message on
+each boot although, for a given image, the sequence never changes. The
+plan compiler walks the same sequence once and records it as data:
+
+  Batch    a run of writes between barriers, each sent as its own
+           single-message I2C_RDWR
+  Wait     a delay, by loader.DELAYS name (resolved when the plan runs,
+           so a retuned timing profile needs no recompile) or in seconds
+  Check    a read batch whose word must (not) equal want under mask,
+           retried up to tries times; a failed required check aborts
+  Capture  a read batch whose word is stored under key (partition CRCs)
+  Log      a progress line
+
+Every message of the plan lives in one payload blob and one table of
+native i2c_msg entries (buf holding an offset into the blob); items refer
+to spans of the table. That is what /var/lib/hx83121a/plans/<image
+sha256>.hxlp stores (with a -w<max_write> suffix when the bus profile's
+write size is not the default), so loading a plan is one buffer copy,
+one pass that turns offsets into addresses, and an I2cBatch view per
+message, with no per-message packing. The file records the format
+version, the i2c_msg layout and a hash of the source that compiles the
+sequence (this file and load_firmware_i2c.py); a plan that differs in
+any of them is recompiled, so editing the sequence never runs a stale
+plan.
+
+The plan writes what load_firmware() writes, in the same order and with
+the same transactions: one I2C_RDWR per write, since a run of writes
+joined by repeated starts was never verified on this bridge. It keeps
+the checks; the status reads load_firmware() only prints are left out.
+SRAM writes are max_write bytes each, from the bus profile (hx_caps.py).
+What the plan saves is the per-word Python work, not ioctls.
+
+Usage:
+  hx_loadplan.py compile firmware.bin      # (re)write the cached plan
+  hx_loadplan.py show firmware.bin         # list the plan
+  load_firmware_i2c.py firmware.bin --plan # load through the plan
+"""
+
+import argparse
+import ctypes
+import hashlib
+import os
+import struct
+import sys
+from dataclasses import dataclass, field
+
+import hx83121a.profile as hx_profile
+import hx83121a.rt as hx_rt
+from hx83121a.i2c import I2C_MSG, I2cBatch, i2c_caps, i2c_msg, pack_msgs, relocate_msgs
+from hx83121a.regs import (
+    ADDR_ADC_RESET,
+    ADDR_CRC_ADDR,
+    ADDR_CRC_CMD,
+    ADDR_FLASH_RELOAD,
+    ADDR_IC_ID,
+    ADDR_IC_STATUS,
+    ADDR_LEAVE_SAFE,
+    ADDR_N_FRAME,
+    ADDR_RAW_OUT_SEL,
+    ADDR_RELOAD_CRC32,
+    ADDR_RELOAD_DONE,
+    ADDR_RELOAD_STATUS,
+    ADDR_SORTING_MODE,
+    ADDR_SYSTEM_RESET,
+    ADDR_TCON_RESET,
+    BURST_CONTINUOUS,
+    DATA_LEAVE_SAFE,
+    DATA_SYSTEM_RESET,
+    I2C_ADDR_AHB,
+    IC_ID,
+    INCR4,
+    INCR4_AUTO,
+    REG_AHB_ADDR,
+    REG_BURST,
+    REG_INCR,
+    REG_SAFE_PW1,
+    REG_SAFE_PW2,
+    SAFE_PW,
+    STATUS_FW_RUNNING,
+    STATUS_SAFE_MODE,
+)
+
+MAGIC = b"HXLP"
+VERSION = 3  # bump when the file format changes; sequence changes are caught by sequence_hash()
+PLAN_DIR = os.environ.get("HX83121A_PLAN_DIR", os.path.join(hx_profile.PROFILE_DIR, "plans"))
+# messages per Batch item, the range of SPAN's count
+BATCH_MSGS = 0xFFFF
+# the modules whose code produces the sequence
+SEQUENCE_SOURCES = ("hx_loadplan.py", "load_firmware_i2c.py")
+
+# magic, version, sizeof(i2c_msg), image sha256, sequence hash, items, payload bytes, messages
+FILE_HDR = struct.Struct("<4sHH32s32sIII")
+SPAN = struct.Struct("<IH")
+CHECK = struct.Struct("<IIBBH")
+WAIT = struct.Struct("<d")
+
+OP_BATCH, OP_WAIT, OP_CHECK, OP_CAPTURE, OP_LOG = range(1, 6)
+CHECK_EQUAL = 0x01
+CHECK_REQUIRED = 0x02
+
+SRAM_TEST_ADDR = 0x08000400
+SRAM_LOCKED = 0x78787878
+
+
+# msgs is a (first, n) span of the plan's message table; prepare() makes
+# an I2cBatch of each (of each message, for a Batch).
+
+
+@dataclass
+class Batch:
+    msgs: tuple
+
+
+@dataclass
+class Wait:
+    name: str  # loader.DELAYS key, or "" for a fixed delay
+    seconds: float
+
+
+@dataclass
+class Check:
+    msgs: tuple
+    mask: int
+    want: int
+    equal: bool
+    required: bool
+    tries: int
+    delay: str  # DELAYS key slept between tries
+    label: str
+
+
+@dataclass
+class Capture:
+    msgs: tuple
+    key: str
+
+
+@dataclass
+class Log:
+    text: str
+
+
+@dataclass
+class Plan:
+    digest: bytes
+    data: bytes  # message payloads
+    table: bytes  # i2c_msg entries, buf relative to data
+    items: list = field(default_factory=list)
+
+
+def ahb_read_msgs(addr: int) -> tuple:
+    return ((I2C_ADDR_AHB, bytes([REG_AHB_ADDR]) + struct.pack("<I", addr)), (I2C_ADDR_AHB, 4))
+
+
+class Compiler:
+    """Collects writes until a barrier, then emits them as batches."""
+
+    def __init__(self, max_write: int = 4):
+        self.max_write = max_write
+        self.items: list = []
+        self.pending: list = []
+        self.data: list[bytes] = []
+        self.table: list[bytes] = []
+        self.offset = 0
+        self.count = 0
+
+    def span(self, msgs) -> tuple:
+        """Append msgs to the message table; returns their (first, n)."""
+        data, table = pack_msgs(msgs, self.offset)
+        self.data.append(data)
+        self.table.append(table)
+        self.offset += len(data)
+        first = self.count
+        self.count += len(msgs)
+        return first, len(msgs)
+
+    def write(self, data: bytes) -> None:
+        self.pending.append((I2C_ADDR_AHB, data))
+
+    def ahb_write32(self, addr: int, value: int) -> None:
+        self.write(struct.pack("<BII", REG_AHB_ADDR, addr, value))
+
+    def reg_write(self, reg: int, value: int) -> None:
+        self.write(bytes([reg, value]))
+
+    def burst_enable(self, enable: bool) -> None:
+        self.reg_write(REG_BURST, BURST_CONTINUOUS)
+        self.reg_write(REG_INCR, INCR4_AUTO if enable else INCR4)
+
+    def flush(self) -> None:
+        for i in range(0, len(self.pending), BATCH_MSGS):
+            self.items.append(Batch(self.span(self.pending[i : i + BATCH_MSGS])))
+        self.pending = []
+
+    def barrier(self, item) -> None:
+        self.flush()
+        self.items.append(item)
+
+    def wait(self, name: str, seconds: float = 0.0) -> None:
+        self.barrier(Wait(name, seconds))
+
+    def log(self, text: str) -> None:
+        self.barrier(Log(text))
+
+    def sram(self, addr: int, data: bytes) -> None:
+        """write_sram(): one max_write-byte AHB write per chunk, burst mode around it."""
+        self.burst_enable(True)
+        pack = struct.Struct("<BI").pack
+        n = self.max_write
+        for off in range(0, len(data), n):
+            chunk = data[off : off + n]
+            self.write(pack(REG_AHB_ADDR, addr + off) + chunk.ljust(-(-len(chunk) // 4) * 4, b"\x00"))
+        self.burst_enable(False)
+
+    def crc(self, addr: int, length: int, key: str) -> None:
+        """hw_crc_check(): start the reload engine, poll it idle, read the CRC."""
+        self.ahb_write32(ADDR_CRC_ADDR, addr)
+        self.ahb_write32(ADDR_CRC_CMD, (length << 8) | 0x0099)
+        self.check(ADDR_RELOAD_STATUS, 1, 0, True, False, 100, "crc_poll", "CRC engine idle")
+        self.barrier(Capture(self.span(ahb_read_msgs(ADDR_RELOAD_CRC32)), key))
+
+    def check(self, addr: int, mask: int, want: int, equal: bool, required: bool, tries: int, delay: str, label: str) -> None:
+        """Barrier on the AHB word at addr; see Check."""
+        self.barrier(Check(self.span(ahb_read_msgs(addr)), mask, want, equal, required, tries, delay, label))
+
+    def plan(self, digest: bytes) -> Plan:
+        self.flush()
+        return Plan(digest, b"".join(self.data), b"".join(self.table), self.items)
+
+
+def compile_plan(fw_data: bytes, caps: dict | None = None) -> Plan:
+    """The load_firmware() sequence for fw_data as a plan, sized for caps (AhbI2C.caps)."""
+    from load_firmware_i2c import parse_partition_table, sram_dest
+
+    partitions = parse_partition_table(fw_data)
+    code_parts = [p for p in partitions if p["type"] == "code"]
+    caps = caps or hx_profile.BUS_DEFAULTS["i2c"]
+    c = Compiler(caps["max_write"])
+
+    c.check(ADDR_IC_ID, 0xFFFFFFFF, IC_ID, True, True, 1, "", "IC ID")
+
+    c.log("[1] System reset")
+    c.ahb_write32(ADDR_SYSTEM_RESET, DATA_SYSTEM_RESET)
+    c.wait("system_reset")
+    c.wait("post_reset")
+    c.burst_enable(False)
+
+    c.log("[2] Entering safe mode")
+    c.reg_write(REG_SAFE_PW1, SAFE_PW[0])
+    c.reg_write(REG_SAFE_PW2, SAFE_PW[1])
+    c.wait("safe_mode")
+    c.check(ADDR_IC_STATUS, 0xFF, STATUS_SAFE_MODE, True, False, 10, "safe_poll", "safe mode")
+
+    c.log("[3] Resetting TCON + ADC")
+    c.ahb_write32(ADDR_TCON_RESET, 0)
+    c.wait("tcon_reset")
+    c.ahb_write32(ADDR_ADC_RESET, 0)
+    c.wait("adc_reset_low")
+    c.ahb_write32(ADDR_ADC_RESET, 1)
+    c.wait("adc_reset")
+
+    c.log("[4] Testing Code SRAM write")
+    c.ahb_write32(SRAM_TEST_ADDR, 0xDEADBEEF)
+    c.wait("", 0.005)
+    c.check(SRAM_TEST_ADDR, 0xFFFFFFFF, SRAM_LOCKED, False, True, 1, "", "Code SRAM writable")
+
+    c.log(f"[5] Writing {len(partitions)} partitions ({sum(p['size'] for p in partitions)} bytes)")
+    # code partitions first, then config, as load_firmware() does
+    for p in code_parts + [p for p in partitions if p["type"] == "config"]:
+        c.sram(sram_dest(p), fw_data[p["fw_offset"] : p["fw_offset"] + p["size"]])
+
+    c.log("[8] Verifying Code SRAM")
+    for off in (0, 4):
+        want = fw_data[0x400 + off : 0x404 + off]
+        if len(want) == 4:
+            label = f"SRAM word 0x{SRAM_TEST_ADDR + off:08X}"
+            c.check(SRAM_TEST_ADDR + off, 0xFFFFFFFF, struct.unpack("<I", want)[0], True, False, 1, "", label)
+
+    c.log("[9] Hardware CRC check")
+    c.crc(0x08000000, sum(p["size"] for p in code_parts), "hw_crc")
+    for p in code_parts:  # the resume baseline: code partitions only
+        c.crc(sram_dest(p), p["size"], f"{sram_dest(p):08x}")
+
+    c.log("[10] Starting firmware (sense_on)")
+    c.ahb_write32(ADDR_RAW_OUT_SEL, 0)
+    c.ahb_write32(ADDR_SORTING_MODE, 0)
+    c.ahb_write32(ADDR_N_FRAME, 1)
+    c.ahb_write32(ADDR_RELOAD_DONE, 0)
+    c.ahb_write32(ADDR_FLASH_RELOAD, 0)
+    c.ahb_write32(ADDR_LEAVE_SAFE, DATA_LEAVE_SAFE)
+    c.wait("sense_on")
+    c.wait("fw_start")
+    c.check(ADDR_IC_STATUS, 0xFF, STATUS_FW_RUNNING, True, True, 1, "", "firmware running")
+    return c.plan(hashlib.sha256(fw_data).digest())
+
+
+# === Serialization ===
+
+
+_sequence_hash = None
+
+
+def sequence_hash() -> bytes:
+    """sha256 over SEQUENCE_SOURCES: a plan compiled by other code is stale."""
+    global _sequence_hash
+    if _sequence_hash is None:
+        h = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in SEQUENCE_SOURCES:
+            with open(os.path.join(here, name), "rb") as f:
+                h.update(f.read())
+        _sequence_hash = h.digest()
+    return _sequence_hash
+
+
+def _str(s: str) -> bytes:
+    b = s.encode()
+    return bytes([len(b)]) + b
+
+
+def dumps(plan: Plan) -> bytes:
+    out = [
+        FILE_HDR.pack(
+            MAGIC,
+            VERSION,
+            I2C_MSG.size,
+            plan.digest,
+            sequence_hash(),
+            len(plan.items),
+            len(plan.data),
+            len(plan.table) // I2C_MSG.size,
+        ),
+        plan.data,
+        plan.table,
+    ]
+    for it in plan.items:
+        if isinstance(it, Batch):
+            out += [bytes([OP_BATCH]), SPAN.pack(*it.msgs)]
+        elif isinstance(it, Wait):
+            out += [bytes([OP_WAIT]), WAIT.pack(it.seconds), _str(it.name)]
+        elif isinstance(it, Check):
+            flags = (CHECK_EQUAL if it.equal else 0) | (CHECK_REQUIRED if it.required else 0)
+            out += [bytes([OP_CHECK]), SPAN.pack(*it.msgs), CHECK.pack(it.mask, it.want, flags, 0, it.tries), _str(it.delay), _str(it.label)]
+        elif isinstance(it, Capture):
+            out += [bytes([OP_CAPTURE]), SPAN.pack(*it.msgs), _str(it.key)]
+        else:
+            out += [bytes([OP_LOG]), _str(it.text)]
+    return b"".join(out)
+
+
+def loads(data: bytes, digest: bytes | None = None) -> Plan | None:
+    """Plan from dumps() output; None if it is for another version, layout, sequence or image."""
+    if len(data) < FILE_HDR.size:
+        return None
+    magic, version, msg_size, file_digest, seq, count, data_len, nmsgs = FILE_HDR.unpack_from(data)
+    if magic != MAGIC or version != VERSION or msg_size != I2C_MSG.size or seq != sequence_hash():
+        return None
+    if digest is not None and file_digest != digest:
+        return None
+    pos = FILE_HDR.size
+    payload = data[pos : pos + data_len]
+    pos += data_len
+    table = data[pos : pos + nmsgs * msg_size]
+    pos += nmsgs * msg_size
+
+    def s():
+        nonlocal pos
+        n = data[pos]
+        pos += 1 + n
+        return data[pos - n : pos].decode()
+
+    def span():
+        nonlocal pos
+        pos += SPAN.size
+        return SPAN.unpack_from(data, pos - SPAN.size)
+
+    items = []
+    for _ in range(count):
+        op = data[pos]
+        pos += 1
+        if op == OP_BATCH:
+            items.append(Batch(span()))
+        elif op == OP_WAIT:
+            (seconds,) = WAIT.unpack_from(data, pos)
+            pos += WAIT.size
+            items.append(Wait(s(), seconds))
+        elif op == OP_CHECK:
+            m = span()
+            mask, want, flags, _, tries = CHECK.unpack_from(data, pos)
+            pos += CHECK.size
+            items.append(Check(m, mask, want, bool(flags & CHECK_EQUAL), bool(flags & CHECK_REQUIRED), tries, s(), s()))
+        elif op == OP_CAPTURE:
+            items.append(Capture(span(), s()))
+        elif op == OP_LOG:
+            items.append(Log(s()))
+        else:
+            return None
+    return Plan(file_digest, payload, table, items)
+
+
+def plan_path(digest: bytes, caps: dict | None = None) -> str:
+    name = digest.hex()
+    if caps and caps["max_write"] != hx_profile.BUS_DEFAULTS["i2c"]["max_write"]:
+        name += f"-w{caps['max_write']}"
+    return os.path.join(PLAN_DIR, name + ".hxlp")
+
+
+def load_or_compile(fw_data: bytes, caps: dict | None = None) -> Plan:
+    """Cached plan for fw_data and caps, compiled and cached on a miss."""
+    digest = hashlib.sha256(fw_data).digest()
+    try:
+        with open(plan_path(digest, caps), "rb") as f:
+            plan = loads(f.read(), digest)
+        if plan is not None:
+            return plan
+    except OSError:
+        pass
+    plan = compile_plan(fw_data, caps)
+    save(plan, caps)
+    return plan
+
+
+def save(plan: Plan, caps: dict | None = None) -> None:
+    path = plan_path(plan.digest, caps)
+    try:
+        os.makedirs(PLAN_DIR, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(dumps(plan))
+        os.replace(tmp, path)
+    except OSError:
+        pass  # read-only profile dir: compile again next boot
+
+
+# === Execution ===
+
+
+def prepare(plan: Plan) -> list:
+    """Per plan item, all over one buffer: an iterator of one-message
+    I2cBatches for a Batch, an I2cBatch for a Check or Capture, None
+    otherwise. The Batch iterators are single-use, like run()."""
+    buf = (ctypes.c_ubyte * max(1, len(plan.data))).from_buffer_copy(plan.data.ljust(1, b"\0"))
+    table = bytearray(plan.table)
+    relocate_msgs(table, ctypes.addressof(buf))
+    msgs = (i2c_msg * (len(table) // I2C_MSG.size)).from_buffer(table)
+    view = I2cBatch.view
+    out = []
+    for it in plan.items:
+        if isinstance(it, Batch):
+            out.append(I2cBatch.singles(buf, msgs, *it.msgs))
+        elif isinstance(it, (Check, Capture)):
+            out.append(view(buf, msgs, *it.msgs))
+        else:
+            out.append(None)
+    return out
+
+
+def run(dev, plan: Plan, delays: dict[str, float] | None = None, log=print) -> tuple[bool, dict[str, int]]:
+    """Execute a plan on an AhbI2C-style dev; returns (success, captured words)."""
+    if delays is None:
+        from load_firmware_i2c import DELAYS as delays
+    xfer = dev.xfer_many
+    sleep = hx_rt.precise_sleep
+    word = struct.Struct("<I").unpack
+    captured: dict[str, int] = {}
+    for it, batch in zip(plan.items, prepare(plan)):
+        if isinstance(it, Batch):
+            for write in batch:
+                xfer(write)
+        elif isinstance(it, Wait):
+            sleep(delays[it.name] if it.name else it.seconds)
+        elif isinstance(it, Check):
+            for attempt in range(it.tries):
+                if attempt:
+                    sleep(delays[it.delay])
+                xfer(batch)
+                value = word(bytes(batch.rx[0]))[0]
+                if ((value & it.mask) == it.want) == it.equal:
+                    break
+            else:
+                log(f"  {it.label}: 0x{value:08X} {'✗' if it.required else '(continuing)'}")
+                if it.required:
+                    return False, captured
+        elif isinstance(it, Capture):
+            xfer(batch)
+            captured[it.key] = word(bytes(batch.rx[0]))[0]
+        else:
+            log(it.text)
+    return True, captured
+
+
+def describe(it) -> str:
+    if isinstance(it, Batch):
+        return f"writes  {it.msgs[1]} msgs from #{it.msgs[0]}"
+    if isinstance(it, Wait):
+        return f"wait    {it.name or f'{it.seconds * 1000:g} ms'}"
+    if isinstance(it, Check):
+        op = "==" if it.equal else "!="
+        return f"check   {it.label}: & 0x{it.mask:X} {op} 0x{it.want:X} x{it.tries}{' required' if it.required else ''}"
+    if isinstance(it, Capture):
+        return f"capture {it.key}"
+    return f"log     {it.text}"
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("cmd", choices=["compile", "show"])
+    ap.add_argument("firmware")
+    args = ap.parse_args()
+
+    with open(args.firmware, "rb") as f:
+        fw_data = f.read()
+    from hx83121a import discover
+
+    caps = i2c_caps(discover.locate().bus)
+    if args.cmd == "compile":
+        plan = compile_plan(fw_data, caps)
+        save(plan, caps)
+        path = plan_path(plan.digest, caps)
+        if not os.path.exists(path):
+            print(f"could not write {path}", file=sys.stderr)
+            return 1
+    else:
+        plan = load_or_compile(fw_data, caps)
+        path = plan_path(plan.digest, caps)
+        for it in plan.items:
+            print(describe(it))
+    batches = sum(1 for it in plan.items if isinstance(it, Batch))
+    print(
+        f"{path}: {len(plan.items)} items, {batches} write runs, "
+        f"{len(plan.table) // I2C_MSG.size} messages, {len(plan.data)} payload bytes"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Resident HX83121A resume service.
+
+Keeps the firmware image, its parsed partition table and an open I2C
+handle in memory, and waits for SIGUSR1 from the system-sleep hook
+(hx83121a-resume.sleep). On every resume it takes the cheapest path
+that gets touch back:
+
+  1. IC status 0x05 (firmware running) and i2c_hid bound: nothing to do
+  2. else enter safe mode and hw_crc_check() every code partition against
+     the baseline recorded for this image; rewrite only code partitions
+     whose CRC changed plus all config partitions, re-check them and
+     sense_on
+  3. if that fails (or every code partition is gone), run the fallback:
+     the Boot ROM recovery script by default, or load_firmware()
+
+Only code partitions are compared: the running firmware rewrites its
+config partitions (0x10007xxx), so their CRCs depend on when they were
+taken and the loader's (before sense_on) never matches --baseline's.
+Baselines are per-image (SHA-256) in /var/lib/hx83121a/sram_crc.json.
+load_firmware_i2c.py records one after every successful load; --baseline
+records one from a known-good running image.
+
+No fixed sleeps on this path: the i2c_hid driver link and the IC status
+are polled, bounded by the loader's "unbind" and "sense_on" + "fw_start"
+delays.
+
+Usage:
+  hx_resumed.py FW.bin                 # daemon (hx83121a-resumed.service)
+  hx_resumed.py FW.bin --once          # run the resume check now
+  hx_resumed.py FW.bin --baseline
+"""
+
+import argparse
+import hashlib
+import os
+import signal
+import sys
+import time
+
+import hx83121a.profile as hx_profile
+import hx83121a.rt as hx_rt
+from hx83121a import broker, discover
+from load_firmware_i2c import (
+    DELAYS,
+    HX83121A_I2C,
+    STATUS_FW_RUNNING,
+    bind_i2c_hid,
+    load_firmware,
+    parse_partition_table,
+    partition_crcs,
+    sram_dest,
+    unbind_i2c_hid,
+)
+
+RECOVERY_CMD = "/usr/local/bin/hx83121a-touch-recovery"
+
+
+class ResumeService:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        with open(args.firmware, "rb") as f:
+            self.fw = f.read()
+        self.digest = hashlib.sha256(self.fw).hexdigest()
+        self.partitions = parse_partition_table(self.fw)
+        self.images = {
+            f"{sram_dest(p):08x}": self.fw[p["fw_offset"] : p["fw_offset"] + p["size"]] for p in self.partitions
+        }
+        self.code = [p for p in self.partitions if p["type"] == "code"]
+        self.config = [f"{sram_dest(p):08x}" for p in self.partitions if p["type"] != "code"]
+        code_keys = {f"{sram_dest(p):08x}" for p in self.code}
+        self.baseline = {k: v for k, v in hx_profile.load_sram_crc(self.digest).items() if k in code_keys}
+        self.loc = discover.resolve(args.i2c_bus)
+        self.hid_driver_link = f"/sys/bus/i2c/devices/{self.loc.hid_device}/driver"
+        self.dev = broker.open_i2c(HX83121A_I2C, self.loc.bus)
+
+    def log(self, msg: str) -> None:
+        print(f"hx_resumed: {msg}", flush=True)
+
+    def running(self) -> bool:
+        try:
+            return self.dev.read_status() == STATUS_FW_RUNNING
+        except OSError:
+            return False
+
+    def wait(self, done, seconds: float) -> bool:
+        deadline = time.monotonic() + seconds
+        while not done():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(DELAYS["safe_poll"])
+        return True
+
+    def unbind(self) -> None:
+        unbind_i2c_hid(self.loc.hid_device, settle=False)
+        self.wait(lambda: not os.path.exists(self.hid_driver_link), DELAYS["unbind"])
+
+    def enter_safe(self) -> bool:
+        self.dev.burst_enable(False)
+        self.dev.enter_safe_mode()
+        return self.dev.verify_safe_mode()
+
+    def start(self) -> bool:
+        self.dev.sense_on(settle=False)
+        return self.wait(self.running, DELAYS["sense_on"] + DELAYS["fw_start"])
+
+    def record_baseline(self) -> bool:
+        if not self.running():
+            self.log("firmware not running; refusing to record a baseline")
+            return False
+        self.unbind()
+        ok = self.enter_safe()
+        if ok:
+            crcs = partition_crcs(self.dev, self.code)
+            hx_profile.save_sram_crc(self.digest, crcs)
+            self.baseline = crcs
+            self.log(f"baseline recorded for {len(crcs)} code partitions")
+        ok = self.start() and ok
+        bind_i2c_hid(self.loc.hid_device)
+        return ok
+
+    def repair(self) -> bool:
+        """Rewrite code partitions whose CRC differs from the baseline, and the config."""
+        if not self.baseline:
+            self.log("no CRC baseline for this image")
+            return False
+        if not self.enter_safe():
+            self.log("safe mode not reached")
+            return False
+        crcs = partition_crcs(self.dev, self.code)
+        bad = [k for k in crcs if crcs[k] != self.baseline.get(k)]
+        if len(bad) == len(crcs):
+            self.log("all code partitions lost")
+            return False
+        if bad:
+            self.log(f"repairing {len(bad)}/{len(crcs)} code partitions: {' '.join(bad)}")
+            self.dev.reset_tcon()
+            self.dev.reset_adc()
+            for k in bad + self.config:
+                self.dev.write_sram(int(k, 16), self.images[k])
+            crcs = partition_crcs(self.dev, [p for p in self.code if f"{sram_dest(p):08x}" in bad])
+            still = [k for k in bad if crcs.get(k) != self.baseline.get(k)]
+            if still:
+                self.log(f"CRC still wrong after rewrite: {' '.join(still)}")
+                return False
+        else:
+            self.log("SRAM intact")
+        return self.start()
+
+    def fallback(self) -> bool:
+        if self.args.fallback == "none":
+            return False
+        self.log(f"fallback: {self.args.fallback}")
+        if self.args.fallback == "recovery":
+            import subprocess
+
+            return subprocess.run([self.args.recovery_cmd]).returncode == 0
+        crcs: dict[str, int] = {}
+        ok = load_firmware(self.dev, self.fw, crcs)
+        if ok and crcs:
+            hx_profile.save_sram_crc(self.digest, crcs)
+            self.baseline = crcs
+        return ok
+
+    def on_resume(self, why: str) -> bool:
+        t0 = time.perf_counter()
+        if self.running():
+            if not os.path.exists(self.hid_driver_link):
+                bind_i2c_hid(self.loc.hid_device)
+            self.log(f"{why}: firmware survived ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+            return True
+        self.unbind()
+        try:
+            # not around fallback(): the recovery script opens its own broker connection
+            with broker.session(self.dev):
+                ok = self.repair()
+        except OSError as e:
+            self.log(f"repair failed: {e}")
+            ok = False
+        path = "repair"
+        if not ok:
+            path = self.args.fallback
+            ok = self.fallback()
+        if path != "recovery":  # the recovery script rebinds i2c_hid_of itself
+            bind_i2c_hid(self.loc.hid_device)
+        self.log(f"{why}: {path} {'ok' if ok else 'FAILED'} ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+        return ok
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("firmware")
+    ap.add_argument("--i2c-bus", type=int, help="default: hx83121a.discover")
+    ap.add_argument("--fallback", choices=["recovery", "loader", "none"], default="recovery")
+    ap.add_argument("--recovery-cmd", default=RECOVERY_CMD)
+    ap.add_argument("--once", action="store_true", help="run one resume check and exit")
+    ap.add_argument("--baseline", action="store_true", help="record CRC baseline from the running image")
+    args = ap.parse_args()
+
+    rt = hx_rt.realtime_from_env()
+    if rt:
+        print("RT mode: " + " ".join(f"{k}={v}" for k, v in rt.items()))
+
+    svc = ResumeService(args)
+    if args.baseline:
+        return 0 if svc.record_baseline() else 1
+    if args.once:
+        return 0 if svc.on_resume("manual") else 1
+
+    sigs = {signal.SIGUSR1, signal.SIGTERM, signal.SIGINT}
+    signal.pthread_sigmask(signal.SIG_BLOCK, sigs)
+    svc.log(
+        f"ready: {len(svc.partitions)} partitions, baseline={'yes' if svc.baseline else 'no'}, "
+        f"i2c={svc.loc.bus} ({svc.loc.source})"
+    )
+    while signal.sigwaitinfo(sigs).si_signo == signal.SIGUSR1:
+        while signal.sigtimedwait({signal.SIGUSR1}, 0):
+            pass  # coalesce back-to-back notifications
+        svc.on_resume("resume")
+    svc.dev.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
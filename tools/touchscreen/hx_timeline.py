@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Register timeline sampler for the HX83121A (SPI).
+
+snap()/print_snap() show the state before and after an action; this
+records how it gets there. A register set (scenarios/timeline_sets.json
+or --reg name=addr) is sampled at --rate for --duration-ms, optionally
+around a wakeup-matrix scenario run at t0 (--action); sampling continues
+through the scenario's waits and poll intervals.
+
+Reads are coalesced: addresses at most --max-gap bytes apart share one
+auto-increment burst, and all bursts of a sample (plus the cmd 0x30
+event-plane read) are packed into as few SPI_IOC_MESSAGE batches as
+spidev's bufsiz allows, prebuilt once; a frame longer than bufsiz (a
+large event plane) gets a batch of its own, which SpiBatch.messages()
+splits across ioctls under one chip select. The event plane is reduced to
+nonzero-byte count, Shannon entropy (milli-bits/byte) and CRC32.
+
+Output is columnar: header, JSON metadata, then each column's raw array
+(t_ns as u64, everything else u32). `show` prints per-column state
+transitions relative to t0, plus achieved rate and missed deadlines.
+
+Usage:
+  hx_timeline.py record --set wakeup --action activ_relod --rate 2000 -o t.hxtl
+  hx_timeline.py show t.hxtl [--column status --column ev_nz]
+"""
+
+import argparse
+import array
+import json
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+
+import hx83121a.profile as hx_profile
+import hx83121a.rt as hx_rt
+import hx_trace
+import hx_wakeup_matrix as matrix
+from hx83121a import broker
+from hx83121a.regs import (
+    BURST_CONTINUOUS,
+    INCR4_AUTO,
+    REG_AHB_ADDR,
+    REG_AHB_DATA,
+    REG_AHB_READ,
+    REG_BURST,
+    REG_EVENT,
+    REG_INCR,
+    SPI_READ,
+)
+from hx83121a.spi import SPI_MAX_MESSAGE_XFERS, SpiBatch, SpiBus, hw_frame, spidev_bufsiz
+
+MAGIC = b"HXTL"
+VERSION = 1
+FILE_HDR = struct.Struct("<4sHI")  # magic, version, metadata length
+DEFAULT_SET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios", "timeline_sets.json")
+EVENT_COLUMNS = ("ev_nz", "ev_entropy", "ev_crc")
+
+
+def coalesce(addrs: list[int], max_gap: int) -> list[tuple[int, int]]:
+    """Sorted addresses -> (base, length) burst reads covering all of them."""
+    groups: list[list[int]] = []
+    for a in sorted(set(addrs)):
+        if groups and a - (groups[-1][1] + 4) <= max_gap:
+            groups[-1][1] = a
+        else:
+            groups.append([a, a])
+    return [(lo, hi - lo + 4) for lo, hi in groups]
+
+
+def entropy_milli(frame: bytes) -> int:
+    n = len(frame)
+    if not n:
+        return 0
+    h = 0.0
+    for c in (frame.count(bytes([v])) for v in set(frame)):
+        p = c / n
+        h -= p * math.log2(p)
+    return round(h * 1000)
+
+
+class Sampler:
+    """Prebuilt batches for one register set; sample() costs one ioctl per batch."""
+
+    def __init__(self, regs: dict[str, int], event_plane: int, max_gap: int, speed: int, bufsiz: int):
+        self.names = list(regs)
+        self.event_plane = event_plane
+        # burst + auto-increment, every sample
+        frames = [hw_frame(REG_BURST, bytes([BURST_CONTINUOUS])), hw_frame(REG_INCR, bytes([INCR4_AUTO]))]
+        where: dict[int, tuple[int, int]] = {}
+        for base, length in coalesce(list(regs.values()), max_gap):
+            frames += [
+                hw_frame(REG_AHB_ADDR, struct.pack("<I", base)),
+                hw_frame(REG_AHB_READ, b"\x00"),
+                bytes([SPI_READ, REG_AHB_DATA, 0x00]) + bytes(length),
+            ]
+            for a in regs.values():
+                if base <= a < base + length:
+                    where[a] = (len(frames) - 1, a - base)
+        self.bursts = (len(frames) - 2) // 3
+        if event_plane:
+            frames.append(bytes([SPI_READ, REG_EVENT, 0x00]) + bytes(event_plane))
+        self.batches: list[SpiBatch] = []
+        slot: dict[int, tuple[int, int]] = {}
+        chunk: list[bytes] = []
+        for i, f in enumerate(frames):
+            if chunk and (sum(map(len, chunk)) + len(f) > bufsiz or len(chunk) >= SPI_MAX_MESSAGE_XFERS):
+                self.batches.append(SpiBatch(chunk, speed))
+                chunk = []
+            slot[i] = (len(self.batches), len(chunk))
+            chunk.append(f)
+        self.batches.append(SpiBatch(chunk, speed))
+        self.cols = [(slot[where[a][0]], where[a][1]) for a in regs.values()]
+        self.event_slot = slot[len(frames) - 1] if event_plane else None
+        self.last_crc = None
+        self.last_entropy = 0
+
+    def sample(self, bus, out: list[int]) -> None:
+        for b in self.batches:
+            bus.xfer_many(b)
+        for i, ((bi, fi), off) in enumerate(self.cols):
+            out[i] = struct.unpack_from("<I", self.batches[bi].rx[fi], 3 + off)[0]
+        if self.event_slot:
+            bi, fi = self.event_slot
+            frame = bytes(self.batches[bi].rx[fi])[3:]
+            crc = zlib.crc32(frame)
+            if crc != self.last_crc:  # frames repeat; entropy only when it changed
+                self.last_crc = crc
+                self.last_entropy = entropy_milli(frame)
+            n = len(self.cols)
+            out[n] = len(frame) - frame.count(0)
+            out[n + 1] = self.last_entropy
+            out[n + 2] = crc
+
+
+def load_set(args: argparse.Namespace) -> tuple[dict[str, int], int]:
+    regs: dict[str, int] = {}
+    event_plane = 0
+    if args.set:
+        sets = hx_profile.read_json(args.set_file).get("sets", {})
+        if args.set not in sets:
+            raise SystemExit(f"unknown register set {args.set!r} (have: {', '.join(sorted(sets))})")
+        regs = {k: int(v, 0) for k, v in sets[args.set].get("regs", {}).items()}
+        event_plane = int(sets[args.set].get("event_plane", 0))
+    for spec in args.reg:
+        name, _, addr = spec.partition("=")
+        regs[name] = int(addr, 0)
+    if args.event_plane is not None:
+        event_plane = args.event_plane
+    if not regs:
+        raise SystemExit("empty register set: use --set or --reg name=addr")
+    return regs, event_plane
+
+
+def record(args: argparse.Namespace) -> int:
+    regs, event_plane = load_set(args)
+    spi = hx_profile.spi_defaults()
+    if args.emulate:
+        import hx_emulator
+
+        bus = hx_emulator.EmulatedSpiBus(hx_emulator.HxDevice(), spi["mode"], spi["speed"])
+    else:
+        bus = hx_trace.maybe_record(broker.open_spi(SpiBus, spi["dev"], spi["mode"], spi["speed"]))
+    sampler = Sampler(regs, event_plane, args.max_gap, spi["speed"], spidev_bufsiz())
+    plan = None
+    if args.action:
+        plans = matrix.load_scenarios(args.scenario_file, spi["speed"])
+        if args.action not in plans:
+            raise SystemExit(f"unknown scenario {args.action!r}")
+        plan = plans[args.action]
+
+    names = sampler.names + (list(EVENT_COLUMNS) if event_plane else [])
+    cols = [array.array("I") for _ in names]
+    ts = array.array("Q")
+    row = [0] * len(names)
+    interval = 1.0 / args.rate
+    print(
+        f"sampling {len(regs)} regs in {sampler.bursts} bursts + "
+        f"{'event plane ' + str(event_plane) + 'B' if event_plane else 'no event plane'} "
+        f"-> {len(sampler.batches)} ioctl(s)/sample at {args.rate} Hz"
+    )
+    if args.rt:
+        for b in sampler.batches:
+            hx_rt.prefault(*b.rx)
+        print("rt: " + " ".join(f"{k}={v}" for k, v in hx_rt.enter_realtime(args.rt_prio, args.rt_cpu).items()))
+
+    if plan and plan.setup:
+        matrix.execute(bus, plan.setup)
+    clock = time.perf_counter_ns
+    t_start = clock()
+    meter = hx_rt.JitterMeter(int((args.pre_ms + args.duration_ms) / 1000.0 * args.rate) + 16)
+    pacer = hx_rt.Pacer(interval, meter)
+
+    def sample_until(t_end: int) -> None:
+        while clock() < t_end:
+            sampler.sample(bus, row)
+            ts.append(clock() - t_start)
+            for c, v in zip(cols, row):
+                c.append(v)
+            pacer.wait()
+
+    sample_until(t_start + int(args.pre_ms * 1e6))
+    action_t = clock() - t_start
+    action_ok = None
+    if plan:
+        # Waits and poll intervals inside the action are sampled through,
+        # so transitions show up when they happen, not when the action ends.
+        action_ok = True
+        for it in plan.items:
+            if isinstance(it, SpiBatch):
+                bus.xfer_many(it)
+            elif isinstance(it, matrix.Wait):
+                sample_until(clock() + int(it.seconds * 1e9))
+            else:
+                deadline = clock() + int(it.timeout * 1e9)
+                while True:
+                    bus.xfer_many(it.read)
+                    if it.value() & it.mask == it.want:
+                        break
+                    if clock() >= deadline:
+                        action_ok = False
+                        break
+                    sample_until(clock() + int(it.interval * 1e9))
+                if not action_ok:
+                    break
+    sample_until(t_start + action_t + int(args.duration_ms * 1e6))
+    missed = pacer.missed
+    span = (ts[-1] - ts[0]) / 1e9 if len(ts) > 1 else 0
+    meta = {
+        "columns": [{"name": "t_ns", "type": "Q"}]
+        + [{"name": n, "type": "I", "addr": f"0x{regs[n]:08x}" if n in regs else None} for n in names],
+        "samples": len(ts),
+        "rate_hz": args.rate,
+        "achieved_hz": round((len(ts) - 1) / span, 1) if span else 0,
+        "missed": missed,
+        "ioctls_per_sample": len(sampler.batches),
+        "action": args.action,
+        "action_t_ns": action_t if plan else None,
+        "action_ok": action_ok,
+        "jitter": meter.report(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "device": hx_profile.device_info(),
+    }
+    blob = json.dumps(meta).encode()
+    with open(args.out, "wb") as f:
+        f.write(FILE_HDR.pack(MAGIC, VERSION, len(blob)))
+        f.write(blob)
+        ts.tofile(f)
+        for c in cols:
+            c.tofile(f)
+    print(f"{len(ts)} samples, achieved {meta['achieved_hz']} Hz (target {args.rate}), missed deadlines {missed}")
+    print(meter.line("period"))
+    return 0
+
+
+def read_timeline(path: str) -> tuple[dict, dict[str, array.array]]:
+    with open(path, "rb") as f:
+        magic, version, mlen = FILE_HDR.unpack(f.read(FILE_HDR.size))
+        if magic != MAGIC or version != VERSION:
+            raise SystemExit(f"{path}: not a timeline file (v{VERSION})")
+        meta = json.loads(f.read(mlen))
+        data = {}
+        for col in meta["columns"]:
+            a = array.array(col["type"])
+            a.fromfile(f, meta["samples"])
+            data[col["name"]] = a
+    return meta, data
+
+
+def show(args: argparse.Namespace) -> int:
+    meta, data = read_timeline(args.timeline)
+    print(
+        f"samples={meta['samples']} target={meta['rate_hz']}Hz achieved={meta['achieved_hz']}Hz "
+        f"missed={meta['missed']} ioctls/sample={meta['ioctls_per_sample']}"
+    )
+    ts = data["t_ns"]
+    if not ts:
+        return 0
+    t0 = meta["action_t_ns"] if meta.get("action_t_ns") is not None else ts[0]
+    if meta.get("action"):
+        print(f"t0 = action {meta['action']!r} ({'ok' if meta['action_ok'] else 'poll timeout'})")
+    names = args.column or [c["name"] for c in meta["columns"][1:] if c["name"] not in ("ev_entropy", "ev_crc")]
+    events = []
+    for name in names:
+        col = data[name]
+        # event-plane byte counts jitter constantly; the useful edge is zero <-> nonzero
+        key = (lambda v: v > 0) if name == "ev_nz" and not args.column else (lambda v: v)
+        prev = col[0]
+        print(f"  initial {name:14s} 0x{prev:08x}")
+        for i in range(1, len(col)):
+            if key(col[i]) != key(prev):
+                events.append((ts[i], name, prev, col[i]))
+            prev = col[i]
+    for t, name, old, new in sorted(events):
+        print(f"{(t - t0) / 1e6:+10.3f} ms  {name:14s} 0x{old:08x} -> 0x{new:08x}")
+    if not events:
+        print("  no transitions")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("record")
+    r.add_argument("--set-file", default=DEFAULT_SET_FILE)
+    r.add_argument("--set", help="register set name from --set-file")
+    r.add_argument("--reg", action="append", default=[], help="extra register NAME=ADDR")
+    r.add_argument("--event-plane", type=int, help="cmd 0x30 bytes per sample (0 = off; default from set)")
+    r.add_argument("--max-gap", type=int, default=8, help="max unread bytes between registers sharing a burst")
+    r.add_argument("--rate", type=float, default=1000.0, help="samples per second")
+    r.add_argument("--duration-ms", type=float, default=500.0)
+    r.add_argument("--pre-ms", type=float, default=20.0, help="sampling before the action")
+    r.add_argument("--action", help="wakeup-matrix scenario to run at t0")
+    r.add_argument("--scenario-file", default=matrix.DEFAULT_SCENARIO_FILE)
+    r.add_argument("--emulate", action="store_true", help="sample hx_emulator instead of hardware")
+    r.add_argument("--rt", action="store_true", help="SCHED_FIFO + CPU pinning + mlockall while sampling")
+    r.add_argument("--rt-prio", type=int, default=50)
+    r.add_argument("--rt-cpu", type=int, help="pin to this CPU in --rt mode")
+    r.add_argument("-o", "--out", required=True)
+    s = sub.add_parser("show")
+    s.add_argument("timeline")
+    s.add_argument("--column", action="append", help="only these columns (raw values, no zero/nonzero folding)")
+    args = ap.parse_args()
+    return record(args) if args.cmd == "record" else show(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Record and replay HX83121A bus transactions.
+
+Recording wraps the transport primitives of an existing bus object
+(HX83121A_I2C._i2c_write/_i2c_combined, SpiBus/Bus.xfer and the
+xfer_many of both)
+and appends one binary record per transaction to an in-memory buffer
+that is flushed in 64 KiB writes, so the wrapped sequence keeps its
+timing. Set HX_TRACE=/path/trace.hxt to record any of the bus tools.
+
+File layout: 16-byte header (magic, version, wall-clock start in ns)
+followed by records of
+
+    <QIBBII  t_ns, dur_ns, kind, i2c_addr, tx_len, rx_len | errno
+    tx bytes, rx bytes
+
+A failed ioctl sets KIND_FAILED in kind and stores errno instead of rx.
+
+Replay either serves the trace as the device (regression tests: every
+request must match the recording, else TraceMismatch) or re-issues the
+recorded requests against another bus such as hx_emulator (benchmark).
+
+Usage:
+  hx_trace.py dump trace.hxt [--limit N]
+  hx_trace.py stats trace.hxt
+  hx_trace.py bench trace.hxt          # replay against the emulator
+"""
+
+import argparse
+import atexit
+import os
+import struct
+import sys
+import time
+from typing import Iterator, NamedTuple
+
+MAGIC = b"HXTR"
+VERSION = 2  # v1 had uint16 lengths, which overflowed on SPI batches above 64 KiB
+FILE_HDR = struct.Struct("<4sHHQ")
+REC_HDR = struct.Struct("<QIBBII")
+
+KIND_I2C_WRITE = 1
+KIND_I2C_WRITE_READ = 2
+KIND_SPI_XFER = 3
+KIND_FAILED = 0x80
+KIND_NAMES = {KIND_I2C_WRITE: "i2c_w", KIND_I2C_WRITE_READ: "i2c_wr", KIND_SPI_XFER: "spi"}
+
+I2C_M_RD = 0x0001  # hx83121a.i2c; not imported so the SPI tools stay ctypes-free
+
+FLUSH_BYTES = 1 << 16
+
+
+class Record(NamedTuple):
+    t_ns: int
+    dur_ns: int
+    kind: int
+    addr: int
+    tx: bytes
+    rx: bytes
+    errno: int
+
+
+class TraceMismatch(AssertionError):
+    pass
+
+
+class TraceWriter:
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.buf = bytearray(FILE_HDR.pack(MAGIC, VERSION, 0, time.time_ns()))
+        self.t0 = time.perf_counter_ns()
+        self.count = 0
+
+    def append(self, t: int, dur: int, kind: int, addr: int, tx, rx) -> None:
+        buf = self.buf
+        buf += REC_HDR.pack(t - self.t0, dur, kind, addr, len(tx), len(rx))
+        buf += tx
+        buf += rx
+        self.count += 1
+        if len(buf) >= FLUSH_BYTES:
+            self.flush()
+
+    def failed(self, t: int, dur: int, kind: int, addr: int, tx, err: int) -> None:
+        buf = self.buf
+        buf += REC_HDR.pack(t - self.t0, dur, kind | KIND_FAILED, addr, len(tx), err)
+        buf += tx
+        self.count += 1
+        if len(buf) >= FLUSH_BYTES:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buf:
+            os.write(self.fd, self.buf)
+            self.buf = bytearray()
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            self.flush()
+            os.close(self.fd)
+            self.fd = -1
+
+
+def _wrap(w: TraceWriter, fn, kind: int, addr_of, tx_of, rx_of):
+    clock = time.perf_counter_ns
+
+    def wrapped(*a):
+        t = clock()
+        try:
+            out = fn(*a)
+        except OSError as e:
+            w.failed(t, clock() - t, kind, addr_of(a), tx_of(a), e.errno or 0)
+            raise
+        w.append(t, clock() - t, kind, addr_of(a), tx_of(a), rx_of(a, out))
+        return out
+
+    return wrapped
+
+
+def _i2c_batch_records(batch) -> Iterator[tuple[int, int, bytes, int | None]]:
+    """(kind, addr, tx, rx index) per transaction of an I2cBatch.
+
+    A write followed by a read is one write_read record, as issued by
+    _i2c_combined, so a batched run traces the same as an unbatched one.
+    """
+    spec = batch.spec
+    i = n = 0
+    while i < len(spec):
+        addr, flags, d = spec[i]
+        if flags & I2C_M_RD:
+            yield KIND_I2C_WRITE_READ, addr, b"", n
+            n += 1
+            i += 1
+        elif i + 1 < len(spec) and spec[i + 1][1] & I2C_M_RD:
+            yield KIND_I2C_WRITE_READ, addr, d, n
+            n += 1
+            i += 2
+        else:
+            yield KIND_I2C_WRITE, addr, d, None
+            i += 1
+
+
+def record_i2c(dev, w: TraceWriter):
+    """Record every I2C_RDWR issued through an HX83121A_I2C instance."""
+    dev._i2c_write = _wrap(w, dev._i2c_write, KIND_I2C_WRITE, lambda a: a[0], lambda a: bytes(a[1]), lambda a, o: b"")
+    dev._i2c_combined = _wrap(
+        w, dev._i2c_combined, KIND_I2C_WRITE_READ, lambda a: a[0], lambda a: bytes(a[1]), lambda a, o: o
+    )
+    if hasattr(dev, "xfer_many"):
+        inner = dev.xfer_many
+
+        def xfer_many(batch):
+            t = time.perf_counter_ns()
+            try:
+                inner(batch)
+            except OSError as e:
+                dur = time.perf_counter_ns() - t
+                for kind, addr, tx, _ in _i2c_batch_records(batch):
+                    w.failed(t, dur, kind, addr, tx, e.errno or 0)
+                raise
+            dur = time.perf_counter_ns() - t
+            for kind, addr, tx, n in _i2c_batch_records(batch):
+                w.append(t, dur, kind, addr, tx, b"" if n is None else bytes(batch.rx[n]))
+
+        dev.xfer_many = xfer_many
+    return dev
+
+
+def record_spi(bus, w: TraceWriter):
+    """Record every transfer issued through a SpiBus/Bus instance."""
+
+    def tx_of(a):
+        b = bytes(bytearray(a[0]))
+        if len(a) > 1 and a[1] is not None and a[1] > len(b):
+            b += bytes(a[1] - len(b))
+        return b
+
+    bus.xfer = _wrap(w, bus.xfer, KIND_SPI_XFER, lambda a: 0, tx_of, lambda a, o: o)
+    if hasattr(bus, "xfer_many"):
+        inner = bus.xfer_many
+
+        def xfer_many(batch):
+            t = time.perf_counter_ns()
+            try:
+                inner(batch)
+            except OSError as e:
+                w.failed(t, time.perf_counter_ns() - t, KIND_SPI_XFER, 0, b"".join(bytes(x) for x in batch.tx), e.errno or 0)
+                raise
+            dur = time.perf_counter_ns() - t
+            for tx, rx in zip(batch.tx, batch.rx):
+                w.append(t, dur, KIND_SPI_XFER, 0, bytes(tx), bytes(rx))
+
+        bus.xfer_many = xfer_many
+    return bus
+
+
+def maybe_record(bus, path: str | None = None):
+    """Record bus to $HX_TRACE (or path) if set; returns bus either way."""
+    path = path or os.environ.get("HX_TRACE")
+    if not path:
+        return bus
+    w = TraceWriter(path)
+    atexit.register(w.close)
+    if hasattr(bus, "_i2c_combined"):
+        return record_i2c(bus, w)
+    return record_spi(bus, w)
+
+
+def read_trace(path: str) -> Iterator[Record]:
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, _, _ = FILE_HDR.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not an hx trace (v{VERSION})")
+    mv = memoryview(data)
+    pos = FILE_HDR.size
+    while pos + REC_HDR.size <= len(data):
+        t, dur, kind, addr, txlen, rxlen = REC_HDR.unpack_from(data, pos)
+        pos += REC_HDR.size
+        tx = bytes(mv[pos : pos + txlen])
+        pos += txlen
+        if kind & KIND_FAILED:
+            yield Record(t, dur, kind & ~KIND_FAILED, addr, tx, b"", rxlen)
+            continue
+        rx = bytes(mv[pos : pos + rxlen])
+        pos += rxlen
+        yield Record(t, dur, kind, addr, tx, rx, 0)
+
+
+class TracePlayer:
+    """Serves recorded responses; each request must match the recording."""
+
+    def __init__(self, records: list[Record]):
+        self.records = records
+        self.pos = 0
+
+    def next(self, kind: int, addr: int, tx: bytes) -> bytes:
+        if self.pos >= len(self.records):
+            raise TraceMismatch(f"request #{self.pos} beyond end of trace: {KIND_NAMES[kind]} {tx.hex()}")
+        r = self.records[self.pos]
+        if (r.kind, r.addr, r.tx) != (kind, addr, tx):
+            raise TraceMismatch(
+                f"request #{self.pos}: expected {KIND_NAMES[r.kind]}@{r.addr:#04x} {r.tx.hex()}, "
+                f"got {KIND_NAMES[kind]}@{addr:#04x} {tx.hex()}"
+            )
+        self.pos += 1
+        if r.errno:
+            raise OSError(r.errno, os.strerror(r.errno))
+        return r.rx
+
+    def done(self) -> bool:
+        return self.pos == len(self.records)
+
+
+def replay_i2c(dev, player: TracePlayer):
+    """Point an HX83121A_I2C instance (fd unused) at a TracePlayer."""
+
+    def i2c_write(addr, data):
+        player.next(KIND_I2C_WRITE, addr, bytes(data))
+
+    def i2c_combined(addr, wdata, rlen):
+        return player.next(KIND_I2C_WRITE_READ, addr, bytes(wdata))
+
+    def xfer_many(batch):
+        for kind, addr, tx, n in _i2c_batch_records(batch):
+            rx = player.next(kind, addr, tx)
+            if n is not None:
+                batch.rx[n][:] = rx
+
+    dev._i2c_write = i2c_write
+    dev._i2c_combined = i2c_combined
+    dev.xfer_many = xfer_many
+    return dev
+
+
+def replay_spi(bus, player: TracePlayer):
+    """Point a SpiBus/Bus instance (fd unused) at a TracePlayer."""
+
+    def xfer(tx, total_len=None):
+        b = bytes(bytearray(tx))
+        if total_len is not None and total_len > len(b):
+            b += bytes(total_len - len(b))
+        return player.next(KIND_SPI_XFER, 0, b)
+
+    def xfer_many(batch):
+        for tx, rx in zip(batch.tx, batch.rx):
+            rx[:] = player.next(KIND_SPI_XFER, 0, bytes(tx))
+
+    bus.xfer = xfer
+    bus.xfer_many = xfer_many
+    return bus
+
+
+def replay_against(records: list[Record], spi=None, i2c=None) -> dict:
+    """Re-issue recorded requests on live/emulated buses; compare responses."""
+    rx_mismatch = 0
+    t0 = time.perf_counter_ns()
+    for r in records:
+        try:
+            if r.kind == KIND_SPI_XFER:
+                out = spi.xfer(r.tx)
+            elif r.kind == KIND_I2C_WRITE:
+                i2c._i2c_write(r.addr, r.tx)
+                out = b""
+            else:
+                out = i2c._i2c_combined(r.addr, r.tx, len(r.rx))
+        except OSError:
+            out = None
+        if out != (r.rx if not r.errno else None):
+            rx_mismatch += 1
+    elapsed = time.perf_counter_ns() - t0
+    recorded = records[-1].t_ns + records[-1].dur_ns - records[0].t_ns if records else 0
+    return {"records": len(records), "rx_mismatch": rx_mismatch, "replay_ns": elapsed, "recorded_ns": recorded}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("cmd", choices=["dump", "stats", "bench"])
+    ap.add_argument("trace")
+    ap.add_argument("--limit", type=int, default=0)
+    args = ap.parse_args()
+
+    records = list(read_trace(args.trace))
+    if args.cmd == "dump":
+        for i, r in enumerate(records):
+            if args.limit and i >= args.limit:
+                break
+            res = f"errno={r.errno}" if r.errno else r.rx.hex()
+            print(f"{r.t_ns / 1e6:12.3f}ms {r.dur_ns / 1e3:8.1f}us {KIND_NAMES[r.kind]:6s} {r.addr:#04x} {r.tx.hex()} -> {res}")
+        return 0
+
+    if args.cmd == "stats":
+        by_kind: dict[str, list[int]] = {}
+        for r in records:
+            by_kind.setdefault(KIND_NAMES[r.kind], []).append(r.dur_ns)
+        span = (records[-1].t_ns - records[0].t_ns) / 1e6 if records else 0
+        print(f"records={len(records)} span={span:.1f}ms failed={sum(1 for r in records if r.errno)}")
+        for k, d in by_kind.items():
+            d.sort()
+            print(f"{k:6s} n={len(d)} p50={d[len(d) // 2] / 1e3:.1f}us p99={d[len(d) * 99 // 100] / 1e3:.1f}us")
+        return 0
+
+    import hx_emulator
+
+    dev = hx_emulator.HxDevice()
+    res = replay_against(records, spi=hx_emulator.EmulatedSpiBus(dev), i2c=hx_emulator.EmulatedI2C(dev))
+    print(
+        f"records={res['records']} rx_mismatch={res['rx_mismatch']} "
+        f"replay={res['replay_ns'] / 1e6:.1f}ms recorded={res['recorded_ns'] / 1e6:.1f}ms"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,92 +4,64 @@
 
 Run controlled write sequences and measure whether the touch event plane
 (cmd 0x30) leaves the all-zero state.
+
+Scenarios are data, not code: a JSON file lists named step sequences
+(see scenarios/wakeup_matrix.json). Each sequence is compiled once into
+batched SPI_IOC_MESSAGE(n) transfers and replayed for --repeat trials,
+stopping early once the activation rate is clearly above or below
+--decision-rate.
+
+Trials are only independent if each starts from the same chip state, so
+a scenario's "setup" steps run before every trial. A top-level "setup"
+in the file is the default for scenarios without their own; the shipped
+one leaves safe mode, resets the IC CPU and polls status back to idle
+(0x04). --repeat above 1 is refused for a scenario with no setup.
 """
 
 import argparse
-import array
-import ctypes
-import fcntl
 import hashlib
+import json
+import math
 import os
 import struct
 import time
-from dataclasses import dataclass
-
-
-SPI_IOC_WR_MODE = 0x40016B01
-SPI_IOC_WR_BITS_PER_WORD = 0x40016B03
-SPI_IOC_WR_MAX_SPEED_HZ = 0x40046B04
-
-
-def spi_ioc_message(n: int) -> int:
-    return 0x40006B00 | (n * 32 << 16)
-
-
-class SpiIocTransfer(ctypes.Structure):
-    _fields_ = [
-        ("tx_buf", ctypes.c_uint64),
-        ("rx_buf", ctypes.c_uint64),
-        ("len", ctypes.c_uint32),
-        ("speed_hz", ctypes.c_uint32),
-        ("delay_usecs", ctypes.c_uint16),
-        ("bits_per_word", ctypes.c_uint8),
-        ("cs_change", ctypes.c_uint8),
-        ("tx_nbits", ctypes.c_uint8),
-        ("rx_nbits", ctypes.c_uint8),
-        ("word_delay_usecs", ctypes.c_uint8),
-        ("pad", ctypes.c_uint8),
-    ]
-
-
-class SpiBus:
-    def __init__(self, dev: str, mode: int, speed: int):
-        self.fd = os.open(dev, os.O_RDWR)
-        self.speed = speed
-        fcntl.ioctl(self.fd, SPI_IOC_WR_MODE, array.array("B", [mode]))
-        fcntl.ioctl(self.fd, SPI_IOC_WR_BITS_PER_WORD, array.array("B", [8]))
-        fcntl.ioctl(self.fd, SPI_IOC_WR_MAX_SPEED_HZ, array.array("I", [speed]))
-
-    def close(self) -> None:
-        os.close(self.fd)
-
-    def xfer(self, tx: bytes | bytearray | list[int], total_len: int | None = None) -> bytes:
-        tx_buf = bytearray(tx)
-        if total_len is None:
-            total_len = len(tx_buf)
-        tx_buf.extend(b"\x00" * max(0, total_len - len(tx_buf)))
-        n = total_len
-        tb = (ctypes.c_uint8 * n)(*tx_buf[:n])
-        rb = (ctypes.c_uint8 * n)()
-        x = SpiIocTransfer()
-        x.tx_buf = ctypes.addressof(tb)
-        x.rx_buf = ctypes.addressof(rb)
-        x.len = n
-        x.speed_hz = self.speed
-        x.bits_per_word = 8
-        fcntl.ioctl(self.fd, spi_ioc_message(1), x)
-        return bytes(rb)
-
-    def hw(self, cmd: int, payload: bytes = b"") -> None:
-        self.xfer([0xF2, cmd] + list(payload))
-
-    def hr(self, cmd: int, n: int) -> bytes:
-        out = self.xfer([0xF3, cmd, 0x00] + [0] * n)
-        return out[3 : 3 + n]
-
-    def burst(self) -> None:
-        self.hw(0x13, b"\x31")
-        self.hw(0x0D, b"\x12")
-
-    def ar(self, addr: int) -> int:
-        self.burst()
-        self.hw(0x00, struct.pack("<I", addr))
-        self.hw(0x0C, b"\x00")
-        return struct.unpack("<I", self.hr(0x08, 4))[0]
-
-    def aw(self, addr: int, value: int) -> None:
-        self.burst()
-        self.hw(0x00, struct.pack("<I", addr) + struct.pack("<I", value))
+from dataclasses import dataclass, field
+
+import hx83121a.profile as hx_profile
+import hx83121a.rt as hx_rt
+import hx_trace
+from hx83121a import broker
+from hx83121a.regs import (
+    ADDR_CODE_SRAM,
+    ADDR_FLASH_RELOAD,
+    ADDR_FW_ISR_CTRL,
+    ADDR_HANDSHAKE,
+    ADDR_IC_ID,
+    ADDR_IC_STATUS,
+    ADDR_RELOAD_DONE,
+    ADDR_RELOAD_STATUS,
+    ADDR_SORTING_MODE,
+    ADDR_SYSTEM_RESET,
+    REG_AHB_ADDR,
+    REG_BURST,
+    REG_EVENT,
+    REG_INCR,
+    REG_SAFE_PW1,
+    REG_SAFE_PW2,
+    SAFE_PW,
+)
+from hx83121a.spi import (
+    BURST_FRAMES,
+    SPI_MAX_MESSAGE_BYTES,
+    SPI_MAX_MESSAGE_XFERS,
+    SpiBatch,
+    SpiBus,
+    ahb_read_frames,
+    hw_frame,
+)
+
+
+DEFAULT_SCENARIO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios", "wakeup_matrix.json")
 
 
 @dataclass
@@ -108,17 +80,17 @@ class Snapshot:
 
 
 def snap(bus: SpiBus, frame_len: int) -> Snapshot:
-    p = bus.hr(0x30, frame_len)
+    p = bus.hr(REG_EVENT, frame_len)
     return Snapshot(
-        icid=bus.ar(0x900000D0),
-        status=bus.ar(0x900000A8),
-        handshake=bus.ar(0x900000AC),
-        fw_status=bus.ar(0x9000005C),
-        sram0=bus.ar(0x08000000),
-        reload0=bus.ar(0x80050000),
-        flash_reload=bus.ar(0x10007F00),
-        reload2=bus.ar(0x100072C0),
-        sorting=bus.ar(0x10007F04),
+        icid=bus.ar(ADDR_IC_ID),
+        status=bus.ar(ADDR_IC_STATUS),
+        handshake=bus.ar(ADDR_HANDSHAKE),
+        fw_status=bus.ar(ADDR_FW_ISR_CTRL),
+        sram0=bus.ar(ADDR_CODE_SRAM),
+        reload0=bus.ar(ADDR_RELOAD_STATUS),
+        flash_reload=bus.ar(ADDR_FLASH_RELOAD),
+        reload2=bus.ar(ADDR_RELOAD_DONE),
+        sorting=bus.ar(ADDR_SORTING_MODE),
         cmd30_nz=sum(1 for b in p if b),
         cmd30_sha=hashlib.sha1(p).hexdigest()[:12],
     )
@@ -139,86 +111,337 @@ def print_snap(tag: str, s: Snapshot) -> None:
 
 
 def safe_enter(bus: SpiBus) -> None:
-    bus.hw(0x31, b"\x27")
-    bus.hw(0x32, b"\x95")
+    bus.hw(REG_SAFE_PW1, bytes([SAFE_PW[0]]))
+    bus.hw(REG_SAFE_PW2, bytes([SAFE_PW[1]]))
 
 
 def safe_exit(bus: SpiBus) -> None:
-    bus.hw(0x31, b"\x00")
-    bus.hw(0x32, b"\x00")
-
-
-def run_scenario(bus: SpiBus, name: str) -> None:
-    if name == "baseline":
-        return
-    if name == "system_reset":
-        bus.aw(0x90000018, 0x00000055)
-        time.sleep(0.15)
-        return
-    if name == "fw_stop":
-        bus.aw(0x9000005C, 0x000000A5)
-        time.sleep(0.05)
-        return
-    if name == "enable_reload":
-        bus.aw(0x10007F00, 0x00000000)
-        time.sleep(0.02)
-        return
-    if name == "activ_relod":
-        bus.aw(0x90000048, 0x000000EC)
-        time.sleep(0.20)
-        return
-    if name == "safe_reload_combo":
-        bus.aw(0x9000005C, 0x000000A5)
-        time.sleep(0.03)
-        safe_enter(bus)
-        time.sleep(0.05)
-        bus.aw(0x10007F00, 0x00000000)
-        bus.aw(0x100072C0, 0x00000000)
-        bus.aw(0x90000048, 0x000000EC)
-        time.sleep(0.30)
-        safe_exit(bus)
-        time.sleep(0.12)
-        return
-    if name == "system_reset_then_activ":
-        bus.aw(0x90000018, 0x00000055)
-        time.sleep(0.20)
-        bus.aw(0x90000048, 0x000000EC)
-        time.sleep(0.25)
-        return
-    raise ValueError(f"unknown scenario: {name}")
+    bus.hw(REG_SAFE_PW1, b"\x00")
+    bus.hw(REG_SAFE_PW2, b"\x00")
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+@dataclass
+class Wait:
+    seconds: float
+
+
+@dataclass
+class Poll:
+    """Re-run a prebuilt AHB read until (value & mask) == want or timeout."""
+
+    read: SpiBatch
+    mask: int
+    want: int
+    timeout: float
+    interval: float
+
+    def value(self) -> int:
+        return struct.unpack_from("<I", bytes(self.read.rx[-1]), 3)[0]
+
+
+@dataclass
+class Plan:
+    name: str
+    items: list = field(default_factory=list)
+    setup: list = field(default_factory=list)
+
+    @property
+    def ioctls(self) -> int:
+        return sum(1 for it in self.items if isinstance(it, SpiBatch))
+
+
+def _num(v) -> int:
+    return int(v, 0) if isinstance(v, str) else int(v)
+
+
+def _payload(v) -> bytes:
+    if isinstance(v, str):
+        return bytes.fromhex(v.replace(" ", ""))
+    if isinstance(v, int):
+        return bytes([v])
+    return bytes(_num(x) for x in v)
+
+
+def compile_steps(steps: list[dict], speed: int, delays: dict[str, float] | None = None) -> list:
+    """Compile JSON steps into SpiBatch/Wait/Poll items.
+
+    Runs of writes between waits collapse into as few ioctls as spidev
+    allows; the burst setup that aw() repeats per word is sent once per
+    batch, and again after anything that changes or resets the bridge
+    mode (a reg_write to REG_INCR/REG_BURST, an ahb_write to
+    ADDR_SYSTEM_RESET). A wait step with a "name" takes its duration from
+    delays (seconds) when present there.
+    """
+    delays = delays or {}
+    items: list = []
+    pending: list[bytes] = []
+    burst_sent = False
+
+    def flush() -> None:
+        nonlocal pending, burst_sent
+        batch: list[bytes] = []
+        size = 0
+        for f in pending:
+            if batch and (size + len(f) > SPI_MAX_MESSAGE_BYTES or len(batch) == SPI_MAX_MESSAGE_XFERS):
+                items.append(SpiBatch(batch, speed))
+                batch, size = [], 0
+            batch.append(f)
+            size += len(f)
+        if batch:
+            items.append(SpiBatch(batch, speed))
+        pending = []
+        burst_sent = False
+
+    for i, step in enumerate(steps):
+        op = step.get("op")
+        try:
+            if op == "ahb_write":
+                if not burst_sent:
+                    pending.extend(BURST_FRAMES)
+                    burst_sent = True
+                addr, value = _num(step["addr"]), _num(step["value"])
+                pending.append(hw_frame(REG_AHB_ADDR, struct.pack("<II", addr, value)))
+                if addr == ADDR_SYSTEM_RESET:
+                    burst_sent = False
+            elif op == "reg_write":
+                cmd = _num(step["cmd"])
+                pending.append(hw_frame(cmd, _payload(step.get("data", b""))))
+                if cmd in (REG_INCR, REG_BURST):
+                    burst_sent = False
+            elif op == "wait":
+                flush()
+                name = step.get("name")
+                if name in delays:
+                    items.append(Wait(delays[name]))
+                else:
+                    items.append(Wait(_num(step["ms"]) / 1000.0))
+            elif op == "poll":
+                flush()
+                items.append(
+                    Poll(
+                        read=SpiBatch(ahb_read_frames(_num(step["addr"])), speed),
+                        mask=_num(step.get("mask", 0xFFFFFFFF)),
+                        want=_num(step["value"]),
+                        timeout=_num(step.get("timeout_ms", 1000)) / 1000.0,
+                        interval=_num(step.get("interval_ms", 10)) / 1000.0,
+                    )
+                )
+            else:
+                raise ScenarioError(f"unknown op {op!r}")
+        except (KeyError, TypeError, ValueError) as e:
+            raise ScenarioError(f"step {i} ({op}): {e}") from e
+    flush()
+    return items
+
+
+def read_scenarios(path: str) -> dict[str, dict]:
+    """Scenarios by name, each with the file's default "setup" unless it has its own."""
+    with open(path) as f:
+        doc = json.load(f)
+    setup = doc.get("setup", [])
+    return {sc["name"]: {"setup": setup, **sc} for sc in doc.get("scenarios", [])}
+
+
+def compile_scenario(sc: dict, speed: int, delays: dict[str, float] | None = None) -> Plan:
+    return Plan(
+        name=sc["name"],
+        items=compile_steps(sc.get("steps", []), speed, delays),
+        setup=compile_steps(sc.get("setup", []), speed, delays),
+    )
+
+
+def load_scenarios(path: str, speed: int, delays: dict[str, float] | None = None) -> dict[str, Plan]:
+    """Compile every scenario in path; named waits default to the timing profile."""
+    if delays is None:
+        delays = hx_profile.read_json(hx_profile.TIMING_PROFILE).get("delays", {})
+    plans: dict[str, Plan] = {}
+    for name, sc in read_scenarios(path).items():
+        try:
+            plans[name] = compile_scenario(sc, speed, delays)
+        except ScenarioError as e:
+            raise ScenarioError(f"{path}: scenario {name}: {e}") from e
+    return plans
+
+
+def execute(bus: SpiBus, items: list, meter: hx_rt.JitterMeter | None = None) -> bool:
+    """Run compiled items; False if a poll barrier timed out."""
+    for it in items:
+        if isinstance(it, SpiBatch):
+            bus.xfer_many(it)
+        elif isinstance(it, Wait):
+            hx_rt.precise_sleep(it.seconds, meter)
+        else:
+            deadline = time.monotonic() + it.timeout
+            while True:
+                bus.xfer_many(it.read)
+                if it.value() & it.mask == it.want:
+                    break
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(it.interval)
+    return True
+
+
+def wilson_interval(k: int, n: int, z: float = 1.96) -> tuple[float, float]:
+    if n == 0:
+        return 0.0, 1.0
+    p = k / n
+    d = 1 + z * z / n
+    c = (p + z * z / (2 * n)) / d
+    h = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / d
+    return max(0.0, c - h), min(1.0, c + h)
+
+
+@dataclass
+class Stats:
+    name: str
+    trials: int = 0
+    hits: int = 0
+    poll_timeouts: int = 0
+    setup_timeouts: int = 0
+    first_nz_ms: list[float] = field(default_factory=list)
+    seq_ms: list[float] = field(default_factory=list)
+    waits: hx_rt.JitterMeter = field(default_factory=hx_rt.JitterMeter)
+
+    def interval(self) -> tuple[float, float]:
+        return wilson_interval(self.hits, self.trials)
+
+    def decided(self, rate: float, min_trials: int) -> bool:
+        if self.trials < min_trials:
+            return False
+        lo, hi = self.interval()
+        return lo > rate or hi < rate
+
+    def summary(self) -> dict:
+        lo, hi = self.interval()
+        t = sorted(self.first_nz_ms)
+        return {
+            "scenario": self.name,
+            "trials": self.trials,
+            "hits": self.hits,
+            "rate": self.hits / self.trials if self.trials else 0.0,
+            "ci95": [round(lo, 4), round(hi, 4)],
+            "poll_timeouts": self.poll_timeouts,
+            "setup_timeouts": self.setup_timeouts,
+            "first_nz_ms_min": round(t[0], 2) if t else None,
+            "first_nz_ms_median": round(t[len(t) // 2], 2) if t else None,
+            "seq_ms_mean": round(sum(self.seq_ms) / len(self.seq_ms), 2) if self.seq_ms else None,
+        }
+
+
+def watch_event_plane(bus: SpiBus, frame_len: int, window: float, interval: float) -> float | None:
+    """Poll cmd 0x30 until a non-zero frame; return ms to it, or None."""
+    t0 = time.monotonic()
+    while True:
+        if any(bus.hr(REG_EVENT, frame_len)):
+            return (time.monotonic() - t0) * 1000.0
+        if time.monotonic() - t0 >= window:
+            return None
+        time.sleep(interval)
+
+
+def run_trials(bus: SpiBus, plan: Plan, args: argparse.Namespace) -> Stats:
+    st = Stats(plan.name)
+    for _ in range(args.repeat):
+        if plan.setup and not execute(bus, plan.setup):
+            # a trial whose setup never reached its state is a miss, not a skip
+            st.trials += 1
+            st.setup_timeouts += 1
+            if st.decided(args.decision_rate, args.min_trials):
+                break
+            continue
+        t0 = time.monotonic()
+        ok = execute(bus, plan.items, st.waits)
+        st.seq_ms.append((time.monotonic() - t0) * 1000.0)
+        st.trials += 1
+        if not ok:
+            st.poll_timeouts += 1
+        else:
+            t = watch_event_plane(bus, args.frame_len, args.watch_ms / 1000.0, args.watch_interval_ms / 1000.0)
+            if t is not None:
+                st.hits += 1
+                st.first_nz_ms.append(t)
+        if st.decided(args.decision_rate, args.min_trials):
+            break
+    return st
 
 
 def main() -> int:
+    spi = hx_profile.spi_defaults()
     parser = argparse.ArgumentParser()
-    parser.add_argument("--dev", default="/dev/spidev0.0")
-    parser.add_argument("--mode", type=int, default=3)
-    parser.add_argument("--speed", type=int, default=1_000_000)
+    parser.add_argument("--dev", default=spi["dev"])
+    parser.add_argument("--mode", type=int, default=spi["mode"])
+    parser.add_argument("--speed", type=int, default=spi["speed"])
     parser.add_argument("--frame-len", type=int, default=512)
+    parser.add_argument("--scenario-file", default=DEFAULT_SCENARIO_FILE)
     parser.add_argument(
         "--scenarios",
-        default="baseline,fw_stop,enable_reload,activ_relod,safe_reload_combo,system_reset,system_reset_then_activ",
-        help="comma-separated scenario list",
+        default="",
+        help="comma-separated scenario list (default: every scenario in --scenario-file)",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="max trials per scenario")
+    parser.add_argument("--min-trials", type=int, default=10, help="trials before early stopping may kick in")
+    parser.add_argument(
+        "--decision-rate",
+        type=float,
+        default=0.5,
+        help="stop a scenario once the 95%% CI of its hit rate excludes this value",
     )
+    parser.add_argument("--watch-ms", type=int, default=300, help="event-plane observation window per trial")
+    parser.add_argument("--watch-interval-ms", type=int, default=5)
+    parser.add_argument("--json-out", help="append per-scenario statistics as JSON lines")
+    parser.add_argument("--rt", action="store_true", help="SCHED_FIFO + CPU pinning + mlockall while running")
+    parser.add_argument("--rt-prio", type=int, default=50)
+    parser.add_argument("--rt-cpu", type=int, help="pin to this CPU in --rt mode")
     args = parser.parse_args()
 
-    scenarios = [x.strip() for x in args.scenarios.split(",") if x.strip()]
+    plans = load_scenarios(args.scenario_file, args.speed)
+    scenarios = [x.strip() for x in args.scenarios.split(",") if x.strip()] or list(plans)
+    for sc in scenarios:
+        if sc not in plans:
+            parser.error(f"unknown scenario: {sc}")
+        if args.repeat > 1 and not plans[sc].setup:
+            parser.error(f"scenario {sc} has no setup steps; its trials would not be independent (use --repeat 1)")
     print("=== HX Wakeup Matrix ===")
     print(f"dev={args.dev} mode={args.mode} speed={args.speed} frame_len={args.frame_len}")
-    print(f"scenarios={scenarios}")
+    print(f"scenarios={scenarios} repeat={args.repeat}")
 
-    bus = SpiBus(args.dev, args.mode, args.speed)
+    bus = hx_trace.maybe_record(broker.open_spi(SpiBus, args.dev, args.mode, args.speed))
+    out = open(args.json_out, "a") if args.json_out else None
+    if args.rt:
+        print("rt: " + " ".join(f"{k}={v}" for k, v in hx_rt.enter_realtime(args.rt_prio, args.rt_cpu).items()))
     try:
         safe_exit(bus)
         for sc in scenarios:
-            print(f"\n[{sc}]")
+            plan = plans[sc]
+            print(f"\n[{sc}] ioctls/trial={plan.ioctls}")
             before = snap(bus, args.frame_len)
             print_snap("before", before)
-            run_scenario(bus, sc)
+            st = run_trials(bus, plan, args)
             after = snap(bus, args.frame_len)
             print_snap("after ", after)
+            res = st.summary()
+            print(
+                f"stats : trials={res['trials']} hits={res['hits']} rate={res['rate']:.3f} "
+                f"ci95={res['ci95']} poll_timeouts={res['poll_timeouts']} "
+                f"setup_timeouts={res['setup_timeouts']} "
+                f"first_nz_ms(min/med)={res['first_nz_ms_min']}/{res['first_nz_ms_median']} "
+                f"seq_ms={res['seq_ms_mean']}"
+            )
+            print(st.waits.line("waits "))
+            res["wait_jitter"] = st.waits.report()
+            if out:
+                out.write(json.dumps(res) + "\n")
+                out.flush()
         safe_exit(bus)
     finally:
         bus.close()
+        if out:
+            out.close()
     return 0
 
 
@@ -16,11 +16,21 @@ depending on Boot ROM. The key insight from the Xiaomi driver is:
 6. Sense-on to start firmware execution
 
 Usage:
-  python3 load_firmware_i2c.py /path/to/hx83121a_gaokun_fw.bin
+  python3 load_firmware_i2c.py /path/to/hx83121a_gaokun_fw.bin [--plan]
+
+--plan runs the same sequence from a precompiled transaction plan
+(hx_loadplan.py, cached per image hash): the same transactions, one
+I2C_RDWR per write, without the per-word Python work. Either way SRAM
+is written in AHB writes of the size the bus profile records
+(hx_caps.py), one word per write if the adapter was never probed.
+
+Load result, duration, throughput and bus errors are exported through
+hx83121a.metrics (hx83121a_loader.prom).
 
 Requirements:
   - i2c-dev module loaded
-  - /dev/i2c-4 accessible (i2c_hid_of driver must be unbound first)
+  - /dev/i2c-N accessible (i2c_hid_of driver must be unbound first);
+    the adapter is found by hx83121a.discover (cached after the first run)
   - IC must be in state 0x04 (idle) - typically after cold boot
 """
 
@@ -28,176 +38,72 @@ import os
 import sys
 import struct
 import time
-import fcntl
-import ctypes
-
-# === I2C Constants ===
-I2C_SLAVE_FORCE = 0x0706
-I2C_RDWR = 0x0707
-I2C_ADDR_AHB = 0x48  # AHB bridge address
-I2C_ADDR_HID = 0x4F  # HID interface (for verification)
-I2C_BUS = 4           # /dev/i2c-4
-
-# === HX83121A Register Addresses ===
-ADDR_IC_STATUS      = 0x900000A8
-ADDR_IC_ID          = 0x900000D0
-ADDR_SYSTEM_RESET   = 0x90000018
-ADDR_FW_ISR_CTRL    = 0x9000005C
-ADDR_LEAVE_SAFE     = 0x90000098
-ADDR_TCON_RESET     = 0x80020020
-ADDR_ADC_RESET      = 0x80020094
-ADDR_CODE_SRAM      = 0x08000000
-ADDR_FLASH_RELOAD   = 0x10007F00
-ADDR_SORTING_MODE   = 0x10007F04
-ADDR_RELOAD_DONE    = 0x100072C0
-ADDR_N_FRAME        = 0x10007294
-ADDR_RAW_OUT_SEL    = 0x800204B4
-ADDR_RELOAD_STATUS  = 0x80050000
-ADDR_RELOAD_CRC32   = 0x80050018
-ADDR_CRC_ADDR       = 0x80050020
-ADDR_CRC_CMD        = 0x80050028
-
-# === Constants ===
-DATA_SYSTEM_RESET   = 0x00000055
-DATA_FW_STOP        = 0x000000A5
-DATA_LEAVE_SAFE     = 0x00000053
-STATUS_IDLE         = 0x04
-STATUS_FW_RUNNING   = 0x05
-STATUS_SAFE_MODE    = 0x0C
+
+import hx83121a.profile as hx_profile
+import hx83121a.rt as hx_rt
+from hx83121a import broker, discover, metrics
+from hx83121a.i2c import AhbI2C
+from hx83121a.regs import (
+    ADDR_ADC_RESET,
+    ADDR_CRC_ADDR,
+    ADDR_CRC_CMD,
+    ADDR_FLASH_RELOAD,
+    ADDR_LEAVE_SAFE,
+    ADDR_N_FRAME,
+    ADDR_RAW_OUT_SEL,
+    ADDR_RELOAD_CRC32,
+    ADDR_RELOAD_DONE,
+    ADDR_RELOAD_STATUS,
+    ADDR_SORTING_MODE,
+    ADDR_SYSTEM_RESET,
+    ADDR_TCON_RESET,
+    DATA_LEAVE_SAFE,
+    DATA_SYSTEM_RESET,
+    HID_DEVICE,
+    I2C_BUS,
+    REG_SAFE_PW1,
+    REG_SAFE_PW2,
+    SAFE_PW,
+    STATUS_FW_RUNNING,
+    STATUS_IDLE,
+    STATUS_SAFE_MODE,
+)
+
+# === Sequence delays (seconds) ===
+# Defaults are the hand-picked values; hx_delay_tune.py writes validated
+# minimums to the timing profile as "loader.<name>".
+DELAYS = hx_profile.load_timing("loader", {
+    "system_reset":   0.050,   # after SYSTEM_RESET write
+    "post_reset":     0.100,   # before re-enabling burst after reset
+    "safe_mode":      0.010,   # after safe-mode password
+    "safe_poll":      0.010,   # status poll interval while entering safe mode
+    "tcon_reset":     0.010,
+    "adc_reset_low":  0.005,
+    "adc_reset":      0.010,
+    "crc_poll":       0.010,
+    "sense_on":       0.100,   # after leave-safe
+    "fw_start":       0.500,   # before checking status 0x05
+    "unbind":         0.5,
+    "rebind":         1.0,
+})
 
 # === Firmware partition table offset ===
 FW_PARTITION_TABLE_OFFSET = 0x20030  # In firmware binary (0x20000 + 0x30 header)
 
-# === I2C Message Structure for I2C_RDWR ===
-class i2c_msg(ctypes.Structure):
-    _fields_ = [
-        ("addr", ctypes.c_ushort),
-        ("flags", ctypes.c_ushort),
-        ("len", ctypes.c_ushort),
-        ("buf", ctypes.POINTER(ctypes.c_ubyte)),
-    ]
-
-class i2c_rdwr_ioctl_data(ctypes.Structure):
-    _fields_ = [
-        ("msgs", ctypes.POINTER(i2c_msg)),
-        ("nmsgs", ctypes.c_uint),
-    ]
-
-
-class HX83121A_I2C:
-    """I2C communication with HX83121A via AHB bridge."""
-
-    def __init__(self, bus_num=I2C_BUS):
-        self.fd = os.open(f"/dev/i2c-{bus_num}", os.O_RDWR)
-        self.bus_num = bus_num
-
-    def close(self):
-        os.close(self.fd)
-
-    def _i2c_combined(self, addr, wdata, rlen):
-        """Combined write+read I2C transaction (repeated start)."""
-        wbuf = (ctypes.c_ubyte * len(wdata))(*wdata)
-        rbuf = (ctypes.c_ubyte * rlen)()
-
-        msgs = (i2c_msg * 2)()
-        msgs[0].addr = addr
-        msgs[0].flags = 0  # write
-        msgs[0].len = len(wdata)
-        msgs[0].buf = ctypes.cast(wbuf, ctypes.POINTER(ctypes.c_ubyte))
-
-        msgs[1].addr = addr
-        msgs[1].flags = 1  # read (I2C_M_RD)
-        msgs[1].len = rlen
-        msgs[1].buf = ctypes.cast(rbuf, ctypes.POINTER(ctypes.c_ubyte))
-
-        data = i2c_rdwr_ioctl_data()
-        data.msgs = msgs
-        data.nmsgs = 2
-
-        fcntl.ioctl(self.fd, I2C_RDWR, data)
-        return bytes(rbuf)
-
-    def _i2c_write(self, addr, data):
-        """Simple I2C write transaction."""
-        wbuf = (ctypes.c_ubyte * len(data))(*data)
-        msgs = (i2c_msg * 1)()
-        msgs[0].addr = addr
-        msgs[0].flags = 0
-        msgs[0].len = len(data)
-        msgs[0].buf = ctypes.cast(wbuf, ctypes.POINTER(ctypes.c_ubyte))
-
-        d = i2c_rdwr_ioctl_data()
-        d.msgs = msgs
-        d.nmsgs = 1
-
-        fcntl.ioctl(self.fd, I2C_RDWR, d)
-
-    # === Direct I2C Register Access (NOT AHB) ===
-
-    def reg_write(self, reg, value):
-        """Write a single byte to I2C register (direct, not AHB)."""
-        self._i2c_write(I2C_ADDR_AHB, [reg, value])
-
-    def reg_read(self, reg):
-        """Read a single byte from I2C register (direct, not AHB)."""
-        data = self._i2c_combined(I2C_ADDR_AHB, [reg], 1)
-        return data[0]
-
-    # === AHB Bridge Access ===
-
-    def ahb_read(self, addr, length=4):
-        """Read from AHB address via I2C bridge (combined write+read)."""
-        addr_le = struct.pack("<I", addr)
-        wdata = [0x00] + list(addr_le)
-        return self._i2c_combined(I2C_ADDR_AHB, wdata, length)
-
-    def ahb_read32(self, addr):
-        """Read 32-bit value from AHB address."""
-        data = self.ahb_read(addr, 4)
-        return struct.unpack("<I", data)[0]
-
-    def ahb_write(self, addr, data_bytes):
-        """Write to AHB address via I2C bridge (single transaction)."""
-        addr_le = struct.pack("<I", addr)
-        wdata = [0x00] + list(addr_le) + list(data_bytes)
-        self._i2c_write(I2C_ADDR_AHB, wdata)
-
-    def ahb_write32(self, addr, value):
-        """Write 32-bit value to AHB address."""
-        self.ahb_write(addr, struct.pack("<I", value))
-
-    # === Burst Mode ===
-
-    def burst_enable(self, enable=True):
-        """Enable/disable burst mode (INCR4)."""
-        # Register 0x13 = 0x31 (burst continuous mode)
-        self.reg_write(0x13, 0x31)
-        # Register 0x0D = 0x12 | auto_increment
-        if enable:
-            self.reg_write(0x0D, 0x13)  # 0x12 | 0x01 = INCR4 + auto-increment
-        else:
-            self.reg_write(0x0D, 0x12)  # INCR4 without auto-increment
-
-    # === High-Level Operations ===
 
-    def read_ic_id(self):
-        """Read IC identification."""
-        return self.ahb_read32(ADDR_IC_ID)
-
-    def read_status(self):
-        """Read IC status register."""
-        return self.ahb_read32(ADDR_IC_STATUS) & 0xFF
+class HX83121A_I2C(AhbI2C):
+    """Loader operations on top of the AHB bridge transport."""
 
     def system_reset(self):
         """Perform IC system reset."""
         self.ahb_write32(ADDR_SYSTEM_RESET, DATA_SYSTEM_RESET)
-        time.sleep(0.050)  # 50ms after reset
+        time.sleep(DELAYS["system_reset"])
 
     def enter_safe_mode(self):
         """Enter safe mode via I2C password."""
-        self.reg_write(0x31, 0x27)
-        self.reg_write(0x32, 0x95)
-        time.sleep(0.010)
+        self.reg_write(REG_SAFE_PW1, SAFE_PW[0])
+        self.reg_write(REG_SAFE_PW2, SAFE_PW[1])
+        time.sleep(DELAYS["safe_mode"])
 
     def verify_safe_mode(self):
         """Verify IC is in safe mode (status 0x0C)."""
@@ -205,30 +111,30 @@ class HX83121A_I2C:
             status = self.read_status()
             if status == STATUS_SAFE_MODE:
                 return True
-            time.sleep(0.010)
+            time.sleep(DELAYS["safe_poll"])
         return False
 
     def reset_tcon(self):
         """Reset TCON controller (required before SRAM write!)."""
         self.ahb_write32(ADDR_TCON_RESET, 0x00000000)
-        time.sleep(0.010)
+        time.sleep(DELAYS["tcon_reset"])
 
     def reset_adc(self):
         """Reset ADC controller (required before SRAM write!)."""
         self.ahb_write32(ADDR_ADC_RESET, 0x00000000)
-        time.sleep(0.005)
+        time.sleep(DELAYS["adc_reset_low"])
         self.ahb_write32(ADDR_ADC_RESET, 0x00000001)
-        time.sleep(0.010)
+        time.sleep(DELAYS["adc_reset"])
 
     def write_sram(self, addr, data):
         """Write data to SRAM via AHB bridge.
 
-        For HX83121A, max chunk size is 4096 bytes.
-        For I2C, we write 4 bytes at a time with auto-increment.
+        Each AHB write carries caps["max_write"] bytes with auto-increment:
+        4 unless hx_caps.py found the adapter and bridge take longer writes.
         """
         total = len(data)
         offset = 0
-        chunk_size = 4  # I2C AHB bridge: 4 bytes per transaction
+        chunk_size = self.caps["max_write"]
 
         self.burst_enable(True)
 
@@ -236,16 +142,16 @@ class HX83121A_I2C:
             remaining = total - offset
             write_len = min(chunk_size, remaining)
 
-            # Pad to 4 bytes if needed
+            # Pad to whole words if needed
             chunk = data[offset:offset + write_len]
-            if len(chunk) < 4:
-                chunk = chunk + b'\x00' * (4 - len(chunk))
+            if len(chunk) % 4:
+                chunk = chunk + b'\x00' * (-len(chunk) % 4)
 
             self.ahb_write(addr + offset, chunk)
             offset += write_len
 
             # Progress indicator every 4KB
-            if offset % 4096 == 0:
+            if offset // 4096 != (offset - write_len) // 4096:
                 pct = offset * 100 // total
                 print(f"\r  Writing SRAM: {offset}/{total} ({pct}%)", end="", flush=True)
 
@@ -266,14 +172,17 @@ class HX83121A_I2C:
             status = self.ahb_read32(ADDR_RELOAD_STATUS)
             if (status & 1) == 0:
                 break
-            time.sleep(0.010)
+            time.sleep(DELAYS["crc_poll"])
 
         # Read CRC result
         crc = self.ahb_read32(ADDR_RELOAD_CRC32)
         return crc
 
-    def sense_on(self):
-        """Start firmware execution (sense_on sequence)."""
+    def sense_on(self, settle=True):
+        """Start firmware execution (sense_on sequence).
+
+        settle=False skips the fixed delay for callers that poll status.
+        """
         # Clear raw output select (HX83121A specific)
         self.ahb_write32(ADDR_RAW_OUT_SEL, 0x00000000)
 
@@ -291,7 +200,8 @@ class HX83121A_I2C:
 
         # Leave safe mode
         self.ahb_write32(ADDR_LEAVE_SAFE, DATA_LEAVE_SAFE)
-        time.sleep(0.100)
+        if settle:
+            time.sleep(DELAYS["sense_on"])
 
 
 def parse_partition_table(fw_data):
@@ -322,8 +232,25 @@ def parse_partition_table(fw_data):
     return partitions
 
 
-def load_firmware(dev, fw_data):
-    """Main firmware loading sequence."""
+def sram_dest(p):
+    """AHB destination address of a partition from parse_partition_table()."""
+    return 0x08000000 + p['sram_addr'] if p['type'] == 'code' else p['sram_addr']
+
+
+def partition_crcs(dev, partitions):
+    """Per-partition hw_crc_check() results keyed by hex destination address."""
+    return {f"{sram_dest(p):08x}": dev.hw_crc_check(sram_dest(p), p['size']) for p in partitions}
+
+
+def load_firmware(dev, fw_data, crc_out=None):
+    """Main firmware loading sequence.
+
+    If crc_out is a dict it receives partition_crcs() of the freshly
+    written code partitions (taken before sense_on, while SRAM is still
+    readable). Config partitions are left out: the running firmware
+    rewrites them, so hx_resumed.py never compares them. Like the CRC
+    check of step 9 the capture is optional; a failure is only logged.
+    """
 
     print("=== HX83121A Firmware Loader ===")
     print(f"Firmware size: {len(fw_data)} bytes")
@@ -339,6 +266,7 @@ def load_firmware(dev, fw_data):
             print(f" ✗ (expected 0x83121A00)")
             return False
     except Exception as e:
+        metrics.bus_error(e)
         print(f"  I2C communication failed: {e}")
         print("  Make sure i2c_hid_of is unbound and IC is accessible")
         return False
@@ -357,7 +285,7 @@ def load_firmware(dev, fw_data):
     # Step 1: System Reset
     print("\n[1] System reset...")
     dev.system_reset()
-    time.sleep(0.100)
+    time.sleep(DELAYS["post_reset"])
 
     # Re-enable burst after reset
     dev.burst_enable(False)
@@ -403,6 +331,7 @@ def load_firmware(dev, fw_data):
             print(f"  Unexpected read back: 0x{val:08X}")
             print("  Trying to continue...")
     except Exception as e:
+        metrics.bus_error(e)
         print(f"  SRAM test failed: {e}")
         return False
 
@@ -415,7 +344,7 @@ def load_firmware(dev, fw_data):
 
     print(f"  Found {len(code_parts)} code partitions, {len(config_parts)} config partitions")
     for i, p in enumerate(partitions):
-        dest = 0x08000000 + p['sram_addr'] if p['type'] == 'code' else p['sram_addr']
+        dest = sram_dest(p)
         print(f"  [{i}] {p['type']:6s}: sram=0x{p['sram_addr']:08X} -> dest=0x{dest:08X} size={p['size']} fw_off=0x{p['fw_offset']:06X}")
 
     # Step 6: Write code partitions to Code SRAM
@@ -461,13 +390,18 @@ def load_firmware(dev, fw_data):
             print(" (non-zero, may still be OK)")
     except Exception as e:
         print(f"  CRC check failed: {e} (continuing)")
+    if crc_out is not None:
+        try:
+            crc_out.update(partition_crcs(dev, [p for p in partitions if p['type'] == 'code']))
+        except Exception as e:
+            print(f"  CRC baseline capture failed: {e} (continuing)")
 
     # Step 10: Sense On (start firmware)
     print("\n[10] Starting firmware (sense_on)...")
     dev.sense_on()
 
     # Wait for firmware to start
-    time.sleep(0.500)
+    time.sleep(DELAYS["fw_start"])
 
     # Check status
     try:
@@ -489,26 +423,30 @@ def load_firmware(dev, fw_data):
         return False
 
 
-def unbind_i2c_hid():
-    """Unbind i2c_hid_of driver to release I2C bus."""
+def unbind_i2c_hid(hid_device=HID_DEVICE, settle=True):
+    """Unbind i2c_hid_of driver to release I2C bus.
+
+    settle=False skips the fixed delay for callers that poll the driver link.
+    """
     unbind_path = "/sys/bus/i2c/drivers/i2c_hid_of/unbind"
     try:
         with open(unbind_path, 'w') as f:
-            f.write("4-004f")
+            f.write(hid_device)
         print("  i2c_hid_of unbound ✓")
-        time.sleep(0.5)
+        if settle:
+            time.sleep(DELAYS["unbind"])
         return True
     except Exception as e:
         print(f"  Unbind failed (may already be unbound): {e}")
         return True  # Continue anyway
 
 
-def bind_i2c_hid():
+def bind_i2c_hid(hid_device=HID_DEVICE):
     """Rebind i2c_hid_of driver to pick up the touchscreen."""
     bind_path = "/sys/bus/i2c/drivers/i2c_hid_of/bind"
     try:
         with open(bind_path, 'w') as f:
-            f.write("4-004f")
+            f.write(hid_device)
         print("  i2c_hid_of rebound ✓")
         return True
     except Exception as e:
@@ -518,11 +456,13 @@ def bind_i2c_hid():
 
 def main():
     if len(sys.argv) < 2:
-        print(f"Usage: {sys.argv[0]} <firmware.bin>")
+        print(f"Usage: {sys.argv[0]} <firmware.bin> [--plan]")
         print(f"  firmware.bin: HX83121A firmware file (261,120 bytes)")
+        print(f"  --plan: load through the cached transaction plan (hx_loadplan.py)")
         sys.exit(1)
 
     fw_path = sys.argv[1]
+    use_plan = "--plan" in sys.argv[2:]
 
     # Load firmware
     print(f"Loading firmware from {fw_path}...")
@@ -539,25 +479,62 @@ def main():
     else:
         print(f"  WARNING: Unexpected header: {fw_data[0:10].hex()}")
 
+    rt = hx_rt.realtime_from_env()
+    if rt:
+        print("RT mode: " + " ".join(f"{k}={v}" for k, v in rt.items()))
+
+    loc = discover.locate()
+    print(f"I2C bus: {loc.bus} ({loc.source}), HID client {loc.hid_device}")
+
     # Unbind i2c_hid_of
     print("\nUnbinding i2c_hid_of driver...")
-    unbind_i2c_hid()
+    unbind_i2c_hid(loc.hid_device)
 
     # Open I2C
-    dev = HX83121A_I2C(I2C_BUS)
+    import hx_trace
+
+    dev = hx_trace.maybe_record(broker.open_i2c(HX83121A_I2C, loc.bus))
 
+    crcs = {}
+    success = False
+    t0 = time.monotonic()
     try:
-        success = load_firmware(dev, fw_data)
+        # the load sequence relies on bridge state: hold the broker for all of it
+        with broker.session(dev):
+            if use_plan:
+                import hx_loadplan
+
+                plan = hx_loadplan.load_or_compile(fw_data, dev.caps)
+                print(f"Transaction plan: {hx_loadplan.plan_path(plan.digest, dev.caps)} ({len(plan.items)} items)")
+                success, captured = hx_loadplan.run(dev, plan)
+                crcs = {k: v for k, v in captured.items() if k != "hw_crc"}
+            else:
+                success = load_firmware(dev, fw_data, crcs)
+    except OSError as e:
+        metrics.bus_error(e)
+        raise
     finally:
         dev.close()
+        elapsed = time.monotonic() - t0
+        mode = "plan" if use_plan else "interpreted"
+        metrics.inc("hx83121a_firmware_loads_total", result="ok" if success else "failed", mode=mode)
+        metrics.observe("hx83121a_firmware_load_duration_seconds", elapsed, mode=mode)
+        if success:
+            written = sum(p['size'] for p in parse_partition_table(fw_data))
+            metrics.gauge("hx83121a_firmware_load_bytes_per_second", round(written / elapsed), mode=mode)
+        metrics.flush("hx83121a_loader")
+    if success and crcs:
+        import hashlib
+
+        hx_profile.save_sram_crc(hashlib.sha256(fw_data).hexdigest(), crcs)
 
     if success:
         print("\n" + "=" * 50)
         print("FIRMWARE LOADED SUCCESSFULLY!")
         print("=" * 50)
         print("\nRebinding i2c_hid_of driver...")
-        time.sleep(1.0)
-        bind_i2c_hid()
+        time.sleep(DELAYS["rebind"])
+        bind_i2c_hid(loc.hid_device)
         print("\nTouchscreen should now be available!")
         print("Check: cat /proc/bus/input/devices | grep -A5 4858")
     else:
@@ -565,7 +542,7 @@ def main():
         print("FIRMWARE LOADING FAILED")
         print("=" * 50)
         print("\nRebinding i2c_hid_of...")
-        bind_i2c_hid()
+        bind_i2c_hid(loc.hid_device)
         sys.exit(1)
 
 
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""SPI clock/mode/length throughput sweep for the HX83121A.
+
+For every (mode, speed) pair a known pattern is written to scratch SRAM
+through aw(), then read back with auto-increment cmd 0x08 bursts of each
+length. A configuration is stable when every readback matches and no
+ioctl fails. The fastest stable configuration is written to the SPI
+profile (/var/lib/hx83121a/spi.json), which the other SPI tools use as
+their --mode/--speed defaults.
+
+The pattern write clobbers --pattern-addr..+max(lengths) on hardware, so
+point it at Data SRAM the firmware is not using (or stop the firmware).
+--emulate runs the same sweep against hx_emulator to test the harness.
+"""
+
+import argparse
+import struct
+import sys
+import time
+
+import hx83121a.profile as hx_profile
+from hx83121a.regs import (
+    BURST_CONTINUOUS,
+    INCR4_AUTO,
+    REG_AHB_ADDR,
+    REG_AHB_DATA,
+    REG_AHB_READ,
+    REG_BURST,
+    REG_INCR,
+)
+from hx83121a.spi import SpiBus
+
+
+def parse_list(s: str) -> list[int]:
+    return [int(x.strip(), 0) for x in s.split(",") if x.strip()]
+
+
+def pattern_words(n_words: int, seed: int) -> list[int]:
+    # xorshift32: cheap, no long runs of equal bytes, differs per config
+    x = seed or 0x2545F491
+    out = []
+    for _ in range(n_words):
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        out.append(x)
+    return out
+
+
+def burst_read(bus: SpiBus, addr: int, n: int) -> bytes:
+    bus.hw(REG_BURST, bytes([BURST_CONTINUOUS]))
+    bus.hw(REG_INCR, bytes([INCR4_AUTO]))
+    bus.hw(REG_AHB_ADDR, struct.pack("<I", addr))
+    bus.hw(REG_AHB_READ, b"\x00")
+    return bus.hr(REG_AHB_DATA, n)
+
+
+def bench_config(bus: SpiBus, args: argparse.Namespace, lengths: list[int], seed: int) -> list[dict]:
+    words = pattern_words((max(lengths) + 3) // 4, seed)
+    expect = struct.pack(f"<{len(words)}I", *words)
+    write_error = None
+    try:
+        for i, w in enumerate(words):
+            bus.aw(args.pattern_addr + 4 * i, w)
+    except OSError as e:
+        write_error = e.errno
+
+    rows = []
+    for n in lengths:
+        row = {"mode": bus.mode, "speed": bus.speed, "len": n, "iters": 0, "errors": 0, "mismatches": 0}
+        if write_error is not None:
+            row["errors"] = 1
+            row["errno"] = write_error
+            rows.append(row)
+            continue
+        t0 = time.perf_counter()
+        deadline = t0 + args.duration_ms / 1000.0
+        while row["iters"] < args.min_iters or time.perf_counter() < deadline:
+            row["iters"] += 1
+            try:
+                got = burst_read(bus, args.pattern_addr, n)
+            except OSError as e:
+                row["errors"] += 1
+                row["errno"] = e.errno
+                break
+            if got != expect[:n]:
+                row["mismatches"] += 1
+            if row["iters"] >= args.max_iters:
+                break
+        dt = time.perf_counter() - t0
+        row["bytes_per_s"] = round(n * row["iters"] / dt)
+        row["xfers_per_s"] = round(5 * row["iters"] / dt)
+        row["stable"] = row["errors"] == 0 and row["mismatches"] == 0
+        rows.append(row)
+    return rows
+
+
+def open_bus(args: argparse.Namespace, mode: int, speed: int) -> SpiBus:
+    if args.emulate:
+        import hx_emulator
+
+        if not hasattr(args, "_device"):
+            args._device = hx_emulator.HxDevice(fail_above_hz=args.emulate_max_hz)
+        return hx_emulator.EmulatedSpiBus(args._device, mode, speed)
+    return SpiBus(args.dev, mode, speed)
+
+
+def pick_best(rows: list[dict]) -> dict | None:
+    """Fastest (mode, speed) whose every length was stable; largest such length.
+
+    max_len is reported only: transfer sizes are bounded by spidev's
+    bufsiz (hx_caps.py), so spi.json stores just dev, mode and speed.
+    """
+    by_cfg: dict[tuple[int, int], list[dict]] = {}
+    for r in rows:
+        by_cfg.setdefault((r["mode"], r["speed"]), []).append(r)
+    best = None
+    for (mode, speed), rs in by_cfg.items():
+        if not all(r["stable"] for r in rs):
+            continue
+        tput = max(r["bytes_per_s"] for r in rs)
+        cand = {"mode": mode, "speed": speed, "max_len": max(r["len"] for r in rs), "bytes_per_s": tput}
+        if best is None or (speed, tput) > (best["speed"], best["bytes_per_s"]):
+            best = cand
+    return best
+
+
+def main() -> int:
+    spi = hx_profile.spi_defaults()
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dev", default=spi["dev"])
+    ap.add_argument("--modes", default="3")
+    ap.add_argument("--speeds", default="1000000,2000000,4000000,8000000,12000000,16000000,19200000,25000000")
+    ap.add_argument("--lengths", default="64,256,512,1024,2048,4088")
+    ap.add_argument("--pattern-addr", type=lambda v: int(v, 0), help="scratch SRAM address (overwritten)")
+    ap.add_argument("--duration-ms", type=int, default=500, help="time budget per (config, length)")
+    ap.add_argument("--min-iters", type=int, default=20)
+    ap.add_argument("--max-iters", type=int, default=100000)
+    ap.add_argument("--write-profile", action="store_true", help=f"store the best config in {hx_profile.SPI_PROFILE}")
+    ap.add_argument("--emulate", action="store_true", help="run against the software stand-in")
+    ap.add_argument("--emulate-max-hz", type=int, default=16_000_000, help="stand-in corrupts reads above this clock")
+    args = ap.parse_args()
+
+    if args.pattern_addr is None:
+        if not args.emulate:
+            ap.error("--pattern-addr is required on hardware (its contents are overwritten)")
+        args.pattern_addr = 0x10000000
+    lengths = parse_list(args.lengths)
+    if not lengths or min(lengths) < 4:
+        ap.error("lengths must be >= 4")
+
+    print("=== SPI Throughput Sweep ===")
+    print(f"dev={'emulator' if args.emulate else args.dev} pattern_addr=0x{args.pattern_addr:08x} lengths={lengths}")
+    print(f"{'mode':>4} {'speed':>9} {'len':>5} {'iters':>6} {'KiB/s':>9} {'xfer/s':>8} {'err':>4} {'bad':>4}  ok")
+    rows = []
+    for mode in parse_list(args.modes):
+        for speed in parse_list(args.speeds):
+            try:
+                bus = open_bus(args, mode, speed)
+            except OSError as e:
+                print(f"{mode:4d} {speed:9d} open failed errno={e.errno}")
+                continue
+            try:
+                cfg_rows = bench_config(bus, args, lengths, seed=mode * 1_000_003 + speed)
+            finally:
+                bus.close()
+            for r in cfg_rows:
+                print(
+                    f"{r['mode']:4d} {r['speed']:9d} {r['len']:5d} {r['iters']:6d} "
+                    f"{r.get('bytes_per_s', 0) / 1024:9.1f} {r.get('xfers_per_s', 0):8d} "
+                    f"{r['errors']:4d} {r['mismatches']:4d}  {'yes' if r.get('stable') else 'NO'}"
+                )
+            rows.extend(cfg_rows)
+
+    best = pick_best(rows)
+    if best is None:
+        print("\nno stable configuration found")
+        return 1
+    print(
+        f"\nmax stable: mode={best['mode']} speed={best['speed']} max_len={best['max_len']} "
+        f"({best['bytes_per_s'] / 1024:.1f} KiB/s)"
+    )
+    if args.write_profile and not args.emulate:
+        hx_profile.save_spi({"dev": args.dev, **best}, rows)
+        print(f"written: {hx_profile.SPI_PROFILE}")
+    elif args.write_profile:
+        print("(--emulate: profile not written)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
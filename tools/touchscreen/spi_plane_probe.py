@@ -10,93 +10,15 @@ It is intended to quickly answer:
 """
 
 import argparse
-import array
-import ctypes
-import fcntl
 import hashlib
-import os
-import struct
 import sys
 import time
-from typing import Iterable
-
-
-SPI_IOC_WR_MODE = 0x40016B01
-SPI_IOC_WR_BITS_PER_WORD = 0x40016B03
-SPI_IOC_WR_MAX_SPEED_HZ = 0x40046B04
-
-
-def spi_ioc_message(n: int) -> int:
-    return 0x40006B00 | (n * 32 << 16)
-
-
-class SpiIocTransfer(ctypes.Structure):
-    _fields_ = [
-        ("tx_buf", ctypes.c_uint64),
-        ("rx_buf", ctypes.c_uint64),
-        ("len", ctypes.c_uint32),
-        ("speed_hz", ctypes.c_uint32),
-        ("delay_usecs", ctypes.c_uint16),
-        ("bits_per_word", ctypes.c_uint8),
-        ("cs_change", ctypes.c_uint8),
-        ("tx_nbits", ctypes.c_uint8),
-        ("rx_nbits", ctypes.c_uint8),
-        ("word_delay_usecs", ctypes.c_uint8),
-        ("pad", ctypes.c_uint8),
-    ]
-
-
-class SpiBus:
-    def __init__(self, dev: str, mode: int, speed: int):
-        self.dev = dev
-        self.mode = mode
-        self.speed = speed
-        self.fd = os.open(dev, os.O_RDWR)
-        fcntl.ioctl(self.fd, SPI_IOC_WR_MODE, array.array("B", [mode]))
-        fcntl.ioctl(self.fd, SPI_IOC_WR_BITS_PER_WORD, array.array("B", [8]))
-        fcntl.ioctl(self.fd, SPI_IOC_WR_MAX_SPEED_HZ, array.array("I", [speed]))
-
-    def close(self) -> None:
-        os.close(self.fd)
-
-    def xfer(self, tx: Iterable[int], total_len: int | None = None) -> bytes:
-        tx_buf = bytearray(tx)
-        if total_len is None:
-            total_len = len(tx_buf)
-        if total_len < len(tx_buf):
-            raise ValueError("total_len smaller than tx size")
-        tx_buf.extend(b"\x00" * (total_len - len(tx_buf)))
-
-        n = total_len
-        tx_c = (ctypes.c_uint8 * n)(*tx_buf[:n])
-        rx_c = (ctypes.c_uint8 * n)()
-
-        x = SpiIocTransfer()
-        x.tx_buf = ctypes.addressof(tx_c)
-        x.rx_buf = ctypes.addressof(rx_c)
-        x.len = n
-        x.speed_hz = self.speed
-        x.bits_per_word = 8
-
-        fcntl.ioctl(self.fd, spi_ioc_message(1), x)
-        return bytes(rx_c)
-
-    def hw(self, cmd: int, payload: bytes = b"") -> None:
-        self.xfer([0xF2, cmd] + list(payload))
-
-    def hr(self, cmd: int, n: int) -> bytes:
-        out = self.xfer([0xF3, cmd, 0x00] + [0] * n)
-        return out[3 : 3 + n]
-
-    def burst_enable(self) -> None:
-        self.hw(0x13, b"\x31")
-        self.hw(0x0D, b"\x12")
-
-    def ahb_read32(self, addr: int) -> int:
-        self.burst_enable()
-        self.hw(0x00, struct.pack("<I", addr))
-        self.hw(0x0C, b"\x00")
-        return struct.unpack("<I", self.hr(0x08, 4))[0]
+
+import hx83121a.profile as hx_profile
+import hx_trace
+from hx83121a import broker
+from hx83121a.regs import ADDR_CODE_SRAM, ADDR_FW_ISR_CTRL, ADDR_HANDSHAKE, ADDR_IC_ID, ADDR_IC_STATUS, REG_EVENT
+from hx83121a.spi import SpiBus
 
 
 def fmt_u32(v: int) -> str:
@@ -112,13 +34,14 @@ def summarize_payload(tag: str, payload: bytes) -> None:
 
 
 def main() -> int:
+    spi = hx_profile.spi_defaults()
     parser = argparse.ArgumentParser()
-    parser.add_argument("--dev", default="/dev/spidev0.0")
-    parser.add_argument("--mode", type=int, default=3)
-    parser.add_argument("--speed", type=int, default=1_000_000)
+    parser.add_argument("--dev", default=spi["dev"])
+    parser.add_argument("--mode", type=int, default=spi["mode"])
+    parser.add_argument("--speed", type=int, default=spi["speed"])
     parser.add_argument(
         "--lengths",
-        default="64,128,256,339,512,1024,2048,3072,4090",
+        default="64,128,256,339,512,1024,2048,3072,4090,8192,16384",
         help="comma-separated payload lengths for cmd 0x30 and cmd 0x08 probes",
     )
     parser.add_argument("--repeat", type=int, default=5)
@@ -134,20 +57,20 @@ def main() -> int:
     print(f"dev={args.dev} mode={args.mode} speed={args.speed}")
     print(f"lengths={lengths} repeat={args.repeat}")
 
-    bus = SpiBus(args.dev, args.mode, args.speed)
+    bus = hx_trace.maybe_record(broker.open_spi(SpiBus, args.dev, args.mode, args.speed))
     try:
         # Baseline register health.
         regs = {
-            "IC_ID": 0x900000D0,
-            "STATUS": 0x900000A8,
-            "HANDSHAKE": 0x900000AC,
-            "FW_STATUS": 0x9000005C,
-            "SRAM0": 0x08000000,
+            "IC_ID": ADDR_IC_ID,
+            "STATUS": ADDR_IC_STATUS,
+            "HANDSHAKE": ADDR_HANDSHAKE,
+            "FW_STATUS": ADDR_FW_ISR_CTRL,
+            "SRAM0": ADDR_CODE_SRAM,
         }
         print("\n[registers]")
         for name, addr in regs.items():
             try:
-                print(f"{name:10s} {fmt_u32(bus.ahb_read32(addr))}")
+                print(f"{name:10s} {fmt_u32(bus.ar(addr))}")
             except OSError as e:
                 print(f"{name:10s} read_failed errno={e.errno}")
 
@@ -155,7 +78,7 @@ def main() -> int:
         print("\n[cmd 0x30 length sweep]")
         for n in lengths:
             try:
-                payload = bus.hr(0x30, n)
+                payload = bus.hr(REG_EVENT, n)
                 summarize_payload(f"cmd30 n={n}", payload)
             except OSError as e:
                 print(f"cmd30 n={n}: failed errno={e.errno}")
@@ -174,7 +97,7 @@ def main() -> int:
         n = max(lengths)
         for i in range(args.repeat):
             try:
-                payload = bus.hr(0x30, n)
+                payload = bus.hr(REG_EVENT, n)
             except OSError as e:
                 print(f"iter={i}: failed errno={e.errno}")
                 break
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Apply a batch of edits to an ath11k board-2.bin in one pass.
+
+Operations (any number, applied together):
+  --clone SRC DST     add a DST entry carrying SRC's calibration data
+  --rename OLD NEW    rename an entry in place
+  --remove KEY        drop an entry
+  --replace KEY FILE  replace an entry's calibration data with FILE
+  --ops ops.json      [{"op": "clone", "from": SRC, "to": DST},
+                       {"op": "rename", "from": OLD, "to": NEW},
+                       {"op": "remove", "key": KEY},
+                       {"op": "replace", "key": KEY, "file": FILE}, ...]
+
+Operations apply in the order given, each to the result of the ones
+before it: a clone after a replace copies the new data, and after a
+rename the entry is known only by its new name.
+
+Keys not starting with "bus=" get the WCN6855 prefix from patch_board.py,
+so "qmi-chip-id=18,qmi-board-id=255,variant=HW_GK3" is enough. A clone
+whose destination already exists is skipped, so re-running is harmless.
+
+The input is indexed once (patch_board.index_board). Untouched byte
+ranges, and the data of renamed or cloned entries, are copied kernel-side
+with os.copy_file_range (sendfile, then pread/write as fallbacks); only
+new headers and names go through Python. The output is written to a
+temp file next to it, fsynced and renamed into place, so input and
+output may be the same file.
+
+Usage: python3 board_edit.py <board-2.bin> <output.bin> [operations] [--dry-run]
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+
+from patch_board import PREFIX, align4, index_board, make_ie
+
+
+def full_key(key):
+    return key if key.startswith('bus=') else PREFIX + key
+
+
+def parse_ops(args):
+    ops = []
+    if args.ops:
+        with open(args.ops) as f:
+            for op in json.load(f):
+                kind = op['op']
+                if kind in ('clone', 'rename'):
+                    ops.append((kind, op['from'], op['to']))
+                elif kind == 'remove':
+                    ops.append((kind, op['key'], None))
+                elif kind == 'replace':
+                    ops.append((kind, op['key'], op['file']))
+                else:
+                    raise ValueError(f"unknown op: {kind}")
+    ops += [('clone', s, d) for s, d in args.clone]
+    ops += [('rename', s, d) for s, d in args.rename]
+    ops += [('remove', k, None) for k in args.remove]
+    ops += [('replace', k, f) for k, f in args.replace]
+    return [(kind, full_key(a), b if kind == 'replace' or b is None else full_key(b))
+            for kind, a, b in ops]
+
+
+def plan(entries, boards, ops):
+    """Validate ops against the index, each against the batch's state so far.
+
+    An op sees the earlier ops' results: a clone after a replace copies
+    the new data, a renamed entry is found under its new name (and no
+    longer under the old one), and a clone can itself be edited.
+
+    Returns (edits, clones, log): edits maps an entry's start offset to
+    None (drop) or (name, blob) where blob is (offset, len) in the input
+    or bytes; clones is a list of (name, blob) to append.
+    """
+    starts = {entry.start: entry for entry in boards.values()}
+    # current name -> slot: an input entry's start offset, or ('clone', i)
+    live = {name: entry.start for name, entry in boards.items()}
+    # slot -> (name, blob), or None once removed; input entries only once edited
+    slots = {}
+    gone = {}  # names removed or renamed away, for the error message
+    nclones = 0
+    log = []
+
+    def lookup(key):
+        slot = live.get(key.encode('ascii'))
+        if slot is None:
+            why = gone.get(key.encode('ascii'))
+            raise ValueError(f"entry already {why}: {key}" if why else f"entry not found: {key}")
+        return slot
+
+    def state(slot):
+        if slot in slots:
+            return slots[slot]
+        entry = starts[slot]
+        return entry.name, (entry.blob_offset, entry.blob_len)
+
+    for kind, key, arg in ops:
+        slot = lookup(key)
+        name, blob = state(slot)
+        if kind == 'clone':
+            dst = arg.encode('ascii')
+            if dst in live:
+                log.append(f"skip clone, already exists: {arg}")
+                continue
+            new = ('clone', nclones)
+            nclones += 1
+            slots[new] = (dst, blob)
+            live[dst] = new
+            gone.pop(dst, None)
+            size = len(blob) if isinstance(blob, bytes) else blob[1]
+            log.append(f"clone {key} -> {arg} ({size} bytes)")
+        elif kind == 'remove':
+            slots[slot] = None
+            del live[name]
+            gone[name] = 'removed'
+            log.append(f"remove {key}")
+        elif kind == 'rename':
+            dst = arg.encode('ascii')
+            if dst in live:
+                raise ValueError(f"rename target already exists: {arg}")
+            slots[slot] = (dst, blob)
+            del live[name]
+            live[dst] = slot
+            gone.pop(dst, None)
+            gone[name] = f"renamed to {arg}"
+            log.append(f"rename {key} -> {arg}")
+        else:
+            with open(arg, 'rb') as f:
+                data = f.read()
+            slots[slot] = (name, data)
+            log.append(f"replace {key} with {arg} ({len(data)} bytes)")
+
+    edits = {slot: v for slot, v in slots.items() if not isinstance(slot, tuple)}
+    clones = [slots[('clone', i)] for i in range(nclones) if slots[('clone', i)] is not None]
+    return edits, clones, log
+
+
+class Writer:
+    """Append to out_fd, copying input ranges without Python buffers where possible."""
+
+    def __init__(self, in_fd, out_fd):
+        self.in_fd = in_fd
+        self.out_fd = out_fd
+        self.copied = 0
+        self.written = 0
+        self.method = 'copy_file_range' if hasattr(os, 'copy_file_range') else 'sendfile'
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            n = os.write(self.out_fd, view)
+            view = view[n:]
+        self.written += len(data)
+
+    def copy(self, offset, length):
+        end = offset + length
+        while offset < end:
+            n = self._copy(offset, end - offset)
+            if n == 0:
+                raise OSError(f"short copy at input offset {offset}")
+            offset += n
+            self.copied += n
+
+    def _copy(self, offset, length):
+        if self.method == 'copy_file_range':
+            try:
+                return os.copy_file_range(self.in_fd, self.out_fd, length, offset)
+            except OSError:
+                self.method = 'sendfile'  # EXDEV/ENOSYS/EINVAL on some filesystems
+        if self.method == 'sendfile':
+            try:
+                return os.sendfile(self.out_fd, self.in_fd, offset, length)
+            except OSError:
+                self.method = 'pread'
+        data = os.pread(self.in_fd, min(length, 1 << 20), offset)
+        os.write(self.out_fd, data)
+        return len(data)
+
+
+def emit_entry(w, name, blob):
+    """Write one BOARD IE: name IE plus data IE, the data copied from the input if given as a range."""
+    blob_len = len(blob) if isinstance(blob, bytes) else blob[1]
+    name_ie = make_ie(0, name)
+    data_len = 8 + align4(blob_len)
+    w.write(struct.pack('<II', 0, len(name_ie) + data_len) + name_ie + struct.pack('<II', 1, blob_len))
+    if isinstance(blob, bytes):
+        w.write(blob)
+    else:
+        w.copy(*blob)
+    w.write(bytes(align4(blob_len) - blob_len))
+
+
+def edit(src_path, dst_path, ops, dry_run=False):
+    with open(src_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            entries, boards = index_board(data)
+            size = len(data)
+        edits, clones, log = plan(entries, boards, ops)
+        for line in log:
+            print(line)
+        if dry_run or not (edits or clones):
+            if not dry_run:
+                print("Nothing to do.")
+            return None
+
+        tmp = f"{dst_path}.tmp.{os.getpid()}"
+        out_fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            w = Writer(f.fileno(), out_fd)
+            pos = 0  # start of the pending unchanged input range
+            for entry in entries:
+                if entry.start not in edits:
+                    continue
+                w.copy(pos, entry.start - pos)
+                pos = entry.end
+                if edits[entry.start] is not None:
+                    emit_entry(w, *edits[entry.start])
+            w.copy(pos, size - pos)
+            for name, blob in clones:
+                emit_entry(w, name, blob)
+            os.fsync(out_fd)
+        except BaseException:
+            os.close(out_fd)
+            os.unlink(tmp)
+            raise
+        os.close(out_fd)
+    os.chmod(tmp, os.stat(src_path).st_mode & 0o7777)
+    os.replace(tmp, dst_path)
+    return w
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('input')
+    ap.add_argument('output')
+    ap.add_argument('--clone', nargs=2, action='append', default=[], metavar=('SRC', 'DST'))
+    ap.add_argument('--rename', nargs=2, action='append', default=[], metavar=('OLD', 'NEW'))
+    ap.add_argument('--remove', action='append', default=[], metavar='KEY')
+    ap.add_argument('--replace', nargs=2, action='append', default=[], metavar=('KEY', 'FILE'))
+    ap.add_argument('--ops', help='JSON list of operations')
+    ap.add_argument('--dry-run', action='store_true', help='validate and print the plan only')
+    args = ap.parse_args()
+
+    try:
+        ops = parse_ops(args)
+        if not ops:
+            ap.error('no operations given')
+        w = edit(args.input, args.output, ops, args.dry_run)
+    except (ValueError, KeyError, OSError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if w is not None:
+        print(f"Done. Written to {args.output} ({w.copied} bytes copied via {w.method}, {w.written} bytes new)")
@@ -6,9 +6,11 @@ by cloning the existing qmi-chip-id=2,variant=HW_GK3 calibration data.
 
 Usage: python3 patch_board.py <board-2.bin> <output.bin>
 """
+import mmap
 import struct
 import sys
 import shutil
+from collections import namedtuple
 
 MAGIC = b"QCA-ATH11K-BOARD"
 PREFIX = "bus=pci,vendor=17cb,device=1103,subsystem-vendor=17cb,subsystem-device=0108,"
@@ -24,44 +26,54 @@ def make_ie(ie_id, data):
     pad = bytes(align4(len(data)) - len(data))
     return hdr + data + pad
 
-def parse_board(data):
-    """Return list of (outer_ie_id, [(inner_id, inner_data), ...], raw_outer_data)"""
+# One outer IE. start/end span the IE in the file (header and padding
+# included); blob_offset/blob_len locate the BOARD data IE payload, or are
+# None if the entry has none. Offsets index the buffer given to index_board.
+BoardEntry = namedtuple('BoardEntry', 'ie_id name start end blob_offset blob_len')
+
+_IE_HDR = struct.Struct('<II')
+
+def index_board(data):
+    """Walk board-2.bin once and return (entries, boards) without copying payloads.
+
+    entries lists every outer IE in file order; boards maps each BOARD
+    entry's name (bytes) to its first BoardEntry that carries data.
+    """
+    mv = memoryview(data)
     magic_len = align4(len(MAGIC) + 1)
-    assert data[:len(MAGIC)] == MAGIC
+    assert bytes(mv[:len(MAGIC)]) == MAGIC
     pos = magic_len
     entries = []
-    while pos + 8 <= len(data):
-        ie_id, ie_len = struct.unpack_from('<II', data, pos)
+    boards = {}
+    while pos + 8 <= len(mv):
+        start = pos
+        ie_id, ie_len = _IE_HDR.unpack_from(mv, pos)
         pos += 8
-        ie_data = data[pos:pos + ie_len]
-        pos += align4(ie_len)
-        # Parse inner IEs
-        inner = []
-        ipos = 0
-        while ipos + 8 <= len(ie_data):
-            iid, ilen = struct.unpack_from('<II', ie_data, ipos)
+        ie_end = min(pos + ie_len, len(mv))
+        # Inner IEs: only the name is copied, the data IE is recorded by offset
+        name = blob_offset = blob_len = None
+        ipos = pos
+        while ipos + 8 <= ie_end:
+            iid, ilen = _IE_HDR.unpack_from(mv, ipos)
             ipos += 8
-            idata = ie_data[ipos:ipos + ilen]
-            ipos += align4(ilen)
-            inner.append((iid, idata))
-        entries.append((ie_id, inner))
-    return entries
-
-def find_board_blob(entries, key):
-    key_bytes = key.encode('ascii')
-    for ie_id, inner in entries:
-        if ie_id != 0:
-            continue
-        name = None
-        blob = None
-        for iid, idata in inner:
             if iid == 0:
-                name = idata
+                name = bytes(mv[ipos:min(ipos + ilen, ie_end)])
             elif iid == 1:
-                blob = idata
-        if name == key_bytes and blob is not None:
-            return blob
-    return None
+                blob_offset, blob_len = ipos, min(ilen, ie_end - ipos)
+            ipos += align4(ilen)
+        pos += align4(ie_len)
+        entry = BoardEntry(ie_id, name, start, min(pos, len(mv)), blob_offset, blob_len)
+        entries.append(entry)
+        if ie_id == 0 and name is not None and blob_offset is not None:
+            boards.setdefault(name, entry)
+    return entries, boards
+
+def find_board_blob(data, boards, key):
+    """Return a memoryview of the calibration blob for key, or None."""
+    entry = boards.get(key.encode('ascii'))
+    if entry is None:
+        return None
+    return memoryview(data)[entry.blob_offset:entry.blob_offset + entry.blob_len]
 
 def build_board_entry(name_str, blob):
     """Build outer BOARD IE from name string and calibration blob."""
@@ -78,25 +90,24 @@ if __name__ == '__main__':
     src_path, dst_path = sys.argv[1], sys.argv[2]
     shutil.copy2(src_path, dst_path)
 
-    with open(src_path, 'rb') as f:
-        data = f.read()
+    with open(src_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        entries, boards = index_board(data)
+        blob = find_board_blob(data, boards, SRC_KEY)
+        if blob is None:
+            print(f"ERROR: source entry not found: {SRC_KEY}")
+            sys.exit(1)
 
-    entries = parse_board(data)
-    blob = find_board_blob(entries, SRC_KEY)
-    if blob is None:
-        print(f"ERROR: source entry not found: {SRC_KEY}")
-        sys.exit(1)
+        print(f"Found source entry: {SRC_KEY}")
+        print(f"  Blob size: {len(blob)} bytes")
 
-    print(f"Found source entry: {SRC_KEY}")
-    print(f"  Blob size: {len(blob)} bytes")
+        # Check if destination entry already exists
+        exists = NEW_KEY.encode('ascii') in boards
+        new_ie = None if exists else build_board_entry(NEW_KEY, blob)
+        blob.release()  # the mmap cannot close while a view is exported
 
-    # Check if destination entry already exists
-    existing = find_board_blob(entries, NEW_KEY)
-    if existing is not None:
+    if exists:
         print(f"Destination entry already exists: {NEW_KEY}")
         sys.exit(0)
-
-    new_ie = build_board_entry(NEW_KEY, blob)
     print(f"Adding new entry: {NEW_KEY}")
 
     with open(dst_path, 'ab') as f: